@@ -49,9 +49,10 @@ class CustomMultitrack(object):
 
         Parameters
         ----------
-        filename : str
+        filename : str or file object
             The file path to the npz file to be loaded or the MIDI file (.mid,
-            .midi, .MID, .MIDI) to be parsed.
+            .midi, .MID, .MIDI) to be parsed, or a binary file object to
+            parse a MIDI file from.
         beat_resolution : int
             The number of time steps used to represent a beat. Will be assigned
             to `beat_resolution` when `filename` is not provided. Defaults to
@@ -76,7 +77,7 @@ class CustomMultitrack(object):
         """
         # parse input file
         if filename is not None:
-            if filename.endswith(('.mid', '.midi', '.MID', '.MIDI')):
+            if not isinstance(filename, string_types) or filename.endswith(('.mid', '.midi', '.MID', '.MIDI')):
                 self.beat_resolution = beat_resolution
                 self.name = name
                 self.parse_midi(filename)
@@ -0,0 +1,156 @@
+import struct
+
+import numpy as np
+
+# Pianorolls are written with a tempo of 120 and a beat resolution of 24, so one time step is one tick of a midi file
+# with 24 ticks per quarter note and 500000 microseconds per quarter note.
+TICKS_PER_QUARTER_NOTE = 24
+MICROSECONDS_PER_QUARTER_NOTE = 500000
+TIME_STEPS_PER_SECOND = 48
+
+
+class MidiEventEncoder(object):
+    """
+    Incrementally converts chunks of key states, as produced by streaming generation, into midi note on and note off
+    events. Only the key state of the last encoded time step is kept between chunks, so memory stays bounded however
+    long the performance is.
+
+    Each event is a dictionary such as:
+
+        {'time_step': 96, 'type': 'note_on', 'pitch': 60, 'velocity': 100}
+
+    where time_step counts time steps (1/48th of a second) from the first encoded chunk. Events can also be encoded to
+    standard midi file track data with encode_track_data, and wrapped into a complete midi file with
+    get_midi_file_bytes.
+    """
+
+    def __init__(self, min_key_index=0, num_keys=128, velocity=100, channel=0, initial_key_states=None):
+        """
+        min_key_index: Midi pitch of the first key in the key state arrays
+        num_keys: Number of keys in each key state array
+        velocity: Velocity of every note on event
+        channel: Midi channel (0 to 15) of every event
+        initial_key_states: Optional boolean array of shape (num_keys,) with the keys already held before the first
+                            chunk. If None, all keys start released.
+        """
+
+        self.min_key_index = min_key_index
+        self.num_keys = num_keys
+        self.velocity = velocity
+        self.channel = channel
+
+        if initial_key_states is None:
+            self.key_states = np.zeros((num_keys,), dtype='bool')
+        else:
+            self.key_states = np.array(initial_key_states, dtype='bool')
+
+        self.time_step = 0
+        self.last_encoded_time_step = 0
+
+    def encode(self, key_states_chunk):
+        """
+        Returns the list of events for a chunk of key states of shape (chunk_time_steps, num_keys), in time order.
+        At each time step, note off events come before note on events.
+        """
+
+        key_states_chunk = np.asarray(key_states_chunk, dtype='bool').reshape(-1, self.num_keys)
+
+        if key_states_chunk.shape[0] == 0:
+            return []
+
+        previous_key_states = np.concatenate([self.key_states.reshape(1, -1), key_states_chunk[:-1]])
+
+        note_on_time_steps, note_on_keys = np.nonzero(key_states_chunk & ~previous_key_states)
+        note_off_time_steps, note_off_keys = np.nonzero(~key_states_chunk & previous_key_states)
+
+        events = []
+
+        for time_steps, keys, event_type in [(note_off_time_steps, note_off_keys, 'note_off'),
+                                             (note_on_time_steps, note_on_keys, 'note_on')]:
+            for time_step, key in zip(time_steps.tolist(), keys.tolist()):
+                events.append({
+                    'time_step': self.time_step + time_step,
+                    'type': event_type,
+                    'pitch': self.min_key_index + key,
+                    'velocity': self.velocity if event_type == 'note_on' else 0,
+                })
+
+        # Python's sort is stable, so note offs stay ahead of note ons at the same time step
+        events.sort(key=lambda event: event['time_step'])
+
+        self.key_states = key_states_chunk[-1].copy()
+        self.time_step += key_states_chunk.shape[0]
+
+        return events
+
+    def finish(self):
+        """
+        Returns note off events, at the end of the last encoded time step, for every key still held.
+        """
+
+        events = [{
+            'time_step': self.time_step,
+            'type': 'note_off',
+            'pitch': self.min_key_index + key,
+            'velocity': 0,
+        } for key in np.nonzero(self.key_states)[0].tolist()]
+
+        self.key_states = np.zeros((self.num_keys,), dtype='bool')
+
+        return events
+
+    def encode_track_data(self, events):
+        """
+        Returns the standard midi file track bytes for events, with each delta time measured from the previously
+        encoded event. Concatenating the track data of successive calls gives the track of the whole performance.
+        """
+
+        track_data = bytearray()
+
+        for event in events:
+            track_data += get_variable_length_quantity_bytes(event['time_step'] - self.last_encoded_time_step)
+
+            status = 0x90 if event['type'] == 'note_on' else 0x80
+            track_data += bytes([status | self.channel, event['pitch'], event['velocity']])
+
+            self.last_encoded_time_step = event['time_step']
+
+        return bytes(track_data)
+
+    def get_track_header_data(self):
+        """
+        Returns the track bytes that must precede the encoded events: the tempo and the piano program change.
+        """
+
+        tempo_bytes = struct.pack('>I', MICROSECONDS_PER_QUARTER_NOTE)[1:]
+
+        return bytes([0x00, 0xFF, 0x51, 0x03]) + tempo_bytes + bytes([0x00, 0xC0 | self.channel, 0x00])
+
+
+def get_variable_length_quantity_bytes(value):
+    """
+    Returns the midi variable length quantity encoding of the non-negative integer value.
+    """
+
+    quantity_bytes = [value & 0x7F]
+    value >>= 7
+
+    while value > 0:
+        quantity_bytes.append((value & 0x7F) | 0x80)
+        value >>= 7
+
+    return bytes(reversed(quantity_bytes))
+
+
+def get_midi_file_bytes(track_data):
+    """
+    Returns the bytes of a complete single track (format 0) midi file from track_data, which should start with the
+    encoder's track header data followed by its encoded events. The end of track event is appended here.
+    """
+
+    track_data = track_data + bytes([0x00, 0xFF, 0x2F, 0x00])
+
+    header_chunk = b'MThd' + struct.pack('>IHHH', 6, 0, 1, TICKS_PER_QUARTER_NOTE)
+    track_chunk = b'MTrk' + struct.pack('>I', len(track_data)) + track_data
+
+    return header_chunk + track_chunk
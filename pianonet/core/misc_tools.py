@@ -5,11 +5,23 @@ import os
 import numpy as np
 
 
-def get_noisily_spaced_floats(start, end, num_points):
+def get_random_generator(random_seed=None):
+    """
+    Returns a numpy.random.Generator for random_seed, which may be an integer seed, None (seeded from system entropy) or
+    a Generator, which is returned as is so that the caller's stream is advanced. Everything random in pianonet draws
+    from a Generator obtained this way rather than from the global random or numpy.random state, so results only
+    depend on the seeds passed in.
+    """
+
+    return np.random.default_rng(random_seed)
+
+
+def get_noisily_spaced_floats(start, end, num_points, random_generator=None):
     """
     start: starting float of range
     end: ending float of range
     num_points: number of floats to output
+    random_generator: Optional integer seed or numpy.random.Generator used for the noise
 
     Returns evenly spaced floats from start to end inclusive with random noise added to each point.
     Example: get_noisily_spaced_floats(start=0.8, end=1.2, num_points=3) could give
@@ -18,7 +30,7 @@ def get_noisily_spaced_floats(start, end, num_points):
 
     evenly_spaced_points = np.linspace(start=start, stop=end, num=(num_points + 1), endpoint=True)[:-1]
 
-    noise_to_add_array = np.random.random(num_points) * ((end - start) / num_points)
+    noise_to_add_array = get_random_generator(random_generator).random(num_points) * ((end - start) / num_points)
 
     return evenly_spaced_points + noise_to_add_array
 
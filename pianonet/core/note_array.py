@@ -1,10 +1,9 @@
 import pickle
 import joblib
-import random
 
 import numpy as np
 
-from pianonet.core.misc_tools import get_hash_string_of_numpy_array
+from pianonet.core.misc_tools import get_hash_string_of_numpy_array, get_random_generator
 
 
 class NoteArray(object):
@@ -80,11 +79,12 @@ class NoteArray(object):
 
         self.get_pianoroll().play()
 
-    def get_note_array_from_random_segment_of_time_steps(self, num_time_steps):
+    def get_note_array_from_random_segment_of_time_steps(self, num_time_steps, random_generator=None):
         """
         Returns a NoteArray that has data that is a random segment num_time_steps in length.
 
         num_time_steps: Integer denoting how many time steps of data should be returned
+        random_generator: Optional integer seed or numpy.random.Generator used to pick the segment
         """
 
         if num_time_steps > self.get_length_in_timesteps():
@@ -95,7 +95,7 @@ class NoteArray(object):
 
         max_ending_time_step = self.get_length_in_timesteps() - num_time_steps
 
-        starting_time_step = random.randint(0, max_ending_time_step)
+        starting_time_step = int(get_random_generator(random_generator).integers(0, max_ending_time_step + 1))
         starting_note_index = starting_time_step * self.note_array_transformer.num_keys
         ending_note_index = starting_note_index + num_time_steps * self.note_array_transformer.num_keys
 
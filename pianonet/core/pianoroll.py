@@ -1,3 +1,5 @@
+import io
+
 import numpy as np
 from pypianoroll import Track, Multitrack
 
@@ -27,28 +29,34 @@ class Pianoroll(object):
 
     def __init__(self, initializer, use_custom_multitrack=False):
         """
-        initializer: A string that is a path to a midi file or an array of shape (time_steps, 128).
+        initializer: A string that is a path to a midi file, the bytes of a midi file or an array of shape
+                     (time_steps, 128).
         """
 
         if isinstance(initializer, str):
             midi_file_path = initializer
             self.load_from_midi_file(midi_file_path, use_custom_multitrack)
+        elif isinstance(initializer, (bytes, bytearray)):
+            self.load_from_midi_file(io.BytesIO(initializer), use_custom_multitrack)
         else:
             np_array = initializer
             self.array = np.copy(np_array)
 
     def load_from_midi_file(self, midi_file_path, use_custom_multitrack):
         """
-        midi_file_path: String that is path to a midi file to load. This midi file is assumed to have a beat resolution
-                        of 24.
+        midi_file_path: String that is path to a midi file to load, or a binary file object to read the midi file from.
+                        This midi file is assumed to have a beat resolution of 24.
 
         A merged and binarized numpy array (time_steps, 128) in shape is loaded into self.array.
         """
 
         if use_custom_multitrack:
             multitrack = CustomMultitrack(filename=midi_file_path)
-        else:
+        elif isinstance(midi_file_path, str):
             multitrack = Multitrack(filename=midi_file_path)
+        else:
+            multitrack = Multitrack()
+            multitrack.parse_midi(midi_file_path)
 
         multitrack.check_validity()
 
@@ -87,6 +95,16 @@ class Pianoroll(object):
 
         self.get_multitrack().write(filename=file_path)
 
+    def get_midi_file_bytes(self):
+        """
+        Returns the bytes of the midi file that save_to_midi_file would write, encoded in memory.
+        """
+
+        midi_file = io.BytesIO()
+        self.get_multitrack().to_pretty_midi().write(midi_file)
+
+        return midi_file.getvalue()
+
     def play(self):
         """
         Play the notes represented in self.array as a midi audio output.
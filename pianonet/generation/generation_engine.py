@@ -0,0 +1,705 @@
+import time
+
+import numpy as np
+
+from pianonet.core.misc_tools import get_random_generator
+from pianonet.generation.numpy_layers import get_layer_outputs
+
+RANDOM_DRAWS_BLOCK_SIZE_IN_TIME_STEPS = 48
+
+
+def get_input_windows(seed_flat_arrays, num_notes_in_model_input):
+    """
+    Returns an array of shape (len(seed_flat_arrays), num_notes_in_model_input) holding the last notes of each seed.
+    Seeds shorter than the model input are left padded with silence.
+    """
+
+    input_windows = np.zeros((len(seed_flat_arrays), num_notes_in_model_input), dtype='float32')
+
+    for i, seed_flat_array in enumerate(seed_flat_arrays):
+        tail = seed_flat_array[-num_notes_in_model_input:]
+        input_windows[i, num_notes_in_model_input - len(tail):] = tail
+
+    return input_windows
+
+
+def get_edge_aversion_probability_floors(num_keys, probability_thresholds):
+    """
+    Returns an array of shape (num_keys,) holding, for each key, the probability below which the key is never played.
+    Keys within len(probability_thresholds) of either edge get the threshold for their distance from the edge, all
+    other keys get zero.
+
+    num_keys: Number of keys in each time step
+    probability_thresholds: List of thresholds, indexed by distance in keys from the nearest edge
+    """
+
+    probability_floors = np.zeros((num_keys,))
+
+    for key in range(0, num_keys):
+        distance_in_keys_from_edge = min(key, (num_keys - 1) - key)
+
+        if distance_in_keys_from_edge < len(probability_thresholds):
+            probability_floors[key] = probability_thresholds[distance_in_keys_from_edge]
+
+    return probability_floors
+
+
+class GenerationEngine(object):
+    """
+    Queue-based NumPy generation engine that advances a batch of B independent performances one note at a time.
+
+    Generating a note only requires the newest output of each layer, so rather than re-running the full convolution
+    over the receptive field, each conv layer with kernel size k and dilation rate d keeps the last (k - 1) * d outputs
+    of the layer feeding it, held as (channels x B) blocks. Each of the layer's k - 1 past taps is read from this state,
+    and each tap is one matrix-matrix product over the batch. The first conv layer's state holds the raw input notes.
+    Layer normalization and activation layers following a conv layer are applied to its output block in place.
+
+    Each layer's state is a preallocated circular buffer of shape ((k - 1) * d, channels, B) with an integer head
+    pointing at the oldest entry. Layer outputs and scratch space are preallocated as well, so computing a note
+    allocates no new arrays.
+
+    Taps of reduced precision (float16 or int8) models are read in their own precision and converted, one tap at a
+    time, into a small float32 weight scratch array that the matrix product then reads from cache. Only the reduced
+    precision weights are streamed from memory. The products of int8 taps are scaled per filter once per layer. NumPy
+    converts int8 to float32 several times faster than float16, so int8 models generate about as fast as float32 ones
+    while float16 models save memory at the cost of speed.
+
+    The state buffers are filled by one NumPy forward pass over the non-silent end of each seed (the warm-up).
+    TensorFlow is never imported.
+    """
+
+    def __init__(self,
+                 prepared_model,
+                 seed_flat_arrays=None,
+                 random_seeds=None,
+                 use_edge_aversion=False,
+                 aversion_params_dict=None,
+                 state=None):
+        """
+        prepared_model: PreparedModel instance holding the model's bundle and fast path weights. It is only read, so
+                        one instance may be shared by many engines.
+        seed_flat_arrays: List of 1D arrays of seed note states, one per performance, each key aligned
+        random_seeds: Optional list of seeds, one per performance, for the independent numpy.random.Generator streams
+                      used in sampling. Each entry is an integer seed, a Generator (used directly, so it is advanced by
+                      sampling) or None to seed from system entropy. If None, every stream is seeded from system
+                      entropy. A performance only depends on its own seed, never on the rest of the batch.
+        use_edge_aversion: Boolean controlling whether or not to keep notes biased toward the middle of the output
+                           space.
+        aversion_params_dict: Params to control how strong edge aversion is
+        state: Optional state dictionary from get_state. If given, the engine resumes from it without a warm-up, and
+               all other arguments except prepared_model are ignored.
+        """
+
+        self.prepared_model = prepared_model
+        self.num_keys = prepared_model.num_keys
+
+        # Shallow copies, so that this engine's buffers are added without modifying the shared prepared model
+        self.layers = [dict(layer) for layer in prepared_model.fast_path_layers]
+
+        if state != None:
+            self.set_state(state)
+            return
+
+        self.batch_size = len(seed_flat_arrays)
+
+        if random_seeds == None:
+            random_seeds = [None] * self.batch_size
+        elif len(random_seeds) != self.batch_size:
+            raise Exception("random_seeds must have one entry per seed.")
+
+        self.random_generators = [get_random_generator(random_seed) for random_seed in random_seeds]
+
+        if use_edge_aversion:
+            self.probability_floors = get_edge_aversion_probability_floors(
+                num_keys=self.num_keys,
+                probability_thresholds=aversion_params_dict['probability_thresholds'])
+        else:
+            self.probability_floors = None
+
+        input_windows = get_input_windows(seed_flat_arrays, prepared_model.num_notes_in_model_input)
+
+        self.initialize_state_buffers(input_windows)
+
+    def initialize_state_buffers(self, input_windows):
+        """
+        Runs the warm-up forward pass over input_windows and fills each layer's state buffer with the (k - 1) * d
+        outputs of its input layer preceding the last position. The last input notes become the current inputs.
+
+        Everything before the first played note of the windows is silence, over which every layer takes its constant
+        silence state from the prepared model. So the warm-up pass only runs over the windows from their earliest
+        played note on, with each conv layer's earlier inputs filled in from the silence states. Warm-up cost then
+        scales with the non-silent length of the seeds rather than with the model input size.
+        """
+
+        played_note_indices = np.nonzero(np.any(input_windows, axis=0))[0]
+        first_played_note_index = played_note_indices[0] if len(played_note_indices) > 0 else input_windows.shape[1]
+        first_played_note_index = min(first_played_note_index, input_windows.shape[1] - 1)
+
+        silence_states = self.prepared_model.silence_states
+        layer_outputs = get_layer_outputs(model_bundle=self.prepared_model.model_bundle,
+                                          input_windows=input_windows[:, first_played_note_index:],
+                                          silence_states=silence_states)
+
+        for layer in self.layers:
+            state_length = layer['state_length']
+
+            if state_length > 0:
+                bundle_layer_index = layer['bundle_layer_index']
+                layer_input = layer_outputs[bundle_layer_index]
+
+                if layer_input.shape[1] < state_length + 1:
+                    silence_padding = np.broadcast_to(silence_states[bundle_layer_index],
+                                                      (layer_input.shape[0], state_length + 1 - layer_input.shape[1],
+                                                       layer_input.shape[2]))
+                    layer_input = np.concatenate([silence_padding, layer_input], axis=1)
+
+                # (batch, state_length, channels) -> (state_length, channels, batch), oldest state first
+                states = layer_input[:, -state_length - 1:-1, :]
+                layer['state_buffer'] = np.ascontiguousarray(np.transpose(states, (1, 2, 0)), dtype='float32')
+                layer['head'] = 0
+            else:
+                layer['state_buffer'] = None
+
+        self.current_inputs = np.array(input_windows[:, -1:].T, dtype='float32')
+
+        self.allocate_work_arrays()
+
+    def allocate_work_arrays(self):
+        """
+        Preallocates the per-layer output, product and activation scratch arrays, the sampled notes and the block of
+        random draws for the current batch size. The random draws are refilled on their next use.
+        """
+
+        self.notes = np.zeros((self.batch_size,), dtype='bool')
+        self.above_floor = np.zeros((self.batch_size,), dtype='bool')
+
+        self.random_draws = np.zeros((self.batch_size, RANDOM_DRAWS_BLOCK_SIZE_IN_TIME_STEPS * self.num_keys))
+        self.random_draws_index = self.random_draws.shape[1]
+
+        for layer in self.layers:
+            num_filters = layer['w_right'].shape[0]
+
+            layer['output'] = np.zeros((num_filters, self.batch_size), dtype='float32')
+            layer['product'] = np.zeros((num_filters, self.batch_size), dtype='float32')
+            layer['scratch'] = np.zeros((num_filters, self.batch_size), dtype='float32')
+            layer['row_scratch'] = np.zeros((2, self.batch_size), dtype='float32')
+
+            # Laid out like the taps, which are transposed views of the kernel, so that converting a tap into it reads
+            # the tap in memory order
+            if layer['w_right'].dtype != 'float32':
+                layer['weight_scratch'] = np.zeros(layer['w_right'].shape[::-1], dtype='float32').T
+            else:
+                layer['weight_scratch'] = None
+
+        self.pattern_sums = np.zeros((self.batch_size,), dtype='float32')
+        self.pattern_indices = np.zeros((self.batch_size,), dtype='intp')
+
+    def get_first_layer_output_from_table(self):
+        """
+        Returns the (filters x B) output of the first layer by looking up each performance's binary input pattern in
+        the first layer's precomputed output table, in place of its matrix products, bias and operations. Advances the
+        first layer's state buffer like the general path does.
+        """
+
+        layer = self.layers[0]
+        pattern_sums = self.pattern_sums
+        current_inputs = self.current_inputs[0]
+
+        np.multiply(current_inputs, 2 ** (layer['kernel_size'] - 1), out=pattern_sums)
+
+        state_buffer = layer['state_buffer']
+
+        if state_buffer is not None:
+            head = layer['head']
+            state_length = layer['state_length']
+            dilation_rate = layer['dilation_rate']
+            tap_inputs = layer['row_scratch'][0]
+
+            for tap_index in range(layer['kernel_size'] - 1):
+                np.multiply(state_buffer[(head + tap_index * dilation_rate) % state_length, 0], 2 ** tap_index,
+                            out=tap_inputs)
+                pattern_sums += tap_inputs
+
+            state_buffer[head] = self.current_inputs
+            layer['head'] = (head + 1) % state_length
+
+        self.pattern_indices[:] = pattern_sums
+        np.take(layer['binary_input_output_table'], self.pattern_indices, axis=1, out=layer['output'])
+
+        return layer['output']
+
+    def add_layer_products(self, layer, right_input):
+        """
+        Sets the layer's output to the products of its kernel with right_input, its input at the newest position, and
+        with its older inputs held in its state buffer. Reduced precision taps are converted to float32 in the layer's
+        weight scratch array first.
+        """
+
+        output = layer['output']
+        weight_scratch = layer['weight_scratch']
+        w_right = layer['w_right']
+
+        if weight_scratch is not None:
+            weight_scratch[...] = w_right
+            w_right = weight_scratch
+
+        np.dot(w_right, right_input, out=output)
+
+        state_buffer = layer['state_buffer']
+
+        if state_buffer is not None:
+            head = layer['head']
+            state_length = layer['state_length']
+            dilation_rate = layer['dilation_rate']
+            product = layer['product']
+
+            for tap_index, w_tap in enumerate(layer['w_taps']):
+                if weight_scratch is not None:
+                    weight_scratch[...] = w_tap
+                    w_tap = weight_scratch
+
+                np.dot(w_tap, state_buffer[(head + tap_index * dilation_rate) % state_length], out=product)
+                output += product
+
+        if layer['w_scale'] is not None:
+            output *= layer['w_scale']
+
+    def push_layer_input(self, layer, right_input):
+        """
+        Stores right_input in the layer's state buffer in place of its oldest input.
+        """
+
+        state_buffer = layer['state_buffer']
+
+        if state_buffer is not None:
+            head = layer['head']
+            state_buffer[head] = right_input
+            layer['head'] = (head + 1) % layer['state_length']
+
+    def add_layer_bias(self, layer):
+        layer['output'] += layer['b']
+
+    def apply_layer_operations(self, layer):
+        """
+        Applies the layer's activations and folded layers, in place on its output.
+        """
+
+        output = layer['output']
+
+        for operation in layer['operations']:
+            operation(output, layer['scratch'], layer['row_scratch'])
+
+    def get_next_probabilities(self):
+        """
+        Returns an array of shape (B,) with the probability that the next note is played for each performance. This
+        advances every state buffer by one position, so it must be followed by a call to add_notes. The returned array
+        is reused by the next call.
+
+        Each layer is computed in the stages add_layer_products, push_layer_input, add_layer_bias and
+        apply_layer_operations, which subclasses such as the profiler's engine may override.
+        """
+
+        if self.layers[0].get('binary_input_output_table') is not None:
+            right_input = self.get_first_layer_output_from_table()
+            layers = self.layers[1:]
+        else:
+            right_input = self.current_inputs
+            layers = self.layers
+
+        # Bound once per note rather than looked up per layer
+        add_layer_products = self.add_layer_products
+        push_layer_input = self.push_layer_input
+        add_layer_bias = self.add_layer_bias
+        apply_layer_operations = self.apply_layer_operations
+
+        for layer in layers:
+            add_layer_products(layer, right_input)
+            push_layer_input(layer, right_input)
+            add_layer_bias(layer)
+            apply_layer_operations(layer)
+
+            right_input = layer['output']
+
+        return right_input[0]
+
+    def add_notes(self, notes):
+        """
+        notes: Array of shape (B,) of the sampled note states to feed back as the next model inputs.
+        """
+
+        self.current_inputs[0, :] = notes
+
+    def refill_random_draws(self):
+        """
+        Draws the next block of uniform random numbers from each performance's generator. Each performance always
+        consumes one draw per note, so its sequence of draws does not depend on the other performances in the batch.
+        """
+
+        for random_generator, random_draws_row in zip(self.random_generators, self.random_draws):
+            random_generator.random(out=random_draws_row)
+
+        self.random_draws_index = 0
+
+    def sample_notes(self, probabilities, key):
+        """
+        Returns a boolean array of shape (B,) sampled from probabilities, applying edge aversion for key if enabled.
+        The returned array is reused by the next call.
+        """
+
+        if self.random_draws_index == self.random_draws.shape[1]:
+            self.refill_random_draws()
+
+        np.greater(probabilities, self.random_draws[:, self.random_draws_index], out=self.notes)
+        self.random_draws_index += 1
+
+        if self.probability_floors is not None:
+            np.greater_equal(probabilities, self.probability_floors[key], out=self.above_floor)
+            self.notes &= self.above_floor
+
+        return self.notes
+
+    def generate_time_step(self, key_states=None):
+        """
+        Generates one full time step of key states for every performance, returned as a boolean array of shape
+        (B, num_keys).
+
+        key_states: Optional preallocated boolean array of shape (B, num_keys) to write the key states into
+        """
+
+        if key_states is None:
+            key_states = np.zeros((self.batch_size, self.num_keys), dtype='bool')
+
+        for key in range(0, self.num_keys):
+            notes = self.sample_notes(self.get_next_probabilities(), key)
+            key_states[:, key] = notes
+            self.add_notes(notes)
+
+        return key_states
+
+    def get_time_step_chunks(self, num_time_steps, chunk_size_in_time_steps=1):
+        """
+        Generator yielding the next num_time_steps time steps of every performance as they are produced, in chunks of
+        up to chunk_size_in_time_steps time steps. Each chunk is a new boolean array of shape (B, chunk_time_steps,
+        num_keys), so only one chunk is held in memory at a time.
+
+        num_time_steps: How many time steps to generate in total
+        chunk_size_in_time_steps: Maximum number of time steps in each yielded chunk
+        """
+
+        num_time_steps_generated = 0
+
+        while num_time_steps_generated < num_time_steps:
+            chunk_time_steps = min(chunk_size_in_time_steps, num_time_steps - num_time_steps_generated)
+            chunk = np.zeros((self.batch_size, chunk_time_steps, self.num_keys), dtype='bool')
+
+            for time_step in range(0, chunk_time_steps):
+                self.generate_time_step(key_states=chunk[:, time_step, :])
+
+            num_time_steps_generated += chunk_time_steps
+
+            yield chunk
+
+    def keep_performances(self, keep_mask):
+        """
+        Drops the performances whose entry in the boolean array keep_mask is false from the batch.
+        """
+
+        keep_mask = np.asarray(keep_mask, dtype='bool')
+
+        for layer in self.layers:
+            if layer['state_buffer'] is not None:
+                layer['state_buffer'] = np.ascontiguousarray(layer['state_buffer'][:, :, keep_mask])
+
+        self.current_inputs = np.ascontiguousarray(self.current_inputs[:, keep_mask])
+        self.random_generators = [random_generator for random_generator, keep in
+                                  zip(self.random_generators, keep_mask) if keep]
+
+        random_draws = self.random_draws[keep_mask]
+        random_draws_index = self.random_draws_index
+
+        self.batch_size = int(np.sum(keep_mask))
+        self.allocate_work_arrays()
+
+        self.random_draws[...] = random_draws
+        self.random_draws_index = random_draws_index
+
+    def get_state(self):
+        """
+        Returns a dictionary holding copies of everything needed to resume generation exactly where this engine is:
+        the layer state buffers and their heads, the current inputs, the edge aversion floors and the state of every
+        random generator, including its block of unused draws. Pass it as the state argument of a new
+        GenerationEngine with the same prepared model to resume.
+        """
+
+        return {
+            'model_identifier': self.prepared_model.get_identifier_hash_string(),
+            'batch_size': self.batch_size,
+            'state_buffers': [None if layer['state_buffer'] is None else layer['state_buffer'].copy() for layer in
+                              self.layers],
+            'heads': [layer.get('head') for layer in self.layers],
+            'current_inputs': self.current_inputs.copy(),
+            'probability_floors': None if self.probability_floors is None else self.probability_floors.copy(),
+            'random_generator_states': [random_generator.bit_generator.state for random_generator in
+                                        self.random_generators],
+            'random_draws': self.random_draws.copy(),
+            'random_draws_index': self.random_draws_index,
+        }
+
+    def set_state(self, state):
+        """
+        Restores this engine to a state dictionary returned by get_state.
+        """
+
+        if state['model_identifier'] != self.prepared_model.get_identifier_hash_string():
+            raise Exception("The generation state was created with a different model.")
+
+        self.batch_size = state['batch_size']
+
+        for layer, state_buffer, head in zip(self.layers, state['state_buffers'], state['heads']):
+            layer['state_buffer'] = None if state_buffer is None else np.array(state_buffer, dtype='float32')
+            layer['head'] = head
+
+        self.current_inputs = np.array(state['current_inputs'], dtype='float32')
+        self.probability_floors = None if state['probability_floors'] is None else np.array(state['probability_floors'])
+
+        self.random_generators = []
+        for random_generator_state in state['random_generator_states']:
+            bit_generator = getattr(np.random, random_generator_state['bit_generator'])()
+            bit_generator.state = random_generator_state
+            self.random_generators.append(np.random.Generator(bit_generator))
+
+        self.allocate_work_arrays()
+
+        self.random_draws[...] = state['random_draws']
+        self.random_draws_index = state['random_draws_index']
+
+    def fork(self, performance_indices=None, random_seeds=None):
+        """
+        Returns a new engine that continues from this engine's current state without a new warm-up. This engine is
+        not modified.
+
+        performance_indices: Optional list of indices of this engine's performances to continue, one per performance
+                             of the new engine. Repeats are allowed, so a single performance can be forked into many
+                             branches of one batch. If None, all performances are continued.
+        random_seeds: Optional list of seeds, one per performance of the new engine, for new random generators. If
+                      None, the branches continue with copies of the current random generators and so produce the
+                      same notes as this engine would. Entries may be None to seed from system entropy.
+        """
+
+        if performance_indices is None:
+            performance_indices = list(range(self.batch_size))
+
+        state = get_forked_state(state=self.get_state(), performance_indices=performance_indices,
+                                 random_seeds=random_seeds)
+
+        return GenerationEngine(prepared_model=self.prepared_model, state=state)
+
+
+def get_forked_state(state, performance_indices, random_seeds=None):
+    """
+    Returns a new state dictionary with the performances of the state dictionary state at performance_indices, as
+    described in GenerationEngine.fork. state is not modified.
+    """
+
+    performance_indices = np.asarray(performance_indices, dtype='int')
+
+    state = dict(state)
+
+    state['batch_size'] = len(performance_indices)
+    state['state_buffers'] = [None if state_buffer is None else state_buffer[:, :, performance_indices] for
+                              state_buffer in state['state_buffers']]
+    state['current_inputs'] = state['current_inputs'][:, performance_indices]
+
+    if random_seeds is None:
+        state['random_generator_states'] = [state['random_generator_states'][i] for i in performance_indices]
+        state['random_draws'] = state['random_draws'][performance_indices]
+    else:
+        if len(random_seeds) != len(performance_indices):
+            raise Exception("random_seeds must have one entry per forked performance.")
+
+        state['random_generator_states'] = [get_random_generator(random_seed).bit_generator.state for random_seed in
+                                            random_seeds]
+        state['random_draws'] = np.zeros((len(performance_indices), state['random_draws'].shape[1]))
+        state['random_draws_index'] = state['random_draws'].shape[1]
+
+    return state
+
+
+def get_batch_state(performance_states, random_seeds=None, probability_floors=None):
+    """
+    Returns a state dictionary for one GenerationEngine advancing the performances of all of performance_states
+    together, in order. Each of performance_states is a state dictionary from GenerationEngine.get_state or
+    get_forked_state, all with the same model and the same heads, as is the case right after warm-up. Every performance
+    starts a new random generator, so the batch generates exactly what each performance would generate alone from its
+    state with a new generator of the same seed.
+
+    performance_states: List of state dictionaries
+    random_seeds: Optional list of seeds, one per performance of the batch, for the new random generators. Entries may
+                  be None to seed from system entropy.
+    probability_floors: Optional edge aversion floors from get_edge_aversion_probability_floors for the batch. If None,
+                        edge aversion is off.
+    """
+
+    first_state = performance_states[0]
+
+    for state in performance_states[1:]:
+        if (state['model_identifier'] != first_state['model_identifier']) or (state['heads'] != first_state['heads']):
+            raise Exception("Only generation states of the same model and with the same heads can be batched.")
+
+    batch_size = sum([state['batch_size'] for state in performance_states])
+
+    if random_seeds == None:
+        random_seeds = [None] * batch_size
+    elif len(random_seeds) != batch_size:
+        raise Exception("random_seeds must have one entry per performance of the batch.")
+
+    return {
+        'model_identifier': first_state['model_identifier'],
+        'batch_size': batch_size,
+        'state_buffers': [None if first_state_buffer is None else
+                          np.concatenate([state['state_buffers'][layer_index] for state in performance_states], axis=2)
+                          for layer_index, first_state_buffer in enumerate(first_state['state_buffers'])],
+        'heads': list(first_state['heads']),
+        'current_inputs': np.concatenate([state['current_inputs'] for state in performance_states], axis=1),
+        'probability_floors': probability_floors,
+        'random_generator_states': [get_random_generator(random_seed).bit_generator.state for random_seed in
+                                    random_seeds],
+        'random_draws': np.zeros((batch_size, first_state['random_draws'].shape[1])),
+        'random_draws_index': first_state['random_draws'].shape[1],
+    }
+
+
+def get_state_size_in_bytes(state):
+    """
+    Returns the number of bytes taken by the arrays of the state dictionary state.
+    """
+
+    arrays = [state_buffer for state_buffer in state['state_buffers'] if state_buffer is not None] + [
+        state['current_inputs'], state['random_draws']]
+
+    return sum([array.nbytes for array in arrays])
+
+
+def get_performances_from_prepared_model(prepared_model,
+                                         seed_note_arrays,
+                                         num_time_steps_list,
+                                         random_seeds=None,
+                                         use_edge_aversion=False,
+                                         aversion_params_dict=None,
+                                         profiler=None):
+    """
+    Generates len(seed_note_arrays) independent performances together using the batched NumPy GenerationEngine. A
+    list of full NoteArray instances, including the seed data, is returned in the same order as seed_note_arrays.
+
+    prepared_model: PreparedModel instance holding the model's bundle and fast path weights
+    seed_note_arrays: List of seed NoteArray instances, one per performance, key aligned and with the model's num_keys
+    num_time_steps_list: List of integers, how many new time steps to generate for each performance. A performance
+                         is dropped from the batch as soon as its time steps are generated.
+    random_seeds: Optional list of integer seeds or numpy.random.Generators, one per performance, for the independent
+                  random generators used in sampling
+    use_edge_aversion: Boolean controlling whether or not to keep notes biased toward the middle of the output space.
+    aversion_params_dict: Params to control how strong edge aversion is
+    profiler: Optional GenerationProfiler to record per-phase and per-layer timings into. If None, the uninstrumented
+              engine is used.
+    """
+
+    num_performances = len(seed_note_arrays)
+    num_keys = prepared_model.num_keys
+
+    if len(num_time_steps_list) != num_performances:
+        raise Exception("num_time_steps_list must have one entry per seed note array.")
+
+    for seed_note_array in seed_note_arrays:
+        if seed_note_array.note_array_transformer.num_keys != num_keys:
+            raise Exception("All seed note arrays must have the model's number of keys, " + str(num_keys) + ".")
+
+    print("Warming up " + str(num_performances) + " performances in a single batch.")
+
+    engine_arguments = {
+        'seed_flat_arrays': [seed_note_array.array for seed_note_array in seed_note_arrays],
+        'random_seeds': random_seeds,
+        'use_edge_aversion': use_edge_aversion,
+        'aversion_params_dict': aversion_params_dict,
+    }
+
+    if profiler == None:
+        generation_engine = GenerationEngine(prepared_model=prepared_model, **engine_arguments)
+    else:
+        generation_engine = profiler.get_generation_engine(prepared_model=prepared_model, **engine_arguments)
+
+    max_num_time_steps = max(num_time_steps_list)
+    generated_arrays = np.zeros((num_performances, max_num_time_steps, num_keys), dtype='bool')
+    key_states = np.zeros((num_performances, num_keys), dtype='bool')
+
+    num_time_steps_array = np.array(num_time_steps_list)
+    active_indices = np.arange(num_performances)
+
+    start = time.time()
+
+    for time_step in range(0, max_num_time_steps):
+
+        still_active = num_time_steps_array[active_indices] > time_step
+
+        if not np.all(still_active):
+            active_indices = active_indices[still_active]
+            generation_engine.keep_performances(still_active)
+            key_states = key_states[:len(active_indices)]
+
+        if time_step % 48 == 0:
+            print("==> Time step " + str(time_step) + " seconds of audio is " + str(time_step // 48) +
+                  " with " + str(len(active_indices)) + " active performances")
+
+        generated_arrays[active_indices, time_step, :] = generation_engine.generate_time_step(key_states=key_states)
+
+    end = time.time()
+
+    total_time_steps = sum(num_time_steps_list)
+    print("\nTime per second of audio:", round((end - start) / (max(total_time_steps, 1) / 48), 3), "seconds")
+    print("Timesteps added:", total_time_steps)
+
+    final_output_note_arrays = []
+    for i, seed_note_array in enumerate(seed_note_arrays):
+        flat_array = np.concatenate([seed_note_array.array.astype('bool'),
+                                     generated_arrays[i, :num_time_steps_list[i], :].flatten()])
+        final_output_note_arrays.append(seed_note_array.note_array_transformer.get_note_array(flat_array=flat_array))
+
+    if profiler != None:
+        profiler.add_phase_time('output_conversion', time.time() - end)
+
+    return final_output_note_arrays
+
+
+def get_performance_time_step_chunks(prepared_model,
+                                     seed_note_array,
+                                     num_time_steps,
+                                     chunk_size_in_time_steps=1,
+                                     random_seed=None,
+                                     use_edge_aversion=False,
+                                     aversion_params_dict=None):
+    """
+    Streaming form of generation for a single performance. Generator yielding boolean arrays of shape
+    (chunk_time_steps, num_keys) with the key states of the newly generated time steps, as soon as each chunk of up to
+    chunk_size_in_time_steps time steps is complete. The seed is not included in the yielded chunks.
+
+    prepared_model: PreparedModel instance holding the model's bundle and fast path weights
+    seed_note_array: Seed NoteArray instance, key aligned and with the model's num_keys
+    num_time_steps: How many new time steps to generate
+    chunk_size_in_time_steps: Maximum number of time steps in each yielded chunk
+    random_seed: Optional integer seed or numpy.random.Generator for sampling
+    use_edge_aversion: Boolean controlling whether or not to keep notes biased toward the middle of the output space.
+    aversion_params_dict: Params to control how strong edge aversion is
+    """
+
+    if seed_note_array.note_array_transformer.num_keys != prepared_model.num_keys:
+        raise Exception("The seed note array must have the model's number of keys, " +
+                        str(prepared_model.num_keys) + ".")
+
+    generation_engine = GenerationEngine(prepared_model=prepared_model,
+                                         seed_flat_arrays=[seed_note_array.array],
+                                         random_seeds=[random_seed],
+                                         use_edge_aversion=use_edge_aversion,
+                                         aversion_params_dict=aversion_params_dict)
+
+    for chunk in generation_engine.get_time_step_chunks(num_time_steps=num_time_steps,
+                                                        chunk_size_in_time_steps=chunk_size_in_time_steps):
+        yield chunk[0]
@@ -0,0 +1,293 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from pianonet.generation.generation_engine import GenerationEngine
+from pianonet.generation.model_bundle import ModelBundle, load_model_bundle
+from pianonet.generation.prepared_model import PreparedModel
+
+MAPPED_WEIGHTS_FILE_NAME = 'mapped_weights.bin'
+WEIGHT_ALIGNMENT_IN_BYTES = 64
+
+# Read by the BLAS libraries NumPy may be linked against when they start, so they must be set before a worker imports
+# NumPy
+BLAS_THREAD_ENVIRONMENT_VARIABLES = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                                     'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+# The prepared model of a worker process, set by initialize_worker
+worker_prepared_model = None
+
+
+def save_mapped_weights_file(model_bundle, file_path):
+    """
+    Writes every weight array of model_bundle, uncompressed and aligned, into the file at file_path and returns the
+    weight layout: a list with one entry per layer, each a list of (offset, shape, dtype) tuples describing where the
+    layer's weights are in the file.
+    """
+
+    weight_layout = []
+    offset = 0
+
+    with open(file_path, 'wb') as weights_file:
+        for weights in model_bundle.layer_weights:
+            layer_weight_layout = []
+
+            for weight in weights:
+                weight = np.ascontiguousarray(weight)
+
+                padding_size = (-offset) % WEIGHT_ALIGNMENT_IN_BYTES
+                weights_file.write(b'\0' * padding_size)
+                offset += padding_size
+
+                weights_file.write(weight.tobytes())
+                layer_weight_layout.append((offset, weight.shape, weight.dtype.str))
+                offset += weight.nbytes
+
+            weight_layout.append(layer_weight_layout)
+
+    return weight_layout
+
+
+def load_mapped_model_bundle(file_path, bundle_description):
+    """
+    Returns a ModelBundle whose weights are read-only views of the file at file_path, written by
+    save_mapped_weights_file. The file is memory mapped, so every process loading it shares a single copy of the
+    weights in the page cache.
+
+    file_path: Path to the mapped weights file
+    bundle_description: Dictionary with the bundle's layer_descriptions, weight_layout, num_keys, min_key_index,
+                        weight_precision and kernel_scales
+    """
+
+    mapped_bytes = np.memmap(file_path, dtype='uint8', mode='r')
+    layer_weights = []
+
+    for layer_weight_layout in bundle_description['weight_layout']:
+        weights = []
+
+        for offset, shape, dtype in layer_weight_layout:
+            dtype = np.dtype(dtype)
+            num_bytes = int(np.prod(shape)) * dtype.itemsize
+            weights.append(mapped_bytes[offset:offset + num_bytes].view(dtype).reshape(shape))
+
+        layer_weights.append(weights)
+
+    return ModelBundle(layer_descriptions=bundle_description['layer_descriptions'],
+                       layer_weights=layer_weights,
+                       num_keys=bundle_description['num_keys'],
+                       min_key_index=bundle_description['min_key_index'],
+                       weight_precision=bundle_description['weight_precision'],
+                       kernel_scales=bundle_description['kernel_scales'])
+
+
+def initialize_worker(weights_file_path, bundle_description, worker_counter, pin_workers_to_cores):
+    """
+    Runs once in each worker process. Builds the worker's PreparedModel over the memory mapped weights and, if
+    pin_workers_to_cores is set and the platform supports it, pins the worker to a single core.
+    """
+
+    global worker_prepared_model
+
+    if pin_workers_to_cores and hasattr(os, 'sched_setaffinity'):
+        with worker_counter.get_lock():
+            worker_index = worker_counter.value
+            worker_counter.value += 1
+
+        available_cores = sorted(os.sched_getaffinity(0))
+        os.sched_setaffinity(0, {available_cores[worker_index % len(available_cores)]})
+
+    worker_prepared_model = PreparedModel(model_bundle=load_mapped_model_bundle(file_path=weights_file_path,
+                                                                                bundle_description=bundle_description))
+
+
+def generate_performance_in_worker(seed_flat_array, num_time_steps, random_seed, use_edge_aversion,
+                                   aversion_params_dict):
+    """
+    Runs in a worker process. Returns a flat boolean array of the num_time_steps time steps generated after
+    seed_flat_array, not including the seed.
+    """
+
+    generation_engine = GenerationEngine(prepared_model=worker_prepared_model,
+                                         seed_flat_arrays=[seed_flat_array],
+                                         random_seeds=[random_seed],
+                                         use_edge_aversion=use_edge_aversion,
+                                         aversion_params_dict=aversion_params_dict)
+
+    generated_array = np.zeros((num_time_steps, worker_prepared_model.num_keys), dtype='bool')
+
+    for time_step in range(0, num_time_steps):
+        generation_engine.generate_time_step(key_states=generated_array[time_step:time_step + 1])
+
+    return generated_array.flatten()
+
+
+class GenerationFarm(object):
+    """
+    Pool of worker processes that generate independent performances in parallel, one performance per job. Generation
+    is single threaded Python, so this is how a node's cores are put to use.
+
+    The model's weights are written once to a memory mapped file that every worker maps read-only, rather than copied
+    into each worker. Each worker's BLAS library is limited to blas_threads_per_worker threads, so that the workers
+    together do not oversubscribe the cores.
+
+    Use as a context manager, or call close when done, so that the workers and the weights file are cleaned up.
+
+    The farm serves batch jobs over a single model, such as batch_performance_generation.py. The server does not use it:
+    its jobs need the hot reloaded models of the model registry, streamed chunks, cancellation between chunks and
+    warmed states shared through the seed cache, all of which live in the server process. It batches concurrent
+    requests in a JobQueue of threads instead.
+    """
+
+    def __init__(self, model_path, num_workers=None, blas_threads_per_worker=1, pin_workers_to_cores=False):
+        """
+        model_path: Path to a model bundle directory or Keras SavedModel
+        num_workers: Number of worker processes. Defaults to the number of cores.
+        blas_threads_per_worker: Number of threads each worker's BLAS library may use
+        pin_workers_to_cores: If true, each worker is pinned to its own core (Linux only)
+        """
+
+        model_bundle = load_model_bundle(model_path)
+
+        self.num_keys = model_bundle.num_keys
+        self.min_key_index = model_bundle.min_key_index
+        self.num_workers = num_workers if num_workers != None else multiprocessing.cpu_count()
+
+        self.temporary_directory_path = tempfile.mkdtemp(prefix='pianonet_generation_farm_')
+        weights_file_path = os.path.join(self.temporary_directory_path, MAPPED_WEIGHTS_FILE_NAME)
+
+        bundle_description = {
+            'layer_descriptions': model_bundle.layer_descriptions,
+            'weight_layout': save_mapped_weights_file(model_bundle=model_bundle, file_path=weights_file_path),
+            'num_keys': model_bundle.num_keys,
+            'min_key_index': model_bundle.min_key_index,
+            'weight_precision': model_bundle.weight_precision,
+            'kernel_scales': model_bundle.kernel_scales,
+        }
+
+        # Spawned workers import NumPy from scratch, so they pick up the BLAS thread limits set here
+        context = multiprocessing.get_context('spawn')
+        original_environment = {name: os.environ.get(name) for name in BLAS_THREAD_ENVIRONMENT_VARIABLES}
+
+        try:
+            for name in BLAS_THREAD_ENVIRONMENT_VARIABLES:
+                os.environ[name] = str(blas_threads_per_worker)
+
+            self.pool = context.Pool(processes=self.num_workers,
+                                     initializer=initialize_worker,
+                                     initargs=(weights_file_path, bundle_description, context.Value('i', 0),
+                                               pin_workers_to_cores))
+        finally:
+            for name, value in original_environment.items():
+                if value == None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def submit_performance(self,
+                           seed_note_array,
+                           num_time_steps,
+                           random_seed=None,
+                           use_edge_aversion=False,
+                           aversion_params_dict=None,
+                           callback=None,
+                           error_callback=None):
+        """
+        Queues the generation of one performance and returns a multiprocessing AsyncResult whose get method returns
+        the flat boolean array of the generated time steps, not including the seed.
+
+        seed_note_array: Seed NoteArray instance, key aligned and with the model's num_keys
+        num_time_steps: How many new time steps to generate
+        random_seed: Optional integer seed or numpy.random.Generator for sampling. A Generator is copied to the worker,
+                     so the performance is the same as generating in this process, but the Generator passed in is not
+                     advanced.
+        use_edge_aversion: Boolean controlling whether or not to keep notes biased toward the middle of the output
+                           space.
+        aversion_params_dict: Params to control how strong edge aversion is
+        callback: Optional function called with the generated flat array as soon as the performance is done, in a
+                  thread of the pool
+        error_callback: Optional function called with the exception instead if generation fails
+        """
+
+        if seed_note_array.note_array_transformer.num_keys != self.num_keys:
+            raise Exception("The seed note array must have the model's number of keys, " + str(self.num_keys) + ".")
+
+        return self.pool.apply_async(generate_performance_in_worker,
+                                     (seed_note_array.array, num_time_steps, random_seed, use_edge_aversion,
+                                      aversion_params_dict),
+                                     callback=callback,
+                                     error_callback=error_callback)
+
+    def get_performances(self,
+                         seed_note_arrays,
+                         num_time_steps_list,
+                         random_seeds=None,
+                         use_edge_aversion=False,
+                         aversion_params_dict=None):
+        """
+        Generates len(seed_note_arrays) independent performances across the workers. A list of full NoteArray
+        instances, including the seed data, is returned in the same order as seed_note_arrays.
+
+        seed_note_arrays: List of seed NoteArray instances, one per performance, key aligned and with the model's
+                          num_keys
+        num_time_steps_list: List of integers, how many new time steps to generate for each performance
+        random_seeds: Optional list of integer seeds or numpy.random.Generators, one per performance, for sampling.
+                      The same seeds give the same performances as get_performances_from_prepared_model.
+        use_edge_aversion: Boolean controlling whether or not to keep notes biased toward the middle of the output
+                           space.
+        aversion_params_dict: Params to control how strong edge aversion is
+        """
+
+        num_performances = len(seed_note_arrays)
+
+        if len(num_time_steps_list) != num_performances:
+            raise Exception("num_time_steps_list must have one entry per seed note array.")
+
+        if random_seeds == None:
+            random_seeds = [None] * num_performances
+        elif len(random_seeds) != num_performances:
+            raise Exception("random_seeds must have one entry per seed.")
+
+        print("Generating " + str(num_performances) + " performances on " + str(self.num_workers) + " workers.")
+
+        start = time.time()
+
+        async_results = [self.submit_performance(seed_note_array=seed_note_array,
+                                                 num_time_steps=num_time_steps,
+                                                 random_seed=random_seed,
+                                                 use_edge_aversion=use_edge_aversion,
+                                                 aversion_params_dict=aversion_params_dict)
+                         for seed_note_array, num_time_steps, random_seed in
+                         zip(seed_note_arrays, num_time_steps_list, random_seeds)]
+
+        final_output_note_arrays = []
+        for seed_note_array, async_result in zip(seed_note_arrays, async_results):
+            flat_array = np.concatenate([seed_note_array.array.astype('bool'), async_result.get()])
+            final_output_note_arrays.append(seed_note_array.note_array_transformer.get_note_array(flat_array=flat_array))
+
+        end = time.time()
+
+        total_time_steps = sum(num_time_steps_list)
+        print("\nTime per second of audio:", round((end - start) / (max(total_time_steps, 1) / 48), 3), "seconds")
+        print("Timesteps added:", total_time_steps)
+
+        return final_output_note_arrays
+
+    def close(self):
+        """
+        Waits for queued jobs to finish, stops the workers and removes the mapped weights file.
+        """
+
+        self.pool.close()
+        self.pool.join()
+
+        shutil.rmtree(self.temporary_directory_path, ignore_errors=True)
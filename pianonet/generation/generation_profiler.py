@@ -0,0 +1,191 @@
+import time
+from collections import OrderedDict
+
+from pianonet.core.misc_tools import save_dictionary_to_json_file
+from pianonet.generation.generation_engine import GenerationEngine
+
+TIME_STEPS_PER_SECOND = 48
+
+PHASE_NAMES = ('warm_up', 'note_compute', 'sampling', 'add_notes', 'output_conversion')
+LAYER_TIMING_NAMES = ('table_lookup', 'matmul', 'queue', 'bias', 'operations')
+
+
+class GenerationProfiler(object):
+    """
+    Accumulates where generation time goes: the total time and call count of each phase (warm_up, note_compute,
+    sampling, add_notes and output_conversion), and within note_compute the time each fast path layer spends in its
+    first layer table lookup, matrix products, state queue handling, bias and in-place operations. The time of
+    generate_time_step not spent in any phase is reported as Python overhead.
+
+    A profiler is only used by a ProfiledGenerationEngine, so generation without one runs the uninstrumented
+    GenerationEngine and pays nothing for this.
+    """
+
+    def __init__(self):
+        self.phase_seconds = OrderedDict([(phase_name, 0.0) for phase_name in PHASE_NAMES])
+        self.phase_calls = OrderedDict([(phase_name, 0) for phase_name in PHASE_NAMES])
+        self.layer_timings = []
+
+        self.generation_seconds = 0.0
+        self.num_time_steps_generated = 0
+        self.num_performance_time_steps_generated = 0
+
+    def get_generation_engine(self, prepared_model, **kwargs):
+        """
+        Returns a ProfiledGenerationEngine recording into this profiler, built with the arguments of GenerationEngine.
+        """
+
+        return ProfiledGenerationEngine(prepared_model=prepared_model, profiler=self, **kwargs)
+
+    def add_phase_time(self, phase_name, seconds):
+        """
+        Adds one call of seconds duration to the phase named phase_name.
+        """
+
+        self.phase_seconds[phase_name] += seconds
+        self.phase_calls[phase_name] += 1
+
+    def initialize_layer_timings(self, layers):
+        """
+        Creates the timing entries of the fast path layers, unless they already exist.
+        """
+
+        if len(self.layer_timings) != 0:
+            return
+
+        for layer_index, layer in enumerate(layers):
+            layer_timing = OrderedDict([('name', "conv_" + str(layer_index)),
+                                        ('bundle_layer_index', layer['bundle_layer_index']),
+                                        ('calls', 0)])
+
+            for timing_name in LAYER_TIMING_NAMES:
+                layer_timing[timing_name + '_seconds'] = 0.0
+
+            self.layer_timings.append(layer_timing)
+
+    def add_time_step(self, seconds, batch_size):
+        """
+        Records one generated time step of batch_size performances taking seconds in total.
+        """
+
+        self.generation_seconds += seconds
+        self.num_time_steps_generated += 1
+        self.num_performance_time_steps_generated += batch_size
+
+    def get_report(self):
+        """
+        Returns a JSON serializable dictionary of the profile. realtime_factor is the number of seconds of audio
+        generated, summed over the performances of the batch, per second of generation time, so values above 1.0 are
+        faster than realtime.
+        """
+
+        accounted_seconds = sum([self.phase_seconds[phase_name] for phase_name in ('note_compute', 'sampling',
+                                                                                  'add_notes')])
+        seconds_of_audio = self.num_performance_time_steps_generated / TIME_STEPS_PER_SECOND
+
+        return OrderedDict([
+            ('num_time_steps_generated', self.num_time_steps_generated),
+            ('seconds_of_audio', seconds_of_audio),
+            ('generation_seconds', self.generation_seconds),
+            ('python_overhead_seconds', max(0.0, self.generation_seconds - accounted_seconds)),
+            ('realtime_factor', seconds_of_audio / self.generation_seconds if self.generation_seconds > 0 else 0.0),
+            ('phases', OrderedDict([(phase_name, OrderedDict([('seconds', self.phase_seconds[phase_name]),
+                                                              ('calls', self.phase_calls[phase_name])]))
+                                    for phase_name in PHASE_NAMES])),
+            ('layers', [OrderedDict(layer_timing) for layer_timing in self.layer_timings]),
+        ])
+
+    def save(self, file_path):
+        """
+        Saves the report from get_report as JSON to the file at file_path.
+        """
+
+        save_dictionary_to_json_file(self.get_report(), file_path)
+
+
+class ProfiledGenerationEngine(GenerationEngine):
+    """
+    GenerationEngine that records the time of each generation phase and fast path layer into a GenerationProfiler, by
+    timing the engine's own phase and layer stage methods. It generates exactly the same notes as GenerationEngine
+    given the same arguments.
+    """
+
+    def __init__(self, prepared_model, profiler, **kwargs):
+        """
+        prepared_model: PreparedModel instance holding the model's bundle and fast path weights
+        profiler: GenerationProfiler to record timings into
+        kwargs: Other arguments of GenerationEngine
+        """
+
+        self.profiler = profiler
+
+        super(ProfiledGenerationEngine, self).__init__(prepared_model=prepared_model, **kwargs)
+
+        self.profiler.initialize_layer_timings(self.layers)
+
+        # The engine's layer dictionaries are its own copies, so each can carry the timing entry its stages add to
+        for layer, layer_timing in zip(self.layers, self.profiler.layer_timings):
+            layer['timing'] = layer_timing
+
+    def initialize_state_buffers(self, input_windows):
+        start = time.perf_counter()
+        super(ProfiledGenerationEngine, self).initialize_state_buffers(input_windows)
+        self.profiler.add_phase_time('warm_up', time.perf_counter() - start)
+
+    def get_first_layer_output_from_table(self):
+        start = time.perf_counter()
+        output = super(ProfiledGenerationEngine, self).get_first_layer_output_from_table()
+
+        layer_timing = self.layers[0]['timing']
+        layer_timing['calls'] += 1
+        layer_timing['table_lookup_seconds'] += time.perf_counter() - start
+
+        return output
+
+    def add_layer_products(self, layer, right_input):
+        start = time.perf_counter()
+        super(ProfiledGenerationEngine, self).add_layer_products(layer, right_input)
+
+        layer['timing']['calls'] += 1
+        layer['timing']['matmul_seconds'] += time.perf_counter() - start
+
+    def push_layer_input(self, layer, right_input):
+        start = time.perf_counter()
+        super(ProfiledGenerationEngine, self).push_layer_input(layer, right_input)
+        layer['timing']['queue_seconds'] += time.perf_counter() - start
+
+    def add_layer_bias(self, layer):
+        start = time.perf_counter()
+        super(ProfiledGenerationEngine, self).add_layer_bias(layer)
+        layer['timing']['bias_seconds'] += time.perf_counter() - start
+
+    def apply_layer_operations(self, layer):
+        start = time.perf_counter()
+        super(ProfiledGenerationEngine, self).apply_layer_operations(layer)
+        layer['timing']['operations_seconds'] += time.perf_counter() - start
+
+    def get_next_probabilities(self):
+        start = time.perf_counter()
+        probabilities = super(ProfiledGenerationEngine, self).get_next_probabilities()
+        self.profiler.add_phase_time('note_compute', time.perf_counter() - start)
+
+        return probabilities
+
+    def sample_notes(self, probabilities, key):
+        start = time.perf_counter()
+        notes = super(ProfiledGenerationEngine, self).sample_notes(probabilities, key)
+        self.profiler.add_phase_time('sampling', time.perf_counter() - start)
+
+        return notes
+
+    def add_notes(self, notes):
+        start = time.perf_counter()
+        super(ProfiledGenerationEngine, self).add_notes(notes)
+        self.profiler.add_phase_time('add_notes', time.perf_counter() - start)
+
+    def generate_time_step(self, key_states=None):
+        start = time.perf_counter()
+        key_states = super(ProfiledGenerationEngine, self).generate_time_step(key_states=key_states)
+        self.profiler.add_time_step(time.perf_counter() - start, self.batch_size)
+
+        return key_states
@@ -0,0 +1,211 @@
+import io
+import json
+
+import numpy as np
+
+from pianonet.generation.generation_engine import GenerationEngine
+
+SESSION_FORMAT_VERSION = 1
+
+
+class GenerationSession(object):
+    """
+    A single performance whose generation can be paused, continued, saved and branched. The session wraps a batch of
+    one GenerationEngine, so continuing a performance only costs the new notes: the seed warm-up is paid once, when
+    the session is created.
+
+    The engine state (layer ring buffers, current input, random generator state) can be serialized to bytes with
+    to_bytes and restored with from_bytes, for example to continue a piece in a later request. fork returns an
+    independent copy of the session, and generate_alternatives generates several different continuations in a single
+    batch, both without repeating the warm-up.
+
+    Example:
+        session = GenerationSession(prepared_model, seed_note_array=seed_note_array, random_seed=0)
+        first_key_states = session.generate(num_time_steps=480)
+        saved_session_bytes = session.to_bytes()
+        ...
+        session = GenerationSession.from_bytes(prepared_model, saved_session_bytes)
+        alternative_endings = session.generate_alternatives(num_alternatives=4, num_time_steps=240)
+    """
+
+    def __init__(self,
+                 prepared_model,
+                 seed_note_array=None,
+                 random_seed=None,
+                 use_edge_aversion=False,
+                 aversion_params_dict=None,
+                 generation_engine=None):
+        """
+        prepared_model: PreparedModel instance holding the model's bundle and fast path weights
+        seed_note_array: Seed NoteArray instance, key aligned and with the model's num_keys. If None, silence is used.
+        random_seed: Optional integer seed or numpy.random.Generator for sampling
+        use_edge_aversion: Boolean controlling whether or not to keep notes biased toward the middle of the output space.
+        aversion_params_dict: Params to control how strong edge aversion is
+        generation_engine: Optional GenerationEngine with a batch of one to continue from. If given, the seed and
+                           sampling arguments are ignored.
+        """
+
+        self.prepared_model = prepared_model
+        self.num_keys = prepared_model.num_keys
+        self.num_time_steps_generated = 0
+
+        if generation_engine != None:
+            if generation_engine.batch_size != 1:
+                raise Exception("A generation session must wrap an engine with a batch size of one.")
+
+            self.generation_engine = generation_engine
+            return
+
+        if seed_note_array == None:
+            seed_flat_array = np.zeros((0,), dtype='bool')
+        else:
+            if seed_note_array.note_array_transformer.num_keys != self.num_keys:
+                raise Exception("The seed note array must have the model's number of keys, " + str(self.num_keys) + ".")
+
+            seed_flat_array = seed_note_array.array
+
+        self.generation_engine = GenerationEngine(prepared_model=prepared_model,
+                                                  seed_flat_arrays=[seed_flat_array],
+                                                  random_seeds=[random_seed],
+                                                  use_edge_aversion=use_edge_aversion,
+                                                  aversion_params_dict=aversion_params_dict)
+
+    def generate(self, num_time_steps):
+        """
+        Generates the next num_time_steps time steps of the performance and returns them as a boolean array of shape
+        (num_time_steps, num_keys).
+        """
+
+        key_states = np.zeros((num_time_steps, 1, self.num_keys), dtype='bool')
+
+        for time_step in range(0, num_time_steps):
+            self.generation_engine.generate_time_step(key_states=key_states[time_step])
+
+        self.num_time_steps_generated += num_time_steps
+
+        return key_states.reshape(num_time_steps, self.num_keys)
+
+    def get_time_step_chunks(self, num_time_steps, chunk_size_in_time_steps=1):
+        """
+        Generator yielding the next num_time_steps time steps as they are produced, in boolean arrays of shape
+        (chunk_time_steps, num_keys) of up to chunk_size_in_time_steps time steps.
+        """
+
+        for chunk in self.generation_engine.get_time_step_chunks(num_time_steps=num_time_steps,
+                                                                 chunk_size_in_time_steps=chunk_size_in_time_steps):
+            self.num_time_steps_generated += chunk.shape[1]
+
+            yield chunk[0]
+
+    def fork(self, random_seed=None, keep_random_state=False):
+        """
+        Returns an independent copy of this session at its current position.
+
+        random_seed: Seed for the fork's new random generator, or None to seed it from system entropy
+        keep_random_state: If true, random_seed is ignored and the fork continues with a copy of this session's random
+                           generator, so it generates exactly the notes this session would.
+        """
+
+        if keep_random_state:
+            forked_engine = self.generation_engine.fork()
+        else:
+            forked_engine = self.generation_engine.fork(random_seeds=[random_seed])
+
+        forked_session = GenerationSession(prepared_model=self.prepared_model, generation_engine=forked_engine)
+        forked_session.num_time_steps_generated = self.num_time_steps_generated
+
+        return forked_session
+
+    def generate_alternatives(self, num_alternatives, num_time_steps, random_seeds=None):
+        """
+        Generates num_alternatives different continuations of num_time_steps time steps from the current position, as
+        one batch of branches. Returns a boolean array of shape (num_alternatives, num_time_steps, num_keys). This
+        session is not advanced.
+
+        random_seeds: Optional list of seeds, one per alternative. If None, each is seeded from system entropy.
+        """
+
+        if random_seeds == None:
+            random_seeds = [None] * num_alternatives
+
+        branches_engine = self.generation_engine.fork(performance_indices=[0] * num_alternatives,
+                                                      random_seeds=random_seeds)
+
+        key_states = np.zeros((num_alternatives, num_time_steps, self.num_keys), dtype='bool')
+
+        for time_step in range(0, num_time_steps):
+            branches_engine.generate_time_step(key_states=key_states[:, time_step, :])
+
+        return key_states
+
+    def to_bytes(self):
+        """
+        Returns the session's engine state serialized to bytes. Only the state is stored, not the model weights, so
+        from_bytes requires the same prepared model.
+        """
+
+        state = self.generation_engine.get_state()
+
+        arrays = {
+            'current_inputs': state['current_inputs'],
+            'random_draws': state['random_draws'],
+        }
+
+        if state['probability_floors'] is not None:
+            arrays['probability_floors'] = state['probability_floors']
+
+        for layer_index, state_buffer in enumerate(state['state_buffers']):
+            if state_buffer is not None:
+                arrays['state_buffer_' + str(layer_index)] = state_buffer
+
+        metadata = {
+            'format_version': SESSION_FORMAT_VERSION,
+            'model_identifier': state['model_identifier'],
+            'num_time_steps_generated': self.num_time_steps_generated,
+            'heads': state['heads'],
+            'random_generator_states': state['random_generator_states'],
+            'random_draws_index': state['random_draws_index'],
+        }
+
+        arrays['metadata'] = np.frombuffer(json.dumps(metadata).encode('utf-8'), dtype='uint8')
+
+        session_bytes_io = io.BytesIO()
+        np.savez_compressed(session_bytes_io, **arrays)
+
+        return session_bytes_io.getvalue()
+
+    @classmethod
+    def from_bytes(cls, prepared_model, session_bytes):
+        """
+        Returns the GenerationSession serialized in session_bytes by to_bytes, resumed with prepared_model.
+        """
+
+        with np.load(io.BytesIO(session_bytes), allow_pickle=False) as arrays:
+            metadata = json.loads(arrays['metadata'].tobytes().decode('utf-8'))
+
+            if metadata['format_version'] != SESSION_FORMAT_VERSION:
+                raise Exception("Unsupported generation session format version " + str(metadata['format_version']))
+
+            state_buffers = []
+            for layer_index in range(len(metadata['heads'])):
+                state_buffer_key = 'state_buffer_' + str(layer_index)
+                state_buffers.append(arrays[state_buffer_key] if state_buffer_key in arrays else None)
+
+            state = {
+                'model_identifier': metadata['model_identifier'],
+                'batch_size': 1,
+                'state_buffers': state_buffers,
+                'heads': metadata['heads'],
+                'current_inputs': arrays['current_inputs'],
+                'probability_floors': arrays['probability_floors'] if 'probability_floors' in arrays else None,
+                'random_generator_states': metadata['random_generator_states'],
+                'random_draws': arrays['random_draws'],
+                'random_draws_index': metadata['random_draws_index'],
+            }
+
+        generation_engine = GenerationEngine(prepared_model=prepared_model, state=state)
+
+        session = cls(prepared_model=prepared_model, generation_engine=generation_engine)
+        session.num_time_steps_generated = metadata['num_time_steps_generated']
+
+        return session
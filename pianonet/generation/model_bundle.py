@@ -0,0 +1,365 @@
+import json
+import os
+
+import numpy as np
+
+MANIFEST_FILE_NAME = 'model_bundle.json'
+WEIGHTS_FILE_NAME = 'model_bundle_weights.npz'
+
+BUNDLE_FORMAT_VERSION = 1
+
+# Precisions in which a bundle can store its conv kernels. int8 kernels are stored with one float32 scale per filter.
+WEIGHT_PRECISIONS = ('float32', 'float16', 'int8')
+INT8_MAX_VALUE = 127
+
+
+class ModelBundle(object):
+    """
+    A compact, TensorFlow-free representation of a trained fully convolutional PianoNet model. A bundle holds only what
+    generation needs: the ordered chain of layer descriptions (class, dilation rate, kernel size, activation, layer
+    normalization parameters) and the weight arrays of each layer, along with the num_keys and min_key_index of the note
+    arrays the model was trained on.
+
+    On disc, a bundle is a directory containing a JSON manifest (model_bundle.json) describing the layers and an npz
+    file (model_bundle_weights.npz) holding the weights. Loading a bundle never imports TensorFlow.
+
+    A bundle's weight_precision sets how its conv kernels are held, both on disc and in memory: as float32, float16, or
+    int8 with a float32 scale per filter in kernel_scales. Biases and layer normalization parameters are always
+    float32. Reduced precision kernels stay reduced when a bundle is loaded, and the generation engine reads them as
+    they are, so a float16 bundle takes half and an int8 bundle a quarter of the memory and memory bandwidth of the
+    float32 bundle. Use get_float32_layer_weights for the weights of a layer as float32.
+
+    Example manifest layer entries:
+
+        {"class_name": "Conv1D", "kernel_size": 2, "dilation_rate": 4, "strides": 1, "padding": "valid",
+         "filters": 12, "activation": "linear"}
+        {"class_name": "LayerNormalization", "axis": [2], "epsilon": 0.001, "center": true, "scale": true}
+        {"class_name": "Activation", "activation": "elu"}
+    """
+
+    def __init__(self,
+                 layer_descriptions,
+                 layer_weights,
+                 num_keys,
+                 min_key_index,
+                 weight_precision='float32',
+                 kernel_scales=None):
+        """
+        layer_descriptions: List of dictionaries describing each layer, in model order (input layer excluded)
+        layer_weights: List with one entry per layer description, each a list of numpy weight arrays in Keras order.
+                       Conv kernels must have the dtype weight_precision.
+        num_keys: Number of keys in each time step of the model's input note arrays
+        min_key_index: Index of the lowest key of the pianoroll kept in the model's input note arrays
+        weight_precision: Precision of the conv kernels, one of WEIGHT_PRECISIONS. Use get_quantized_model_bundle to
+                          reduce the precision of a float32 bundle.
+        kernel_scales: For int8 bundles, a list with one entry per layer description holding the float32 scales of
+                       each filter of the layer's conv kernel, of shape (filters,), or None for layers without a
+                       kernel. The float32 kernel is the int8 kernel times these scales. None for other precisions.
+        """
+
+        if len(layer_descriptions) != len(layer_weights):
+            raise Exception("Each layer description must have a corresponding list of layer weights.")
+
+        if weight_precision not in WEIGHT_PRECISIONS:
+            raise Exception("Unsupported weight precision " + str(weight_precision) + ". Supported precisions are " +
+                            ", ".join(WEIGHT_PRECISIONS) + ".")
+
+        for layer_description, weights in zip(layer_descriptions, layer_weights):
+            is_kernel_of_wrong_precision = (len(weights) > 0) and (weights[0].dtype != weight_precision)
+
+            if is_quantized_weight(layer_description, 0) and is_kernel_of_wrong_precision:
+                raise Exception("Conv kernels must have the bundle's weight precision " + weight_precision + ", not " +
+                                str(weights[0].dtype) + ". Use get_quantized_model_bundle to reduce their precision.")
+
+        if (weight_precision == 'int8') != (kernel_scales != None):
+            raise Exception("kernel_scales must be given for int8 bundles, and only for them.")
+
+        self.layer_descriptions = layer_descriptions
+        self.layer_weights = layer_weights
+        self.num_keys = num_keys
+        self.min_key_index = min_key_index
+        self.weight_precision = weight_precision
+        self.kernel_scales = kernel_scales
+
+    @classmethod
+    def from_keras_model(cls, model, num_keys=72, min_key_index=31):
+        """
+        Returns a ModelBundle holding the layers and weights of a loaded Keras model. The model's layer attributes are
+        read directly, so TensorFlow is not imported here.
+
+        model: The Keras trained model to convert
+        num_keys: Number of keys in each time step of the model's input note arrays
+        min_key_index: Index of the lowest key of the pianoroll kept in the model's input note arrays
+        """
+
+        layer_descriptions = []
+        layer_weights = []
+
+        for layer in model.layers:
+            class_name = layer.__class__.__name__
+
+            if class_name == 'InputLayer':
+                continue
+
+            if isinstance(layer.input, list):
+                raise Exception("Layer " + layer.name + " has several inputs. Model bundles require the model's " +
+                                "layers to form a single chain.")
+
+            layer_description = {'class_name': class_name}
+
+            if class_name == 'Conv1D':
+                layer_description['kernel_size'] = int(layer.kernel_size[0])
+                layer_description['dilation_rate'] = int(layer.dilation_rate[0])
+                layer_description['strides'] = int(layer.strides[0])
+                layer_description['padding'] = layer.padding
+                layer_description['filters'] = int(layer.filters)
+
+            elif class_name == 'LayerNormalization':
+                axis = layer.axis if isinstance(layer.axis, (list, tuple)) else [layer.axis]
+
+                layer_description['axis'] = [int(a) for a in axis]
+                layer_description['epsilon'] = float(layer.epsilon)
+                layer_description['center'] = bool(layer.center)
+                layer_description['scale'] = bool(layer.scale)
+
+            if hasattr(layer, 'activation'):
+                layer_description['activation'] = layer.activation.__name__
+
+            layer_descriptions.append(layer_description)
+            layer_weights.append([np.array(weight, dtype='float32') for weight in layer.get_weights()])
+
+        return cls(layer_descriptions=layer_descriptions,
+                   layer_weights=layer_weights,
+                   num_keys=num_keys,
+                   min_key_index=min_key_index)
+
+    @classmethod
+    def load(cls, directory_path):
+        """
+        Returns the ModelBundle saved in the directory at directory_path.
+        """
+
+        with open(os.path.join(directory_path, MANIFEST_FILE_NAME), 'r') as manifest_file:
+            manifest = json.load(manifest_file)
+
+        if manifest['format_version'] != BUNDLE_FORMAT_VERSION:
+            raise Exception("Unsupported model bundle format version " + str(manifest['format_version']))
+
+        weight_precision = manifest.get('weight_precision', 'float32')
+        layer_weights = []
+        kernel_scales = [] if weight_precision == 'int8' else None
+
+        with np.load(os.path.join(directory_path, WEIGHTS_FILE_NAME)) as weights_file:
+            for layer_index, layer_description in enumerate(manifest['layers']):
+                weights = [weights_file[get_weight_key(layer_index, weight_index)] for weight_index in
+                           range(layer_description['num_weights'])]
+                layer_weights.append(weights)
+
+                if kernel_scales != None:
+                    scale_key = get_weight_scale_key(get_weight_key(layer_index, 0))
+                    kernel_scales.append(weights_file[scale_key] if scale_key in weights_file else None)
+
+        layer_descriptions = []
+        for layer_description in manifest['layers']:
+            layer_description = dict(layer_description)
+            del layer_description['num_weights']
+            layer_descriptions.append(layer_description)
+
+        return cls(layer_descriptions=layer_descriptions,
+                   layer_weights=layer_weights,
+                   num_keys=manifest['num_keys'],
+                   min_key_index=manifest['min_key_index'],
+                   weight_precision=weight_precision,
+                   kernel_scales=kernel_scales)
+
+    def save(self, directory_path):
+        """
+        Saves the manifest and weights of this bundle into the directory at directory_path, creating it if needed.
+        """
+
+        if not os.path.exists(directory_path):
+            os.makedirs(directory_path)
+
+        manifest_layers = []
+        weights_dictionary = {}
+
+        for layer_index, layer_description in enumerate(self.layer_descriptions):
+            manifest_layer = dict(layer_description)
+            manifest_layer['num_weights'] = len(self.layer_weights[layer_index])
+            manifest_layers.append(manifest_layer)
+
+            for weight_index, weight in enumerate(self.layer_weights[layer_index]):
+                weights_dictionary[get_weight_key(layer_index, weight_index)] = weight
+
+            if (self.kernel_scales != None) and (self.kernel_scales[layer_index] is not None):
+                weights_dictionary[get_weight_scale_key(get_weight_key(layer_index, 0))] = self.kernel_scales[
+                    layer_index]
+
+        manifest = {
+            'format_version': BUNDLE_FORMAT_VERSION,
+            'num_keys': self.num_keys,
+            'min_key_index': self.min_key_index,
+            'weight_precision': self.weight_precision,
+            'layers': manifest_layers,
+        }
+
+        with open(os.path.join(directory_path, MANIFEST_FILE_NAME), 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=4)
+
+        np.savez(os.path.join(directory_path, WEIGHTS_FILE_NAME), **weights_dictionary)
+
+    def get_num_notes_in_model_input(self):
+        """
+        Returns the required (minimum) input size of the model, as get_model_input_shape does for Keras models.
+        """
+
+        model_input_size = 1
+
+        for layer_description in self.layer_descriptions:
+            if layer_description['class_name'] == 'Conv1D':
+                model_input_size += (layer_description['kernel_size'] - 1) * layer_description['dilation_rate']
+
+        return model_input_size
+
+    def get_num_parameters(self):
+        """
+        Returns the total number of weight values held in the bundle.
+        """
+
+        return sum([weight.size for weights in self.layer_weights for weight in weights])
+
+    def get_kernel_scale(self, layer_index):
+        """
+        Returns the per-filter scales of the int8 conv kernel of the layer at layer_index, or None if its kernel is not
+        int8 or it has none.
+        """
+
+        return None if self.kernel_scales == None else self.kernel_scales[layer_index]
+
+    def get_float32_layer_weights(self, layer_index):
+        """
+        Returns the weights of the layer at layer_index with its conv kernel, if any, converted to float32. Weights that
+        already are float32 are returned as they are, not copied.
+        """
+
+        weights = list(self.layer_weights[layer_index])
+
+        if (len(weights) > 0) and is_quantized_weight(self.layer_descriptions[layer_index], 0):
+            weights[0] = dequantize_weight(weights[0], self.get_kernel_scale(layer_index))
+
+        return weights
+
+
+def get_weight_key(layer_index, weight_index):
+    """
+    Returns the key under which a layer's weight array is stored in the bundle's npz file.
+    """
+
+    return "layer_" + str(layer_index) + "_weight_" + str(weight_index)
+
+
+def get_weight_scale_key(weight_key):
+    """
+    Returns the key under which the per-filter scales of an int8 kernel stored under weight_key are kept.
+    """
+
+    return weight_key + "_scale"
+
+
+def is_quantized_weight(layer_description, weight_index):
+    """
+    Returns true if the weight at weight_index of the layer described by layer_description is held in the bundle's
+    weight precision. Only conv kernels are, since they hold nearly all of a model's parameters.
+    """
+
+    return (layer_description['class_name'] == 'Conv1D') and (weight_index == 0)
+
+
+def quantize_weight(weight, weight_precision):
+    """
+    Returns a tuple of the float32 array weight converted to weight_precision and its float32 scales, which are None
+    unless weight_precision is int8. int8 weights are scaled per filter (last axis) so that each filter's largest
+    magnitude maps to INT8_MAX_VALUE.
+    """
+
+    if weight_precision in ('float32', 'float16'):
+        return weight.astype(weight_precision), None
+
+    reduction_axes = tuple(range(weight.ndim - 1))
+    scale = np.max(np.abs(weight), axis=reduction_axes) / INT8_MAX_VALUE
+    scale = np.where(scale > 0, scale, 1.0).astype('float32')
+
+    quantized_weight = np.clip(np.round(weight / scale), -INT8_MAX_VALUE, INT8_MAX_VALUE).astype('int8')
+
+    return quantized_weight, scale
+
+
+def dequantize_weight(weight, scale=None):
+    """
+    Returns weight, held in any weight precision, as float32, multiplied by its per-filter scale if it is int8.
+    """
+
+    if weight.dtype == 'float32':
+        return weight
+
+    float32_weight = weight.astype('float32')
+
+    if scale is not None:
+        float32_weight *= scale
+
+    return float32_weight
+
+
+def get_quantized_model_bundle(model_bundle, weight_precision):
+    """
+    Returns a copy of model_bundle whose conv kernels are converted to weight_precision, along with their scales for
+    int8. The other weights are shared with model_bundle.
+    """
+
+    layer_weights = []
+    kernel_scales = [] if weight_precision == 'int8' else None
+
+    for layer_index, layer_description in enumerate(model_bundle.layer_descriptions):
+        weights = model_bundle.get_float32_layer_weights(layer_index)
+        kernel_scale = None
+
+        if (len(weights) > 0) and is_quantized_weight(layer_description, 0):
+            weights[0], kernel_scale = quantize_weight(weights[0], weight_precision)
+
+        layer_weights.append(weights)
+
+        if kernel_scales != None:
+            kernel_scales.append(kernel_scale)
+
+    return ModelBundle(layer_descriptions=model_bundle.layer_descriptions,
+                       layer_weights=layer_weights,
+                       num_keys=model_bundle.num_keys,
+                       min_key_index=model_bundle.min_key_index,
+                       weight_precision=weight_precision,
+                       kernel_scales=kernel_scales)
+
+
+def is_model_bundle(directory_path):
+    """
+    Returns true if directory_path is a directory containing a saved ModelBundle.
+    """
+
+    return os.path.isfile(os.path.join(directory_path, MANIFEST_FILE_NAME))
+
+
+def load_model_bundle(model_path, num_keys=72, min_key_index=31):
+    """
+    Returns a ModelBundle for model_path. If model_path holds a saved bundle, it is loaded without TensorFlow.
+    Otherwise model_path is treated as a Keras SavedModel, which is loaded (importing TensorFlow) and converted.
+
+    model_path: Path to a model bundle directory or Keras SavedModel
+    num_keys: Number of keys of the model's input, only used when converting a Keras model
+    min_key_index: Index of the lowest key kept in the model's input, only used when converting a Keras model
+    """
+
+    if is_model_bundle(model_path):
+        return ModelBundle.load(model_path)
+
+    from tensorflow.keras.models import load_model
+
+    return ModelBundle.from_keras_model(model=load_model(model_path), num_keys=num_keys, min_key_index=min_key_index)
@@ -0,0 +1,301 @@
+import numpy as np
+
+SELU_ALPHA = 1.6732632423543772848170429916717
+SELU_SCALE = 1.0507009873554804934193349852946
+
+# Layers that are the identity at inference time
+IDENTITY_LAYER_CLASS_NAMES = ('Dropout', 'SpatialDropout1D', 'GaussianNoise', 'GaussianDropout',
+                              'ActivityRegularization')
+
+
+def elu(x):
+    return np.where(x > 0, x, np.expm1(np.minimum(x, 0.0)))
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def softmax(x):
+    exponentials = np.exp(x - np.max(x, axis=-1, keepdims=True))
+    return exponentials / np.sum(exponentials, axis=-1, keepdims=True)
+
+
+ACTIVATION_FUNCTIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0.0),
+    'elu': elu,
+    'selu': lambda x: SELU_SCALE * np.where(x > 0, x, SELU_ALPHA * np.expm1(np.minimum(x, 0.0))),
+    'sigmoid': sigmoid,
+    'hard_sigmoid': lambda x: np.clip(0.2 * x + 0.5, 0.0, 1.0),
+    'tanh': np.tanh,
+    'softplus': lambda x: np.logaddexp(x, 0.0),
+    'softsign': lambda x: x / (np.abs(x) + 1.0),
+    'exponential': np.exp,
+    'swish': lambda x: x * sigmoid(x),
+    'softmax': softmax,
+}
+
+
+def elu_in_place(x, scratch, row_scratch):
+    np.minimum(x, 0.0, out=scratch)
+    np.expm1(scratch, out=scratch)
+    np.maximum(x, 0.0, out=x)
+    x += scratch
+
+
+def selu_in_place(x, scratch, row_scratch):
+    elu_in_place(x, scratch, row_scratch)
+    np.minimum(x, 0.0, out=scratch)
+    x += (SELU_ALPHA - 1.0) * scratch
+    x *= SELU_SCALE
+
+
+def sigmoid_in_place(x, scratch, row_scratch):
+    np.negative(x, out=x)
+    np.exp(x, out=x)
+    x += 1.0
+    np.reciprocal(x, out=x)
+
+
+def hard_sigmoid_in_place(x, scratch, row_scratch):
+    x *= 0.2
+    x += 0.5
+    np.clip(x, 0.0, 1.0, out=x)
+
+
+def softsign_in_place(x, scratch, row_scratch):
+    np.abs(x, out=scratch)
+    scratch += 1.0
+    x /= scratch
+
+
+def swish_in_place(x, scratch, row_scratch):
+    scratch[...] = x
+    sigmoid_in_place(scratch, None, None)
+    x *= scratch
+
+
+def softmax_in_place(x, scratch, row_scratch):
+    """
+    Softmax over the channels of x, the first axis of a (channels x B) block.
+    """
+
+    np.max(x, axis=0, out=row_scratch[0])
+    x -= row_scratch[0]
+    np.exp(x, out=x)
+    np.sum(x, axis=0, out=row_scratch[0])
+    x /= row_scratch[0]
+
+
+# Each function applies an activation in place to a (channels x B) block x, using scratch, an array of the same shape,
+# and row_scratch, an array of shape (2, B), as temporary storage. The linear activation needs no function.
+IN_PLACE_ACTIVATION_FUNCTIONS = {
+    'linear': None,
+    'relu': lambda x, scratch, row_scratch: np.maximum(x, 0.0, out=x),
+    'elu': elu_in_place,
+    'selu': selu_in_place,
+    'sigmoid': sigmoid_in_place,
+    'hard_sigmoid': hard_sigmoid_in_place,
+    'tanh': lambda x, scratch, row_scratch: np.tanh(x, out=x),
+    'softplus': lambda x, scratch, row_scratch: np.logaddexp(x, 0.0, out=x),
+    'softsign': softsign_in_place,
+    'exponential': lambda x, scratch, row_scratch: np.exp(x, out=x),
+    'swish': swish_in_place,
+    'softmax': softmax_in_place,
+}
+
+
+def get_activation_function(activation_name):
+    """
+    Returns the NumPy implementation of the Keras activation named activation_name.
+    """
+
+    if activation_name not in ACTIVATION_FUNCTIONS:
+        raise Exception("Activation " + str(activation_name) + " is not supported by the NumPy generation engine. " +
+                        "Supported activations are " + ", ".join(sorted(ACTIVATION_FUNCTIONS.keys())) + ".")
+
+    return ACTIVATION_FUNCTIONS[activation_name]
+
+
+def get_in_place_activation_function(activation_name):
+    """
+    Returns a function f(x, scratch, row_scratch) applying the activation named activation_name to the (channels x B)
+    block x in place, or None for the linear activation.
+    """
+
+    get_activation_function(activation_name)
+
+    return IN_PLACE_ACTIVATION_FUNCTIONS[activation_name]
+
+
+def get_conv1d_kernel_and_bias(layer_description, weights):
+    """
+    Validates that a Conv1D layer can be run by the NumPy engine and returns its kernel, of shape (kernel_size,
+    input_channels, filters), and bias, of shape (filters,).
+    """
+
+    if layer_description.get('strides', 1) != 1:
+        raise Exception("Conv1D layers must have strides of one for generation.")
+
+    if layer_description.get('padding', 'valid') not in ('valid', 'causal'):
+        raise Exception("Conv1D layers must use 'valid' or 'causal' padding for generation.")
+
+    kernel = weights[0]
+    bias = weights[1] if len(weights) > 1 else np.zeros((kernel.shape[2],), dtype='float32')
+
+    return kernel, bias
+
+
+def get_layer_normalization_parameters(layer_description, weights):
+    """
+    Validates that a LayerNormalization layer normalizes over channels only and returns its gamma and beta arrays of
+    shape (channels,) (None when the layer does not scale or center) and its epsilon.
+    """
+
+    if layer_description.get('axis', [-1]) not in ([-1], [2]):
+        raise Exception("LayerNormalization layers must normalize over the channel axis only for generation.")
+
+    weights = list(weights)
+    gamma = weights.pop(0) if layer_description.get('scale', True) else None
+    beta = weights.pop(0) if layer_description.get('center', True) else None
+
+    return gamma, beta, layer_description.get('epsilon', 1e-3)
+
+
+def layer_normalization(x, gamma, beta, epsilon):
+    """
+    Normalizes x over its last (channel) axis as the Keras LayerNormalization layer does.
+    """
+
+    mean = np.mean(x, axis=-1, keepdims=True)
+    variance = np.mean(np.square(x - mean), axis=-1, keepdims=True)
+
+    y = (x - mean) / np.sqrt(variance + epsilon)
+
+    if gamma is not None:
+        y = y * gamma
+
+    if beta is not None:
+        y = y + beta
+
+    return y
+
+
+def layer_normalization_in_place(x, scratch, row_scratch, gamma, beta, epsilon):
+    """
+    Normalizes the (channels x B) block x over its channels in place. gamma and beta have shape (channels, 1) or are
+    None.
+    """
+
+    mean = row_scratch[0]
+    standard_deviation = row_scratch[1]
+
+    np.mean(x, axis=0, out=mean)
+    x -= mean
+
+    np.square(x, out=scratch)
+    np.mean(scratch, axis=0, out=standard_deviation)
+    standard_deviation += epsilon
+    np.sqrt(standard_deviation, out=standard_deviation)
+    x /= standard_deviation
+
+    if gamma is not None:
+        x *= gamma
+
+    if beta is not None:
+        x += beta
+
+
+def get_layer_output(layer_description, weights, x, silence_state=None):
+    """
+    Returns the output of one layer for the input x of shape (batch_size, time_steps, channels).
+
+    silence_state: Optional array of shape (channels,) holding the value x takes over silence. If given, conv layers
+                   treat everything before the start of x as silence by left padding x with (k - 1) * d copies of it,
+                   so the output has as many time steps as x. Otherwise conv layers shorten the sequence by
+                   (k - 1) * d time steps.
+    """
+
+    class_name = layer_description['class_name']
+
+    if class_name == 'Conv1D':
+        kernel, bias = get_conv1d_kernel_and_bias(layer_description, weights)
+        dilation_rate = layer_description['dilation_rate']
+        state_length = (kernel.shape[0] - 1) * dilation_rate
+
+        if (silence_state is not None) and (state_length > 0):
+            silence_padding = np.broadcast_to(silence_state.astype('float32'), (x.shape[0], state_length, x.shape[2]))
+            x = np.concatenate([silence_padding, x], axis=1)
+
+        num_outputs = x.shape[1] - state_length
+
+        y = np.zeros((x.shape[0], num_outputs, kernel.shape[2]), dtype='float32') + bias
+
+        for tap_index in range(kernel.shape[0]):
+            tap_start = tap_index * dilation_rate
+            y += np.matmul(x[:, tap_start:tap_start + num_outputs, :], kernel[tap_index])
+
+        y = get_activation_function(layer_description.get('activation', 'linear'))(y)
+
+    elif class_name == 'Activation':
+        y = get_activation_function(layer_description['activation'])(x)
+
+    elif class_name == 'LayerNormalization':
+        gamma, beta, epsilon = get_layer_normalization_parameters(layer_description, weights)
+        y = layer_normalization(x, gamma, beta, epsilon)
+
+    elif class_name in IDENTITY_LAYER_CLASS_NAMES:
+        y = x
+
+    else:
+        raise Exception("Layer class " + class_name + " is not supported by the NumPy generation engine.")
+
+    return y.astype('float32', copy=False)
+
+
+def get_layer_outputs(model_bundle, input_windows, silence_states=None):
+    """
+    Runs the full (non-queue-based) forward pass of the model over a batch of input windows in NumPy, replacing the
+    K.function call previously used for warming up generation. Returns a list with the model input followed by the
+    output of every layer in model_bundle.layer_descriptions, each of shape (batch_size, time_steps, channels).
+
+    Causal conv layers are evaluated without their left zero padding, so every output lines up with the end of the
+    input window as it does for 'valid' layers.
+
+    model_bundle: ModelBundle instance holding the model's layers and weights
+    input_windows: Array of shape (batch_size, num_notes) of note states
+    silence_states: Optional list from get_silence_states. If given, the input windows are assumed to be preceded by
+                    silence, and every layer output has num_notes time steps.
+    """
+
+    x = np.asarray(input_windows, dtype='float32').reshape(len(input_windows), -1, 1)
+    layer_outputs = [x]
+
+    # Reduced precision kernels are converted to float32 one layer at a time, so only one layer's copy is held at once
+    for layer_index, layer_description in enumerate(model_bundle.layer_descriptions):
+        silence_state = None if silence_states is None else silence_states[layer_index]
+
+        x = get_layer_output(layer_description, model_bundle.get_float32_layer_weights(layer_index), x,
+                             silence_state=silence_state)
+        layer_outputs.append(x)
+
+    return layer_outputs
+
+
+def get_silence_states(model_bundle):
+    """
+    Returns a list, aligned with the list returned by get_layer_outputs, of arrays of shape (channels,) holding the
+    constant value the model input and each layer output take over a long stretch of silence. Each conv layer's output
+    over silence only depends on the constant value of its input, so this costs one time step per layer.
+    """
+
+    x = np.zeros((1, 1, 1), dtype='float32')
+    silence_states = [x[0, 0]]
+
+    for layer_index, layer_description in enumerate(model_bundle.layer_descriptions):
+        x = get_layer_output(layer_description, model_bundle.get_float32_layer_weights(layer_index), x,
+                             silence_state=x[0, 0])
+        silence_states.append(x[0, 0])
+
+    return silence_states
@@ -0,0 +1,298 @@
+import functools
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from pianonet.core.misc_tools import get_hash_string_of_numpy_array
+from pianonet.generation.model_bundle import load_model_bundle
+from pianonet.generation.numpy_layers import IDENTITY_LAYER_CLASS_NAMES, get_conv1d_kernel_and_bias, \
+    get_in_place_activation_function, get_layer_normalization_parameters, get_silence_states, \
+    layer_normalization_in_place
+
+DEFAULT_CACHE_MEMORY_CAP_IN_BYTES = int(
+    float(os.environ.get('PIANONET_PREPARED_MODEL_CACHE_MEGABYTES', 1024)) * 1024 * 1024)
+
+# The binary input table of the first layer has 2 ** kernel_size columns, so it is only built for small kernels
+MAX_BINARY_INPUT_TABLE_KERNEL_SIZE = 10
+
+
+class PreparedModel(object):
+    """
+    Everything the GenerationEngine needs from a model that does not depend on the seed: the ModelBundle used for the
+    warm-up pass, the transposed per-layer weights of the queue-based fast path, the model input size, and the
+    constant silence state of every layer, which lets the warm-up skip the silent start of a seed. Building
+    this once per model, rather than once per performance, removes the per-request setup cost.
+
+    A PreparedModel is not modified after construction (apart from lazily computing its identifier hash, which gives
+    the same result in any thread), and each GenerationEngine allocates its own state buffers, so a single instance can
+    be shared by any number of engines across threads.
+    """
+
+    def __init__(self, model_bundle):
+        """
+        model_bundle: ModelBundle instance holding the model's layers and weights
+        """
+
+        self.model_bundle = model_bundle
+        self.num_keys = model_bundle.num_keys
+        self.min_key_index = model_bundle.min_key_index
+        self.num_notes_in_model_input = model_bundle.get_num_notes_in_model_input()
+
+        self.fast_path_layers = self.get_fast_path_layers()
+        self.silence_states = get_silence_states(model_bundle)
+
+        self.identifier_hash_string = None
+
+    @classmethod
+    def from_model_path(cls, model_path):
+        """
+        Returns a PreparedModel for the model bundle or Keras SavedModel at model_path.
+        """
+
+        return cls(model_bundle=load_model_bundle(model_path))
+
+    def get_fast_path_layers(self):
+        """
+        Returns the list of conv layer dictionaries used by the queue-based fast path, built by walking the bundle's
+        layers in order. Every LayerNormalization and Activation layer (and any activation of the conv layer itself) is
+        folded into the conv layer preceding it as an in-place operation. Weights are transposed so that each tap is a
+        left multiplication of a (channels x B) state block: 'w_taps' holds the k - 1 past taps, oldest first, and
+        'w_right' the tap applied to the current input. The taps are transposed views of the bundle's kernels rather
+        than copies, so the fast path shares the bundle's weight memory (which may be a memory mapped file).
+
+        The taps keep the bundle's weight precision. For int8 bundles, 'w_scale' holds the (filters x 1) per-filter
+        scales that the sum of the layer's int8 tap products is multiplied by. It is None for other precisions.
+        """
+
+        layers = []
+
+        for layer_index, layer_description in enumerate(self.model_bundle.layer_descriptions):
+            class_name = layer_description['class_name']
+            weights = self.model_bundle.layer_weights[layer_index]
+
+            if (class_name != 'Conv1D') and (class_name not in IDENTITY_LAYER_CLASS_NAMES) and (len(layers) == 0):
+                raise Exception("Fast path generation requires the model to start with a Conv1D layer.")
+
+            if class_name == 'Conv1D':
+                kernel, bias = get_conv1d_kernel_and_bias(layer_description, weights)
+                kernel_scale = self.model_bundle.get_kernel_scale(layer_index)
+                kernel_size = layer_description['kernel_size']
+                dilation_rate = layer_description['dilation_rate']
+
+                layers.append({
+                    'bundle_layer_index': layer_index,
+                    'kernel_size': kernel_size,
+                    'dilation_rate': dilation_rate,
+                    'state_length': (kernel_size - 1) * dilation_rate,
+                    'w_taps': [kernel[tap_index].T for tap_index in range(kernel_size - 1)],
+                    'w_right': kernel[-1].T,
+                    'w_scale': None if kernel_scale is None else kernel_scale.reshape(-1, 1).astype('float32'),
+                    'b': bias.reshape(-1, 1).astype('float32'),
+                    'operations': [],
+                })
+
+                self.add_activation_operation(layers[-1], layer_description.get('activation', 'linear'))
+
+            elif class_name == 'Activation':
+                self.add_activation_operation(layers[-1], layer_description['activation'])
+
+            elif class_name == 'LayerNormalization':
+                gamma, beta, epsilon = get_layer_normalization_parameters(layer_description, weights)
+
+                layers[-1]['operations'].append(functools.partial(
+                    layer_normalization_in_place,
+                    gamma=None if gamma is None else gamma.reshape(-1, 1).astype('float32'),
+                    beta=None if beta is None else beta.reshape(-1, 1).astype('float32'),
+                    epsilon=epsilon))
+
+            elif class_name in IDENTITY_LAYER_CLASS_NAMES:
+                pass
+
+            else:
+                raise Exception("Layer class " + class_name + " is not supported by the fast path generation engine. " +
+                                "Supported layers are Conv1D, Activation, LayerNormalization and " +
+                                ", ".join(IDENTITY_LAYER_CLASS_NAMES) + ".")
+
+        if layers[-1]['w_right'].shape[0] != 1:
+            raise Exception("Fast path generation requires the model to output a single probability per note.")
+
+        layers[0]['binary_input_output_table'] = self.get_binary_input_output_table(layers[0])
+
+        return layers
+
+    def get_binary_input_output_table(self, layer):
+        """
+        Returns an array of shape (filters, 2 ** kernel_size) holding the output of layer, with all of its operations
+        applied, for every combination of binary inputs to its taps, or None if layer does not take a single binary
+        input channel or its kernel is too large. Column p holds the output when tap j (oldest first, the current
+        input being the last tap) is (p >> j) & 1.
+
+        The first layer only ever sees notes that are 0 or 1, so its output at each time step is one of these columns.
+        The columns are computed with the same operations as the fast path, so looking them up is exact.
+        """
+
+        kernel_size = layer['kernel_size']
+
+        if (layer['w_right'].shape[1] != 1) or (kernel_size > MAX_BINARY_INPUT_TABLE_KERNEL_SIZE):
+            return None
+
+        num_patterns = 2 ** kernel_size
+        num_filters = layer['w_right'].shape[0]
+
+        # (kernel_size, 1, num_patterns) with tap_inputs[j, 0, p] = (p >> j) & 1
+        tap_inputs = ((np.arange(num_patterns)[np.newaxis, :] >> np.arange(kernel_size)[:, np.newaxis]) & 1)
+        tap_inputs = tap_inputs[:, np.newaxis, :].astype('float32')
+
+        output_table = np.dot(layer['w_right'].astype('float32'), tap_inputs[-1])
+
+        for tap_index, w_tap in enumerate(layer['w_taps']):
+            output_table += np.dot(w_tap.astype('float32'), tap_inputs[tap_index])
+
+        if layer['w_scale'] is not None:
+            output_table *= layer['w_scale']
+
+        output_table += layer['b']
+
+        scratch = np.zeros((num_filters, num_patterns), dtype='float32')
+        row_scratch = np.zeros((2, num_patterns), dtype='float32')
+
+        for operation in layer['operations']:
+            operation(output_table, scratch, row_scratch)
+
+        return output_table
+
+    def add_activation_operation(self, layer, activation_name):
+        """
+        Appends the in-place version of the activation named activation_name to the operations of layer.
+        """
+
+        activation_function = get_in_place_activation_function(activation_name)
+
+        if activation_function != None:
+            layer['operations'].append(activation_function)
+
+    def get_identifier_hash_string(self):
+        """
+        Returns a hash string of the model's weights and num_keys that identifies the model, used to check that saved
+        generation states are restored with the model that created them.
+        """
+
+        if self.identifier_hash_string == None:
+            weights = [weight for weights in self.model_bundle.layer_weights for weight in weights] + [
+                kernel_scale for kernel_scale in (self.model_bundle.kernel_scales or []) if kernel_scale is not None]
+            weight_hash_strings = [get_hash_string_of_numpy_array(np.ascontiguousarray(weight)) for weight in weights]
+
+            self.identifier_hash_string = hashlib.md5(
+                (str(self.num_keys) + " " + " ".join(weight_hash_strings)).encode('utf-8')).hexdigest()
+
+        return self.identifier_hash_string
+
+    def get_memory_size_in_bytes(self):
+        """
+        Returns the approximate number of bytes held by this prepared model's weight arrays.
+        """
+
+        size_in_bytes = sum([weight.nbytes for weights in self.model_bundle.layer_weights for weight in weights])
+
+        # The fast path taps are views of the bundle's kernels, so only the biases, scales and tables add to the size
+        for layer in self.fast_path_layers:
+            size_in_bytes += layer['b'].nbytes
+
+            if layer['w_scale'] is not None:
+                size_in_bytes += layer['w_scale'].nbytes
+
+            if layer.get('binary_input_output_table') is not None:
+                size_in_bytes += layer['binary_input_output_table'].nbytes
+
+        size_in_bytes += sum([silence_state.nbytes for silence_state in self.silence_states])
+
+        return size_in_bytes
+
+
+class PreparedModelCache(object):
+    """
+    Thread-safe, process-level cache of PreparedModel instances keyed by model path. The least recently used models
+    are evicted once the total memory held exceeds memory_cap_in_bytes. The most recently requested model is always
+    kept, even if it alone exceeds the cap.
+    """
+
+    def __init__(self, memory_cap_in_bytes=DEFAULT_CACHE_MEMORY_CAP_IN_BYTES):
+        """
+        memory_cap_in_bytes: Maximum total size of the cached models' weights, in bytes
+        """
+
+        self.memory_cap_in_bytes = memory_cap_in_bytes
+
+        self.prepared_models = OrderedDict()
+        self.lock = threading.Lock()
+        self.loading_locks = {}
+
+    def get(self, model_path):
+        """
+        Returns the PreparedModel for model_path, preparing and caching it on first use. Concurrent requests for the
+        same uncached model wait for a single load rather than loading it several times.
+        """
+
+        model_path = os.path.abspath(model_path)
+
+        with self.lock:
+            if model_path in self.prepared_models:
+                self.prepared_models.move_to_end(model_path)
+                return self.prepared_models[model_path]
+
+            loading_lock = self.loading_locks.setdefault(model_path, threading.Lock())
+
+        with loading_lock:
+            with self.lock:
+                if model_path in self.prepared_models:
+                    self.prepared_models.move_to_end(model_path)
+                    return self.prepared_models[model_path]
+
+            prepared_model = PreparedModel.from_model_path(model_path)
+
+            with self.lock:
+                self.prepared_models[model_path] = prepared_model
+                self.loading_locks.pop(model_path, None)
+                self.evict_to_memory_cap()
+
+        return prepared_model
+
+    def evict_to_memory_cap(self):
+        """
+        Drops least recently used models until the cache fits in its memory cap. Must be called holding self.lock.
+        """
+
+        while (len(self.prepared_models) > 1) and (self.get_memory_size_in_bytes() > self.memory_cap_in_bytes):
+            self.prepared_models.popitem(last=False)
+
+    def get_memory_size_in_bytes(self):
+        return sum([prepared_model.get_memory_size_in_bytes() for prepared_model in self.prepared_models.values()])
+
+    def set_memory_cap(self, memory_cap_in_bytes):
+        """
+        Sets a new memory cap, evicting models immediately if the cache no longer fits.
+        """
+
+        with self.lock:
+            self.memory_cap_in_bytes = memory_cap_in_bytes
+            self.evict_to_memory_cap()
+
+    def clear(self):
+        with self.lock:
+            self.prepared_models.clear()
+
+
+prepared_model_cache = PreparedModelCache()
+
+
+def get_prepared_model(model_path):
+    """
+    Returns the shared PreparedModel for the model bundle or Keras SavedModel at model_path from the process-level
+    cache. The cache's memory cap defaults to the PIANONET_PREPARED_MODEL_CACHE_MEGABYTES environment variable (1024
+    MB if unset) and can be changed with prepared_model_cache.set_memory_cap.
+    """
+
+    return prepared_model_cache.get(model_path)
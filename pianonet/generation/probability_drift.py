@@ -0,0 +1,77 @@
+import numpy as np
+
+from pianonet.generation.generation_engine import GenerationEngine
+
+DEFAULT_MAX_PROBABILITY_DRIFT = 0.05
+
+
+def get_probability_drift(reference_prepared_model, prepared_model, seed_flat_array, num_time_steps, random_seed=0):
+    """
+    Returns a dictionary with the maximum and mean absolute difference between the note probabilities of
+    prepared_model and those of reference_prepared_model, typically the float32 version of the same model, over
+    num_time_steps generated time steps after seed_flat_array.
+
+    The performance is sampled from the reference model's probabilities and both models are fed the same notes, so
+    the drift measures the per-note error of prepared_model rather than how far two diverging performances drift apart.
+
+    reference_prepared_model: PreparedModel whose probabilities are taken as correct
+    prepared_model: PreparedModel to compare against the reference, with the same num_keys
+    seed_flat_array: 1D array of seed note states, key aligned
+    num_time_steps: How many time steps to generate and compare
+    random_seed: Seed of the random generator used to sample the reference performance
+    """
+
+    if reference_prepared_model.num_keys != prepared_model.num_keys:
+        raise Exception("Both models must have the same number of keys to compare their probabilities.")
+
+    reference_engine = GenerationEngine(prepared_model=reference_prepared_model,
+                                        seed_flat_arrays=[seed_flat_array],
+                                        random_seeds=[random_seed])
+    generation_engine = GenerationEngine(prepared_model=prepared_model,
+                                         seed_flat_arrays=[seed_flat_array],
+                                         random_seeds=[random_seed])
+
+    max_probability_drift = 0.0
+    total_probability_drift = 0.0
+
+    for time_step in range(0, num_time_steps):
+        for key in range(0, prepared_model.num_keys):
+            reference_probabilities = reference_engine.get_next_probabilities()
+            probability_drift = float(np.abs(generation_engine.get_next_probabilities() - reference_probabilities)[0])
+
+            max_probability_drift = max(max_probability_drift, probability_drift)
+            total_probability_drift += probability_drift
+
+            notes = reference_engine.sample_notes(reference_probabilities, key)
+            reference_engine.add_notes(notes)
+            generation_engine.add_notes(notes)
+
+    return {
+        'max_probability_drift': max_probability_drift,
+        'mean_probability_drift': total_probability_drift / max(1, num_time_steps * prepared_model.num_keys),
+    }
+
+
+def check_probability_drift(reference_prepared_model,
+                            prepared_model,
+                            seed_flat_array,
+                            num_time_steps,
+                            max_probability_drift=DEFAULT_MAX_PROBABILITY_DRIFT,
+                            random_seed=0):
+    """
+    Returns the result of get_probability_drift, raising an exception if the maximum drift of prepared_model from
+    reference_prepared_model exceeds max_probability_drift. Used to guard reduced precision models before they are
+    saved or served.
+    """
+
+    probability_drift = get_probability_drift(reference_prepared_model=reference_prepared_model,
+                                              prepared_model=prepared_model,
+                                              seed_flat_array=seed_flat_array,
+                                              num_time_steps=num_time_steps,
+                                              random_seed=random_seed)
+
+    if probability_drift['max_probability_drift'] > max_probability_drift:
+        raise Exception("Maximum probability drift of " + str(probability_drift['max_probability_drift']) +
+                        " exceeds the allowed " + str(max_probability_drift) + ".")
+
+    return probability_drift
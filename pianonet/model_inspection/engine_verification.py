@@ -0,0 +1,175 @@
+import numpy as np
+
+from pianonet.core.misc_tools import get_random_generator
+from pianonet.generation.generation_engine import GenerationEngine
+from pianonet.generation.numpy_layers import get_layer_outputs
+
+
+def get_verification_seed_flat_arrays(num_keys, num_performances, num_seed_time_steps, note_probability=0.05,
+                                      random_seed=0):
+    """
+    Returns a list of num_performances random seed flat arrays of num_seed_time_steps time steps, in which each note is
+    played with probability note_probability.
+    """
+
+    random_generator = get_random_generator(random_seed)
+
+    return [random_generator.random(num_seed_time_steps * num_keys) < note_probability for i in
+            range(0, num_performances)]
+
+
+def get_fast_path_layer_output_indices(prepared_model):
+    """
+    Returns, for each fast path layer of prepared_model, the index in the list returned by get_layer_outputs of the
+    bundle layer output that the fast path layer's output corresponds to: the output of the last layer folded into it.
+    """
+
+    fast_path_layers = prepared_model.fast_path_layers
+    num_bundle_layers = len(prepared_model.model_bundle.layer_descriptions)
+
+    return [fast_path_layers[i + 1]['bundle_layer_index'] if (i + 1 < len(fast_path_layers)) else num_bundle_layers
+            for i in range(0, len(fast_path_layers))]
+
+
+def get_engine_recording(prepared_model, seed_flat_arrays, num_time_steps, random_seeds=None):
+    """
+    Generates num_time_steps time steps after each seed with a GenerationEngine, batching all seeds together, and
+    records the output of every fast path layer at every generated note. Returns a dictionary with:
+
+        sequences: Array of shape (B, S) of the model input padding, the seeds and the generated notes
+        first_generated_note_index: Index in sequences of the first generated note
+        layer_outputs: List with one array of shape (B, num_generated_notes, filters) per fast path layer
+
+    All seeds must have the same length.
+
+    prepared_model: PreparedModel instance to generate with
+    seed_flat_arrays: List of 1D arrays of seed note states, one per performance, each key aligned
+    num_time_steps: How many time steps to generate after each seed
+    random_seeds: Optional list of seeds, one per performance, for sampling
+    """
+
+    num_keys = prepared_model.num_keys
+    batch_size = len(seed_flat_arrays)
+    num_generated_notes = num_time_steps * num_keys
+
+    generation_engine = GenerationEngine(prepared_model=prepared_model,
+                                         seed_flat_arrays=seed_flat_arrays,
+                                         random_seeds=random_seeds)
+
+    padding = np.zeros((batch_size, prepared_model.num_notes_in_model_input - 1), dtype='float32')
+    seeds = np.array(seed_flat_arrays, dtype='float32').reshape(batch_size, -1)
+    generated_notes = np.zeros((batch_size, num_generated_notes), dtype='float32')
+
+    layer_outputs = [np.zeros((batch_size, num_generated_notes, layer['w_right'].shape[0]), dtype='float32') for
+                     layer in generation_engine.layers]
+
+    for note_index in range(0, num_generated_notes):
+        probabilities = generation_engine.get_next_probabilities()
+
+        for layer, layer_output in zip(generation_engine.layers, layer_outputs):
+            layer_output[:, note_index, :] = layer['output'].T
+
+        notes = generation_engine.sample_notes(probabilities, note_index % num_keys)
+        generated_notes[:, note_index] = notes
+        generation_engine.add_notes(notes)
+
+    return {
+        'sequences': np.concatenate([padding, seeds, generated_notes], axis=1),
+        'first_generated_note_index': padding.shape[1] + seeds.shape[1],
+        'layer_outputs': layer_outputs,
+    }
+
+
+def get_aligned_outputs(full_pass_output, sequence_length, first_generated_note_index, num_generated_notes):
+    """
+    Returns the time steps of a full forward pass layer output, of shape (B, T, channels), that line up with the
+    notes generated from first_generated_note_index on. Each generated note is predicted from the inputs before it, so
+    its outputs sit at the position of the preceding input.
+    """
+
+    offset = sequence_length - full_pass_output.shape[1]
+    start = first_generated_note_index - 1 - offset
+
+    return full_pass_output[:, start:start + num_generated_notes, :]
+
+
+def get_error_report(reference_outputs, outputs):
+    """
+    Returns a dictionary with the maximum and mean absolute difference of outputs from reference_outputs, and the
+    reference_scale, the largest absolute value of reference_outputs, against which the errors of unnormalized layers
+    can be judged.
+    """
+
+    reference_outputs = np.asarray(reference_outputs, dtype='float64')
+    errors = np.abs(np.asarray(outputs, dtype='float64') - reference_outputs)
+
+    return {
+        'max_error': float(np.max(errors)) if errors.size > 0 else 0.0,
+        'mean_error': float(np.mean(errors)) if errors.size > 0 else 0.0,
+        'reference_scale': float(np.max(np.abs(reference_outputs))) if reference_outputs.size > 0 else 0.0,
+    }
+
+
+def get_engine_errors(prepared_model, recording):
+    """
+    Compares an engine recording from get_engine_recording against a full causal forward pass of the prepared model's
+    bundle over the recorded sequences, run in one vectorized call. Returns a list with one dictionary per fast path
+    layer holding its name, bundle_layer_index, max_error, mean_error and reference_scale. The last entry is the note
+    probability.
+    """
+
+    sequences = recording['sequences']
+    first_generated_note_index = recording['first_generated_note_index']
+
+    full_pass_outputs = get_layer_outputs(model_bundle=prepared_model.model_bundle, input_windows=sequences)
+
+    layer_errors = []
+
+    for fast_path_layer_index, (output_index, layer_output) in enumerate(
+            zip(get_fast_path_layer_output_indices(prepared_model), recording['layer_outputs'])):
+        reference_outputs = get_aligned_outputs(full_pass_output=full_pass_outputs[output_index],
+                                                sequence_length=sequences.shape[1],
+                                                first_generated_note_index=first_generated_note_index,
+                                                num_generated_notes=layer_output.shape[1])
+
+        layer_error = {
+            'name': "conv_" + str(fast_path_layer_index),
+            'bundle_layer_index': output_index - 1,
+        }
+        layer_error.update(get_error_report(reference_outputs, layer_output))
+        layer_errors.append(layer_error)
+
+    return layer_errors
+
+
+def get_keras_errors(model, model_bundle, sequences):
+    """
+    Compares the full forward pass of every layer of the Keras model against the NumPy full forward pass of its bundle
+    over sequences, an array of shape (B, S), in one call each. Returns a list with one dictionary per bundle layer
+    holding its name, bundle_layer_index, max_error, mean_error and reference_scale.
+    """
+
+    from tensorflow.keras.models import Model
+
+    keras_layers = [layer for layer in model.layers if layer.__class__.__name__ != 'InputLayer']
+
+    intermediate_model = Model(inputs=model.inputs, outputs=[layer.output for layer in keras_layers])
+    keras_outputs = intermediate_model.predict(np.asarray(sequences, dtype='float32')[:, :, np.newaxis])
+
+    if not isinstance(keras_outputs, list):
+        keras_outputs = [keras_outputs]
+
+    numpy_outputs = get_layer_outputs(model_bundle=model_bundle, input_windows=sequences)[1:]
+
+    layer_errors = []
+
+    for bundle_layer_index, (keras_layer, keras_output, numpy_output) in enumerate(
+            zip(keras_layers, keras_outputs, numpy_outputs)):
+        # Causal layers keep their left padded outputs in Keras, which the NumPy pass leaves out
+        keras_output = keras_output[:, keras_output.shape[1] - numpy_output.shape[1]:, :]
+
+        layer_error = {'name': keras_layer.name, 'bundle_layer_index': bundle_layer_index}
+        layer_error.update(get_error_report(keras_output, numpy_output))
+        layer_errors.append(layer_error)
+
+    return layer_errors
@@ -1,42 +1,86 @@
-from tensorflow.keras.models import load_model
-
 from pianonet.core.note_array import NoteArray
 from pianonet.core.note_array_transformer import NoteArrayTransformer
-from pianonet.model_inspection.performance_tools import get_performance
+from pianonet.core.pianoroll import Pianoroll
+from pianonet.generation.generation_engine import get_performances_from_prepared_model
+from pianonet.generation.prepared_model import get_prepared_model
 
+PERFORMANCE_AVERSION_PARAMS_DICT = {
+    'probability_thresholds': [1.0, 1.0, 0.4, 0.05, 0.05, 0.05, 0.03, 0.03],
+}
 
-def get_performance_from_pianoroll(pianoroll_seed,
-                              num_time_steps,
-                              model_path):
+
+def get_seed_note_array_from_pianoroll(pianoroll_seed, prepared_model):
     """
-    Creates a performance starting from a pianoroll seed.
+    Returns the seed NoteArray for prepared_model made from pianoroll_seed, left padded with ten seconds of silence.
+    pianoroll_seed is padded in place.
     """
 
-    model = load_model(model_path)
-
-    aversion_params_dict = {
-        'probability_thresholds': [1.0, 1.0, 0.4, 0.05, 0.05, 0.05, 0.03, 0.03],
-    }
-
     note_array_transformer = NoteArrayTransformer(
-        min_key_index=31,
-        num_keys=72,
+        min_key_index=prepared_model.min_key_index,
+        num_keys=prepared_model.num_keys,
     )
 
     pianoroll = pianoroll_seed
     pianoroll.add_zero_padding(left_padding_timesteps=48 * 10)
-    seed_note_array = NoteArray(pianoroll=pianoroll, note_array_transformer=note_array_transformer)
 
-    final_note_array = get_performance(model=model,
-                    seed_note_array=seed_note_array,
-                    num_time_steps=num_time_steps,
-                    validation_fraction=0.0,
-                    use_edge_aversion=True,
-                    aversion_params_dict=aversion_params_dict,
-                    assume_elu=True)
+    return NoteArray(pianoroll=pianoroll, note_array_transformer=note_array_transformer)
+
+
+def get_seed_note_array_from_midi_file(seed_midi_file, prepared_model):
+    """
+    Returns the seed NoteArray for prepared_model made from a seed midi file, given as a path or as the bytes of the
+    file. The file is read with the custom multitrack and has its silence trimmed off both ends before the padding of
+    get_seed_note_array_from_pianoroll, so the server and batch generation give a seed the same conditioning window.
+
+    prepared_model: PreparedModel, or any object with the model's min_key_index and num_keys, such as a GenerationFarm
+    """
+
+    pianoroll = Pianoroll(seed_midi_file, use_custom_multitrack=True)
+    pianoroll.trim_silence_off_ends()
+
+    return get_seed_note_array_from_pianoroll(pianoroll_seed=pianoroll, prepared_model=prepared_model)
+
+
+def get_pianoroll_from_performance_note_array(final_note_array):
+    """
+    Returns the pianoroll of a generated performance's NoteArray with the silence trimmed off both ends.
+    """
 
     final_pianoroll = final_note_array.get_pianoroll()
 
     final_pianoroll.trim_silence_off_ends()
 
-    return final_pianoroll
\ No newline at end of file
+    return final_pianoroll
+
+
+def get_performance_from_pianoroll(pianoroll_seed,
+                              num_time_steps,
+                              model_path=None,
+                              random_seed=None,
+                              profiler=None,
+                              prepared_model=None):
+    """
+    Creates a performance starting from a pianoroll seed.
+
+    model_path: Path to a model bundle directory (see export_model_bundle.py) or a Keras SavedModel. Generation from a
+                model bundle never imports TensorFlow. The prepared model is loaded once per process and cached.
+    random_seed: Optional integer seed or numpy.random.Generator for sampling. The same seed, model and pianoroll seed
+                 always give the same performance. If None, sampling is seeded from system entropy.
+    profiler: Optional GenerationProfiler to record generation timings into
+    prepared_model: Optional PreparedModel to generate with instead of the model at model_path
+    """
+
+    if prepared_model == None:
+        prepared_model = get_prepared_model(model_path)
+
+    seed_note_array = get_seed_note_array_from_pianoroll(pianoroll_seed=pianoroll_seed, prepared_model=prepared_model)
+
+    final_note_array = get_performances_from_prepared_model(prepared_model=prepared_model,
+                                                            seed_note_arrays=[seed_note_array],
+                                                            num_time_steps_list=[num_time_steps],
+                                                            random_seeds=[random_seed],
+                                                            profiler=profiler,
+                                                            use_edge_aversion=True,
+                                                            aversion_params_dict=PERFORMANCE_AVERSION_PARAMS_DICT)[0]
+
+    return get_pianoroll_from_performance_note_array(final_note_array)
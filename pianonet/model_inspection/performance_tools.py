@@ -1,14 +1,26 @@
-import copy
-import math
-import random
 import time
-from collections import deque
 
 import numpy as np
-from scipy.linalg.blas import sgemm as matmul
-from tensorflow.keras import backend as K
 
-from pianonet.model_building.get_model_input_shape import get_model_input_shape
+from pianonet.generation.generation_engine import GenerationEngine, get_performances_from_prepared_model
+from pianonet.generation.model_bundle import ModelBundle
+from pianonet.generation.prepared_model import PreparedModel
+
+
+def get_prepared_keras_model(model, note_array_transformer):
+    """
+    Returns a PreparedModel holding the weights of the Keras model. Pass the result as the prepared_model argument of
+    get_performance or get_performances to pay the setup cost once when generating several performances.
+
+    model: The Keras trained model for generating the probabilities of new notes
+    note_array_transformer: NoteArrayTransformer instance of the model's input note arrays
+    """
+
+    model_bundle = ModelBundle.from_keras_model(model=model,
+                                                num_keys=note_array_transformer.num_keys,
+                                                min_key_index=note_array_transformer.min_key_index)
+
+    return PreparedModel(model_bundle=model_bundle)
 
 
 def get_performance(model,
@@ -17,152 +29,60 @@ def get_performance(model,
                     validation_fraction=0.0,
                     use_edge_aversion=False,
                     aversion_params_dict=None,
-                    assume_elu=False):
+                    assume_elu=False,
+                    prepared_model=None,
+                    random_seed=None):
     """
     Takes in a seed note array and generated num_timesteps of piano notes sampled
     from the model's output probabilities. A full NoteArray instance, including
     the seed note array data, is returned.
 
+    The model is run with the queue-based NumPy GenerationEngine, whose layer states live in preallocated ring
+    buffers, and the output is written into a preallocated boolean array.
+
     seed_note_array: Seed data for model input. If None, silence is used as the seed. NOTE! This note array is
                      assumed to have its keys properly aligned. That is, indices 0, num_keys, 2*num_keys, ...etc.
                      are at the starts of new time steps, and a full key state is between 0 and num keys, for
                      instance.
     model: The Keras trained model for generating the probabilities of new notes
     num_time_steps: How many new time steps of notes to generate using the model
-    validation_fraction: Float between 0 and 1 specifying the fraction of predicted notes for which the optimized
-                         model output will be randomly compared to the model.predict output every
-                         validation_step_size notes. Set to 0.0 for no validation (only necessary for debugging).
+    validation_fraction: Unused, kept for backwards compatibility. To check the engine against the model, run
+                         pianonet/scripts/verify_generation_engines.py, which compares every layer against a full
+                         forward pass in one call.
     use_edge_aversion: Boolean controlling whether or not to keep notes biased toward the middle of the output space.
                        This will tend to prevent the outputs from 'going over the edge', which can cause odd sounding
                        performances.
     aversion_params_dict: Params to control how strong edge aversion is
-    assume_elu: If true, optimize to use numpy based elu with alpha = 1 for internal hidden activations (2X faster)
+    assume_elu: Unused, kept for backwards compatibility. Hidden activations are always evaluated in NumPy.
+    prepared_model: Optional PreparedModel of model (see get_prepared_keras_model) to reuse across calls. If None, one
+                    is built from model.
+    random_seed: Optional integer seed or numpy.random.Generator for sampling. The same seed, model and seed note array
+                 always give the same performance. If None, sampling is seeded from system entropy.
     """
 
-    num_keys = seed_note_array.note_array_transformer.num_keys
-
-    num_notes_in_model_input = get_model_input_shape(model)
-
-    input_placeholder = model.input
-    output_placeholders = [layer.output for layer in model.layers]
-    functor = K.function([input_placeholder], output_placeholders)
-
-    input_data = seed_note_array.get_values_in_range(start_index=-num_notes_in_model_input,
-                                                     end_index=None,
-                                                     use_zero_padding_for_out_of_bounds=False)
-
-    layer_outputs = functor([np.array([input_data.reshape(-1, 1)])])
-
-    def get_initial_state_at(layer_index, num_states):
-        """
-        Get the num_states outputs from layer layer_index.
-        """
-
-        intermediate_output = layer_outputs[layer_index]
-        return [np.transpose([state]) for state in intermediate_output[0][-num_states - 1:-1]]
-
-    print("Initializing state queues.")
-
-    num_model_layers = len(model.layers)
-
-    initial_state_queues = []
-
-    for i in range(0, num_model_layers - 2):
-        layer = model.layers[i]
-
-        if (layer.name.find('conv1d') != -1) and (i > 1):
-            initial_state_queues.append(
-                deque(get_initial_state_at(layer_index=(i - 1), num_states=layer.dilation_rate[0])))
-        else:
-            initial_state_queues.append(None)
-
-    print("Resetting the state queues to the initial state (for a new performance).\n")
-    state_queues = copy.deepcopy(initial_state_queues)  # Only run when starting a new performance
-    output_data = seed_note_array.array.copy().tolist()
-
-    raw_input = deque(copy.deepcopy(output_data)[-num_notes_in_model_input:])
-    input_end_index = len(raw_input) - 1
-
-    # This assumes a kernel size of two
-    w_at_one = np.transpose(model.get_layer(index=1).get_weights()[0])
-    b_at_one = np.transpose([model.get_layer(index=1).get_weights()[1]])
-
-    saved_activation_functions = [None]
-    for i in range(1, num_model_layers):
-        saved_activation_functions.append(model.layers[i].activation)
-
-    saved_weight_entries = []
-    dilation_rates = []
-    for i in range(0, num_model_layers - 2):
-        node = model.layers[i]
-        dilation_rates.append(0)
-        if node.name.find('conv1d') != -1:
-            dilation_rates[-1] = node.dilation_rate[0]
-            weights = node.get_weights()
-            w = weights[0]
-            b = np.transpose([weights[1]])
-
-            w1 = np.transpose(w[0])
-            w2 = np.transpose(w[1])
-
-            saved_weight_entries.append({
-                'w1': w1,
-                'w2': w2,
-                'b': b,
-            }
-            )
-        else:
-            saved_weight_entries.append({})
+    note_array_transformer = seed_note_array.note_array_transformer
+    num_keys = note_array_transformer.num_keys
 
-    dilation_rates.append(model.layers[-2].dilation_rate[0])
+    if prepared_model == None:
+        prepared_model = get_prepared_keras_model(model=model, note_array_transformer=note_array_transformer)
 
-    final_layer = model.layers[num_model_layers - 2]
-    final_weights = final_layer.get_weights()
-    w_final = np.transpose(final_weights[0][0])
-    b_final = np.transpose(np.array([[final_weights[1]]]))
+    print("Initializing state buffers.")
 
-    def sigmoid(x):
-        return 1.0 / (1.0 + math.exp(-x))
-
-    def get_activated(x, layer_index):
-        if assume_elu:
-            return np.where(x > 0, x, (np.exp(x) - 1))
-        else:
-            activation_function = saved_activation_functions[layer_index + 1]
-            return activation_function(x)
-
-
-    def get_output(input_position):
-
-        inputs = np.transpose([raw_input[input_position - 1], raw_input[input_position]])
-
-        right_input = get_activated(matmul(1.0, w_at_one, inputs) + b_at_one, layer_index=1)
-
-        for layer_index in range(3, num_model_layers - 3, 2):
-
-            layer_state_queue = state_queues[layer_index]
-
-            w1 = saved_weight_entries[layer_index]['w1']
-            w2 = saved_weight_entries[layer_index]['w2']
-            b = saved_weight_entries[layer_index]['b']
-
-            left_input = layer_state_queue.popleft()
-            layer_state_queue.append(right_input)
-
-            right_input = matmul(1.0, w1, left_input) + matmul(1.0, w2, right_input) + b
-
-            right_input = get_activated(right_input, layer_index)
-
-        final_result = matmul(1.0, w_final, right_input) + b_final
-
-        final_result = sigmoid(final_result)  # this assumes sigmoid!
-
-        return final_result
+    generation_engine = GenerationEngine(prepared_model=prepared_model,
+                                         seed_flat_arrays=[seed_note_array.array],
+                                         random_seeds=[random_seed],
+                                         use_edge_aversion=use_edge_aversion,
+                                         aversion_params_dict=aversion_params_dict)
 
+    seed_length_in_notes = seed_note_array.get_length_in_notes()
 
+    output_data = np.zeros((seed_length_in_notes + num_time_steps * num_keys,), dtype='bool')
+    output_data[:seed_length_in_notes] = seed_note_array.array
 
     start = time.time()
 
+    generated_key_states = output_data[seed_length_in_notes:].reshape(num_time_steps, 1, num_keys)
+
     seconds = -1
     for time_step in range(0, num_time_steps):
 
@@ -170,41 +90,57 @@ def get_performance(model,
             seconds += 1
             print("==> Time step " + str(time_step) + " seconds of audio is " + str(seconds))
 
-        for key in range(0, num_keys):
-
-            probability_of_key_played = get_output(input_end_index)
-
-            if random.uniform(0.0, 1.0) < validation_fraction:
-                res_model = model.predict([[np.array(raw_input).reshape(1, -1)]])[0][-1]
+        generation_engine.generate_time_step(key_states=generated_key_states[time_step])
 
-                optimized_inconsistency_magnitude = abs(res_model - probability_of_key_played)
-                if optimized_inconsistency_magnitude > 1e-6:
-                    print("  Warning: Optimized output mode giving inconsistent results.")
-                    print("    Difference is " + str(optimized_inconsistency_magnitude))
+    end = time.time()
 
-            if use_edge_aversion:
-                distance_in_keys_from_edge = min(key, (num_keys - 1) - key)
+    print("\nTime per second of audio:", round((end - start) / (max(num_time_steps, 1) / 48), 3), "seconds")
 
-                if distance_in_keys_from_edge < len(aversion_params_dict['probability_thresholds']):
-                    probability_threshold = aversion_params_dict['probability_thresholds'][distance_in_keys_from_edge]
+    outputs_added = len(output_data) - seed_length_in_notes
 
-                    if probability_of_key_played < probability_threshold:
-                        probability_of_key_played = 0.0
+    print("Timesteps added:", outputs_added / num_keys)
 
-            prediction = (probability_of_key_played > random.uniform(0.0, 1.0))
-            output_data.append(prediction)
+    final_output_note_array = note_array_transformer.get_note_array(flat_array=output_data)
 
-            raw_input.popleft()
-            raw_input.append(prediction)
+    return final_output_note_array
 
-        end = time.time()
 
-    print("\nTime per second of audio:", round((end - start) / (num_time_steps / 48), 3), "seconds")
+def get_performances(model,
+                     seed_note_arrays,
+                     num_time_steps_list,
+                     random_seeds=None,
+                     use_edge_aversion=False,
+                     aversion_params_dict=None,
+                     prepared_model=None):
+    """
+    Batched version of get_performance. Advances len(seed_note_arrays) independent performances together so that each
+    layer step is a single (filters x B) matrix-matrix product instead of B matrix-vector products. A list of full
+    NoteArray instances, including the seed data, is returned in the same order as seed_note_arrays.
 
-    outputs_added = len(output_data) - seed_note_array.get_length_in_notes()
+    The Keras model's weights are copied into a PreparedModel and generation, including the seed warm-up, runs in the
+    NumPy GenerationEngine.
 
-    print("Timesteps added:", outputs_added / num_keys)
+    model: The Keras trained model for generating the probabilities of new notes
+    seed_note_arrays: List of seed NoteArray instances, one per performance. All must share the same num_keys and be
+                      key aligned as described in get_performance. Seeds shorter than the model input are left padded
+                      with silence.
+    num_time_steps_list: List of integers, how many new time steps to generate for each performance. A performance
+                         is dropped from the batch as soon as its time steps are generated.
+    random_seeds: Optional list of seeds, one per performance, for the independent random generators used in sampling.
+                  If None, each generator is seeded from system entropy.
+    use_edge_aversion: Boolean controlling whether or not to keep notes biased toward the middle of the output space.
+    aversion_params_dict: Params to control how strong edge aversion is
+    prepared_model: Optional PreparedModel of model (see get_prepared_keras_model) to reuse across calls. If None, one
+                    is built from model.
+    """
 
-    final_output_note_array = seed_note_array.note_array_transformer.get_note_array(flat_array=np.array(output_data))
+    if prepared_model == None:
+        prepared_model = get_prepared_keras_model(model=model,
+                                                  note_array_transformer=seed_note_arrays[0].note_array_transformer)
 
-    return final_output_note_array
+    return get_performances_from_prepared_model(prepared_model=prepared_model,
+                                                seed_note_arrays=seed_note_arrays,
+                                                num_time_steps_list=num_time_steps_list,
+                                                random_seeds=random_seeds,
+                                                use_edge_aversion=use_edge_aversion,
+                                                aversion_params_dict=aversion_params_dict)
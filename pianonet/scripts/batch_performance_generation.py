@@ -0,0 +1,235 @@
+###
+#
+# Usage: python batch_performance_generation.py /path/to/input/file.json /path/to/seed/midi/directory /path/to/output/directory
+#
+# Description: Script for generating performances from every seed midi file in a directory, in parallel across all
+#              cores. How to generate is specified in a json file with the parameters below:
+#
+#                   {
+#                       "model_path": "/path/to/model/bundle/or/keras/saved/model",
+#                       "num_seconds": 30,
+#                       "num_variations_per_seed": 4,
+#                       "random_seed": 0,
+#                       "use_edge_aversion": true,
+#                       "aversion_params_dict": {"probability_thresholds": [1.0, 1.0, 0.4, 0.05, 0.05, 0.05, 0.03, 0.03]},
+#                       "num_workers": null
+#                   }
+#
+#              Each performance is saved to
+#
+#                   /path/to/output/directory/seed_file_name_without_extension_variation_idx.midi
+#
+#              Seed midi files are read as the server reads uploaded seeds, so a seed gives the same performances here
+#              as through the server.
+#
+#              Performances whose output file already exists are skipped, so an interrupted run can be restarted with
+#              the same arguments and picks up where it stopped. The random seed of each performance is derived from
+#              random_seed, the seed file name and the variation index, so a restarted run generates the same
+#              performances as an uninterrupted one. num_workers defaults to the number of cores, and
+#              aversion_params_dict to the server's edge aversion params.
+#
+#              Performances are saved in the order they finish. A performance that fails, such as from an unreadable
+#              seed file, is reported and the others continue. The script then exits with status 1, and rerunning it
+#              retries only the failed performances.
+###
+
+import hashlib
+import json
+import os
+import queue
+import sys
+import time
+import traceback
+
+import numpy as np
+
+from pianonet.core.midi_tools import get_midi_file_paths_list
+from pianonet.core.note_array_transformer import NoteArrayTransformer
+from pianonet.generation.generation_farm import GenerationFarm
+from pianonet.model_inspection.performance_from_pianoroll import PERFORMANCE_AVERSION_PARAMS_DICT, \
+    get_seed_note_array_from_midi_file
+
+TIME_STEPS_PER_SECOND = 48
+
+
+def get_performance_random_seed(random_seed, seed_file_name, variation_index):
+    """
+    Returns the integer random seed of one performance, derived from the run's random_seed, the seed file name and the
+    variation index so that it does not depend on the order performances are generated in.
+    """
+
+    seed_string = str(random_seed) + " " + seed_file_name + " " + str(variation_index)
+
+    return int(hashlib.md5(seed_string.encode('utf-8')).hexdigest()[:16], 16)
+
+
+def get_done_job_callbacks(job, done_jobs_queue):
+    """
+    Returns the callback and error_callback for submitting job to a GenerationFarm, which put a tuple of job, its
+    generated flat array and None, or of job, None and the exception that failed it, on done_jobs_queue.
+    """
+
+    return (lambda generated_flat_array: done_jobs_queue.put((job, generated_flat_array, None)),
+            lambda exception: done_jobs_queue.put((job, None, exception)))
+
+
+def save_performance(job, generated_flat_array, note_array_transformer):
+    """
+    Saves the performance of job, its seed followed by generated_flat_array, to the job's output file.
+    """
+
+    seed_note_array = job['seed_note_array']
+
+    final_note_array = note_array_transformer.get_note_array(
+        flat_array=np.concatenate([seed_note_array.array.astype('bool'), generated_flat_array]))
+
+    final_pianoroll = final_note_array.get_pianoroll()
+    final_pianoroll.trim_silence_off_ends()
+
+    # Written under a temporary name first, so that an interrupted write is not mistaken for a finished one
+    partial_output_file_path = os.path.splitext(job['output_file_path'])[0] + "_partial.midi"
+    final_pianoroll.save_to_midi_file(partial_output_file_path)
+    os.replace(partial_output_file_path, job['output_file_path'])
+
+
+def main():
+    arguments = sys.argv
+
+    if len(arguments) != 4:
+        print("Rerun with the proper arguments. Example usage:\n")
+        print(" $ python batch_performance_generation.py /path/to/input/file.json /path/to/seed/midi/directory " +
+              "/path/to/output/directory/")
+        print()
+        return
+
+    input_json_file_path = sys.argv[1]
+    seed_directory_path = sys.argv[2]
+    output_directory_path = sys.argv[3]
+
+    with open(input_json_file_path, 'rb') as json_file:
+        custom_parameters = json.load(json_file)
+
+    print("\nGenerating performances using the following parameters:\n")
+    for k, v in custom_parameters.items():
+        print("\t" + str(k) + ": " + str(v))
+
+    model_path = custom_parameters['model_path']
+    num_time_steps = int(custom_parameters['num_seconds'] * TIME_STEPS_PER_SECOND)
+    num_variations_per_seed = custom_parameters['num_variations_per_seed']
+    random_seed = custom_parameters['random_seed']
+    use_edge_aversion = custom_parameters.get('use_edge_aversion', True)
+    aversion_params_dict = custom_parameters.get('aversion_params_dict', PERFORMANCE_AVERSION_PARAMS_DICT)
+    num_workers = custom_parameters.get('num_workers', None)
+
+    if not os.path.exists(output_directory_path):
+        os.makedirs(output_directory_path)
+
+    seed_midi_file_paths_list = sorted(get_midi_file_paths_list(seed_directory_path))
+
+    jobs = []
+    num_finished_performances = 0
+
+    for seed_midi_file_path in seed_midi_file_paths_list:
+        seed_file_name = os.path.basename(seed_midi_file_path)
+
+        for variation_index in range(0, num_variations_per_seed):
+            output_file_path = os.path.join(output_directory_path, os.path.splitext(seed_file_name)[0] + "_variation_" +
+                                            str(variation_index) + ".midi")
+
+            if os.path.exists(output_file_path):
+                num_finished_performances += 1
+                continue
+
+            jobs.append({
+                'seed_midi_file_path': seed_midi_file_path,
+                'output_file_path': output_file_path,
+                'random_seed': get_performance_random_seed(random_seed, seed_file_name, variation_index),
+            })
+
+    print("\nFound " + str(len(seed_midi_file_paths_list)) + " seed midi files. " + str(num_finished_performances) +
+          " performances are already finished and " + str(len(jobs)) + " remain.")
+
+    if len(jobs) == 0:
+        return
+
+    start = time.time()
+
+    # Each done job is put here, with its generated flat array or the exception that failed it, by the pool's result
+    # thread, so that performances are saved in the order they finish
+    done_jobs_queue = queue.Queue()
+    failed_jobs = []
+    num_submitted_jobs = 0
+    num_saved_jobs = 0
+
+    with GenerationFarm(model_path=model_path, num_workers=num_workers) as generation_farm:
+        note_array_transformer = NoteArrayTransformer(min_key_index=generation_farm.min_key_index,
+                                                      num_keys=generation_farm.num_keys)
+        seed_note_arrays = {}
+
+        for job in jobs:
+            seed_midi_file_path = job['seed_midi_file_path']
+
+            try:
+                if seed_midi_file_path not in seed_note_arrays:
+                    seed_note_arrays[seed_midi_file_path] = get_seed_note_array_from_midi_file(
+                        seed_midi_file=seed_midi_file_path, prepared_model=generation_farm)
+
+                job['seed_note_array'] = seed_note_arrays[seed_midi_file_path]
+                callback, error_callback = get_done_job_callbacks(job=job, done_jobs_queue=done_jobs_queue)
+
+                generation_farm.submit_performance(seed_note_array=job['seed_note_array'],
+                                                   num_time_steps=num_time_steps,
+                                                   random_seed=job['random_seed'],
+                                                   use_edge_aversion=use_edge_aversion,
+                                                   aversion_params_dict=aversion_params_dict,
+                                                   callback=callback,
+                                                   error_callback=error_callback)
+            except Exception as exception:
+                print("==> Failed to read the seed of " + job['output_file_path'] + ": " + repr(exception))
+                failed_jobs.append(job)
+                continue
+
+            num_submitted_jobs += 1
+
+        for i in range(0, num_submitted_jobs):
+            job, generated_flat_array, exception = done_jobs_queue.get()
+
+            if exception == None:
+                try:
+                    save_performance(job=job,
+                                     generated_flat_array=generated_flat_array,
+                                     note_array_transformer=note_array_transformer)
+                except Exception as save_exception:
+                    traceback.print_exc()
+                    exception = save_exception
+
+            elapsed_time = str(round(time.time() - start, 1))
+
+            if exception != None:
+                print("==> Failed " + job['output_file_path'] + " after " + elapsed_time + " seconds: " +
+                      repr(exception))
+                failed_jobs.append(job)
+            else:
+                num_saved_jobs += 1
+                print("==> Finished " + str(num_saved_jobs) + " of " + str(num_submitted_jobs) +
+                      " performances in " + elapsed_time + " seconds: " + job['output_file_path'])
+
+    end = time.time()
+
+    num_generated_performances = len(jobs) - len(failed_jobs)
+    total_seconds_of_audio = num_generated_performances * num_time_steps / TIME_STEPS_PER_SECOND
+
+    print("\nGenerated " + str(num_generated_performances) + " performances (" + str(round(total_seconds_of_audio, 1)) +
+          " seconds of audio) in " + str(round(end - start, 1)) + " seconds.")
+    print("Throughput: " + str(round(total_seconds_of_audio / (end - start), 3)) + " seconds of audio per second, " +
+          str(round(60.0 * num_generated_performances / (end - start), 3)) + " performances per minute.")
+
+    if len(failed_jobs) != 0:
+        print("\n" + str(len(failed_jobs)) + " performances failed. Rerun with the same arguments to retry them:")
+        for job in failed_jobs:
+            print("\t" + job['output_file_path'])
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+###
+#
+# Usage: python export_model_bundle.py /path/to/keras/saved/model /path/to/output/bundle/directory [min_key_index num_keys [weight_precision]]
+#
+# Description: Script for exporting a trained Keras model to a TensorFlow-free model bundle. The bundle directory will
+#              contain a JSON manifest (model_bundle.json) of the layers' dilations, kernel sizes and activations as
+#              well as num_keys and min_key_index, and an npz file (model_bundle_weights.npz) of the layer weights.
+#
+#              min_key_index and num_keys default to 31 and 72, the values used by the shipped models.
+#
+#              weight_precision (float32, float16 or int8, default float32) sets the precision the conv kernels are
+#              stored and generated in. For reduced precisions, the probability drift from the float32 model is measured
+#              over generation after a ten second reference seed of random notes, and the export fails if it exceeds
+#              the allowed drift.
+###
+
+import sys
+
+from tensorflow.keras.models import load_model
+
+from pianonet.generation.model_bundle import ModelBundle, get_quantized_model_bundle
+from pianonet.generation.prepared_model import PreparedModel
+from pianonet.generation.probability_drift import DEFAULT_MAX_PROBABILITY_DRIFT, check_probability_drift
+from pianonet.model_inspection.engine_verification import get_verification_seed_flat_arrays
+
+NUM_DRIFT_CHECK_SEED_TIME_STEPS = 480
+NUM_DRIFT_CHECK_TIME_STEPS = 96
+
+
+def main():
+    arguments = sys.argv
+
+    if len(arguments) not in (3, 5, 6):
+        print("Rerun with the proper arguments. Example usage:\n")
+        print(" $ python export_model_bundle.py /path/to/keras/saved/model /path/to/output/bundle/directory 31 72 int8")
+        print()
+        return
+
+    model_path = arguments[1]
+    bundle_directory_path = arguments[2]
+
+    if len(arguments) >= 5:
+        min_key_index = int(arguments[3])
+        num_keys = int(arguments[4])
+    else:
+        min_key_index = 31
+        num_keys = 72
+
+    weight_precision = arguments[5] if len(arguments) == 6 else 'float32'
+
+    print("Loading Keras model at " + model_path)
+    model = load_model(model_path)
+
+    model_bundle = ModelBundle.from_keras_model(model=model, num_keys=num_keys, min_key_index=min_key_index)
+
+    if weight_precision != 'float32':
+        reference_prepared_model = PreparedModel(model_bundle=model_bundle)
+        model_bundle = get_quantized_model_bundle(model_bundle=model_bundle, weight_precision=weight_precision)
+
+        print("Checking probability drift of the " + weight_precision + " model over " +
+              str(NUM_DRIFT_CHECK_TIME_STEPS) + " time steps")
+        seed_flat_array = get_verification_seed_flat_arrays(num_keys=num_keys,
+                                                            num_performances=1,
+                                                            num_seed_time_steps=NUM_DRIFT_CHECK_SEED_TIME_STEPS)[0]
+        probability_drift = check_probability_drift(reference_prepared_model=reference_prepared_model,
+                                                    prepared_model=PreparedModel(model_bundle=model_bundle),
+                                                    seed_flat_array=seed_flat_array,
+                                                    num_time_steps=NUM_DRIFT_CHECK_TIME_STEPS,
+                                                    max_probability_drift=DEFAULT_MAX_PROBABILITY_DRIFT)
+        print("Maximum probability drift: " + str(probability_drift['max_probability_drift']) +
+              ", mean probability drift: " + str(probability_drift['mean_probability_drift']))
+
+    print("Saving model bundle with " + '{:,}'.format(model_bundle.get_num_parameters()) + " parameters to " +
+          bundle_directory_path)
+    model_bundle.save(bundle_directory_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,338 @@
+###
+#
+# Usage: python generation_benchmark.py /path/to/models/directory /path/to/output/results.json [/path/to/baseline.json regression_threshold]
+#
+# Description: Benchmark of performance generation for each of the shipped models found in the models directory
+#              (micro_1, r5p3, r8p9 and r9p0, as model bundles or Keras SavedModels) and each engine mode:
+#
+#                   queue:    GenerationEngine with one performance
+#                   batched:  GenerationEngine advancing BATCHED_BATCH_SIZE performances together
+#                   float16:  GenerationEngine with one performance on the model with float16 kernels
+#                   int8:     GenerationEngine with one performance on the model with int8 kernels
+#                   farm:     GenerationFarm with one performance per core
+#
+#              The float16 and int8 modes hold and read the model's kernels in reduced precision. Their models are
+#              converted from the float32 model at startup, so their peak memory still includes the float32 model.
+#
+#              Every case runs in a fresh process with fixed seeds and records:
+#
+#                   startup_seconds:     loading and preparing the model (creating the worker pool for farm, whose
+#                                        workers finish starting up during the generation time)
+#                   warm_up_seconds:     building the engine from a ten second seed (not measured for farm)
+#                   notes_per_second:    generated notes per second, summed over all performances
+#                   realtime_factor:     seconds of audio generated per second
+#                   peak_rss_megabytes:  peak resident memory of the benchmark process (workers excluded for farm)
+#                   weight_megabytes:    memory held by the prepared model's weights (not measured for farm)
+#
+#              Models holding neither a model bundle nor a SavedModel are skipped. A case whose process fails or runs
+#              longer than CASE_TIMEOUT_IN_SECONDS is recorded as failed, and the script exits with status 1 after the
+#              remaining cases.
+#
+#              The results are saved as JSON. If a baseline results file is given, each case is compared against it,
+#              and the script exits with status 1 if any measurement is worse than the baseline by more than
+#              regression_threshold (a fraction, default 0.1).
+###
+
+import multiprocessing
+import os
+import platform
+import queue
+import resource
+import sys
+import time
+
+import numpy as np
+
+from pianonet.core.misc_tools import load_dictionary_from_json_file, save_dictionary_to_json_file
+from pianonet.core.note_array_transformer import NoteArrayTransformer
+from pianonet.generation.generation_engine import GenerationEngine
+from pianonet.generation.generation_farm import GenerationFarm
+from pianonet.generation.model_bundle import get_quantized_model_bundle, is_model_bundle, load_model_bundle
+from pianonet.generation.prepared_model import PreparedModel
+from pianonet.model_inspection.engine_verification import get_verification_seed_flat_arrays
+
+MODEL_NAMES = ('micro_1', 'r5p3_300kparams_4_blocks_12_12_12_12_model',
+               'r8p9_1300kparams_6_blocks_11_12_12_12_13_13_model', 'r9p0_3500kparams_approx_9_blocks_model')
+ENGINE_MODES = ('queue', 'batched', 'float16', 'int8', 'farm')
+
+BATCHED_BATCH_SIZE = 8
+NUM_SEED_TIME_STEPS = 480
+NUM_BENCHMARK_TIME_STEPS = 96
+DEFAULT_REGRESSION_THRESHOLD = 0.1
+CASE_TIMEOUT_IN_SECONDS = 1800.0
+RESULT_POLL_INTERVAL_IN_SECONDS = 1.0
+
+# Measurements where a larger value is better. For all others, smaller is better.
+HIGHER_IS_BETTER_MEASUREMENTS = ('notes_per_second', 'realtime_factor')
+COMPARED_MEASUREMENTS = ('startup_seconds', 'warm_up_seconds', 'notes_per_second', 'realtime_factor',
+                         'peak_rss_megabytes', 'weight_megabytes')
+
+
+def get_peak_rss_megabytes():
+    """
+    Returns the peak resident set size of this process in megabytes.
+    """
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes and macOS bytes
+    return peak_rss / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak_rss / 1024.0
+
+
+def run_engine_benchmark(model_path, engine_mode):
+    """
+    Runs one benchmark case in the current process and returns its measurements.
+    """
+
+    start = time.time()
+
+    model_bundle = load_model_bundle(model_path)
+
+    if engine_mode in ('float16', 'int8'):
+        model_bundle = get_quantized_model_bundle(model_bundle=model_bundle, weight_precision=engine_mode)
+
+    prepared_model = PreparedModel(model_bundle=model_bundle)
+
+    startup_seconds = time.time() - start
+
+    batch_size = BATCHED_BATCH_SIZE if engine_mode == 'batched' else 1
+    seed_flat_arrays = get_verification_seed_flat_arrays(num_keys=prepared_model.num_keys,
+                                                         num_performances=batch_size,
+                                                         num_seed_time_steps=NUM_SEED_TIME_STEPS)
+
+    start = time.time()
+
+    generation_engine = GenerationEngine(prepared_model=prepared_model,
+                                         seed_flat_arrays=seed_flat_arrays,
+                                         random_seeds=list(range(0, batch_size)))
+
+    warm_up_seconds = time.time() - start
+
+    key_states = np.zeros((batch_size, prepared_model.num_keys), dtype='bool')
+
+    start = time.time()
+
+    for time_step in range(0, NUM_BENCHMARK_TIME_STEPS):
+        generation_engine.generate_time_step(key_states=key_states)
+
+    generation_seconds = time.time() - start
+
+    return {
+        'startup_seconds': startup_seconds,
+        'warm_up_seconds': warm_up_seconds,
+        'notes_per_second': batch_size * NUM_BENCHMARK_TIME_STEPS * prepared_model.num_keys / generation_seconds,
+        'realtime_factor': batch_size * NUM_BENCHMARK_TIME_STEPS / 48.0 / generation_seconds,
+        'peak_rss_megabytes': get_peak_rss_megabytes(),
+        'weight_megabytes': prepared_model.get_memory_size_in_bytes() / (1024.0 * 1024.0),
+    }
+
+
+def run_farm_benchmark(model_path):
+    """
+    Runs the farm benchmark case, one performance per core, in the current process and returns its measurements.
+    """
+
+    num_workers = multiprocessing.cpu_count()
+
+    start = time.time()
+
+    with GenerationFarm(model_path=model_path, num_workers=num_workers) as generation_farm:
+        startup_seconds = time.time() - start
+
+        note_array_transformer = NoteArrayTransformer(min_key_index=generation_farm.min_key_index,
+                                                      num_keys=generation_farm.num_keys)
+        seed_note_arrays = [note_array_transformer.get_note_array(flat_array=seed_flat_array) for seed_flat_array in
+                            get_verification_seed_flat_arrays(num_keys=generation_farm.num_keys,
+                                                              num_performances=num_workers,
+                                                              num_seed_time_steps=NUM_SEED_TIME_STEPS)]
+
+        start = time.time()
+
+        generation_farm.get_performances(seed_note_arrays=seed_note_arrays,
+                                         num_time_steps_list=[NUM_BENCHMARK_TIME_STEPS] * num_workers,
+                                         random_seeds=list(range(0, num_workers)))
+
+        generation_seconds = time.time() - start
+
+    return {
+        'startup_seconds': startup_seconds,
+        'warm_up_seconds': None,
+        'notes_per_second': num_workers * NUM_BENCHMARK_TIME_STEPS * generation_farm.num_keys / generation_seconds,
+        'realtime_factor': num_workers * NUM_BENCHMARK_TIME_STEPS / 48.0 / generation_seconds,
+        'peak_rss_megabytes': get_peak_rss_megabytes(),
+        'weight_megabytes': None,
+    }
+
+
+def run_benchmark_case(result_queue, model_path, engine_mode):
+    """
+    Runs one benchmark case and puts its measurements on result_queue. Called in a fresh process, so that startup time
+    and peak memory are not affected by earlier cases.
+    """
+
+    if engine_mode == 'farm':
+        result_queue.put(run_farm_benchmark(model_path))
+    else:
+        result_queue.put(run_engine_benchmark(model_path, engine_mode))
+
+
+def get_case_measurements(result_queue, benchmark_process):
+    """
+    Waits for benchmark_process to put its measurements on result_queue and exit, and returns the measurements.
+    Returns None if the process exits without putting them, such as when it crashes, or if it runs longer than
+    CASE_TIMEOUT_IN_SECONDS, in which case it is terminated.
+    """
+
+    deadline = time.time() + CASE_TIMEOUT_IN_SECONDS
+    measurements = None
+
+    while measurements == None:
+        try:
+            measurements = result_queue.get(timeout=RESULT_POLL_INTERVAL_IN_SECONDS)
+        except queue.Empty:
+            if not benchmark_process.is_alive():
+                # The process may have put its measurements just before exiting
+                try:
+                    measurements = result_queue.get(timeout=RESULT_POLL_INTERVAL_IN_SECONDS)
+                except queue.Empty:
+                    break
+            elif time.time() > deadline:
+                print("Benchmark case exceeded " + str(CASE_TIMEOUT_IN_SECONDS) + " seconds, terminating it")
+                benchmark_process.terminate()
+                break
+
+    benchmark_process.join()
+
+    if (measurements == None) or (benchmark_process.exitcode != 0):
+        print("Benchmark case failed with exit code " + str(benchmark_process.exitcode))
+        return None
+
+    return measurements
+
+
+def get_regressions(results, baseline_results, regression_threshold):
+    """
+    Returns a list of strings describing each measurement of results that is worse than the matching measurement of
+    baseline_results by more than the fraction regression_threshold.
+    """
+
+    baseline_cases = {(case['model_name'], case['engine_mode']): case for case in baseline_results['cases']}
+    regressions = []
+
+    for case in results['cases']:
+        baseline_case = baseline_cases.get((case['model_name'], case['engine_mode']))
+
+        if baseline_case == None:
+            continue
+
+        for measurement_name in COMPARED_MEASUREMENTS:
+            value = case.get(measurement_name)
+            baseline_value = baseline_case.get(measurement_name)
+
+            if (value == None) or (baseline_value == None):
+                continue
+
+            if measurement_name in HIGHER_IS_BETTER_MEASUREMENTS:
+                regressed = value < baseline_value * (1.0 - regression_threshold)
+            else:
+                regressed = value > baseline_value * (1.0 + regression_threshold)
+
+            if regressed:
+                regressions.append(case['model_name'] + " " + case['engine_mode'] + " " + measurement_name + ": " +
+                                   str(round(value, 4)) + " versus baseline " + str(round(baseline_value, 4)))
+
+    return regressions
+
+
+def main():
+    arguments = sys.argv
+
+    if len(arguments) not in (3, 4, 5):
+        print("Rerun with the proper arguments. Example usage:\n")
+        print(" $ python generation_benchmark.py /path/to/models/directory /path/to/output/results.json " +
+              "/path/to/baseline.json 0.1")
+        print()
+        return
+
+    models_directory_path = arguments[1]
+    results_file_path = arguments[2]
+    baseline_file_path = arguments[3] if len(arguments) >= 4 else None
+    regression_threshold = float(arguments[4]) if len(arguments) == 5 else DEFAULT_REGRESSION_THRESHOLD
+
+    results = {
+        'machine': {
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': multiprocessing.cpu_count(),
+            'python_version': platform.python_version(),
+            'numpy_version': np.__version__,
+        },
+        'num_benchmark_time_steps': NUM_BENCHMARK_TIME_STEPS,
+        'cases': [],
+    }
+
+    context = multiprocessing.get_context('spawn')
+    failed_cases = []
+
+    for model_name in MODEL_NAMES:
+        model_path = os.path.join(models_directory_path, model_name)
+
+        if not os.path.exists(model_path):
+            print("Skipping " + model_name + ", not found at " + model_path)
+            continue
+
+        if not (is_model_bundle(model_path) or os.path.isfile(os.path.join(model_path, 'saved_model.pb'))):
+            print("Skipping " + model_name + ", no model bundle or SavedModel at " + model_path)
+            continue
+
+        for engine_mode in ENGINE_MODES:
+            print("==> Benchmarking " + model_name + " with the " + engine_mode + " engine")
+
+            # A regular (non daemon) process, since the farm case starts worker processes of its own
+            result_queue = context.Queue()
+            benchmark_process = context.Process(target=run_benchmark_case,
+                                                args=(result_queue, model_path, engine_mode))
+            benchmark_process.start()
+            case = get_case_measurements(result_queue=result_queue, benchmark_process=benchmark_process)
+
+            if case == None:
+                case = {measurement_name: None for measurement_name in COMPARED_MEASUREMENTS}
+                case['failed'] = True
+                failed_cases.append(model_name + " " + engine_mode)
+
+            case['model_name'] = model_name
+            case['engine_mode'] = engine_mode
+            results['cases'].append(case)
+
+            print("\t" + ", ".join([measurement_name + ": " + ("-" if case[measurement_name] == None else
+                                                               str(round(case[measurement_name], 4)))
+                                    for measurement_name in COMPARED_MEASUREMENTS]))
+
+    print("\nSaving benchmark results to " + results_file_path)
+    save_dictionary_to_json_file(results, results_file_path)
+
+    regressions = []
+
+    if baseline_file_path != None:
+        regressions = get_regressions(results=results,
+                                      baseline_results=load_dictionary_from_json_file(baseline_file_path),
+                                      regression_threshold=regression_threshold)
+
+        if len(regressions) != 0:
+            print("\nRegressions beyond " + str(regression_threshold) + " of the baseline:")
+            for regression in regressions:
+                print("\t" + regression)
+        else:
+            print("\nNo regressions beyond " + str(regression_threshold) + " of the baseline.")
+
+    if len(failed_cases) != 0:
+        print("\nFailed benchmark cases:")
+        for failed_case in failed_cases:
+            print("\t" + failed_case)
+
+    if (len(regressions) != 0) or (len(failed_cases) != 0):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,14 +10,17 @@
 #                   /path/to/output/directory/prefix_name_in_json_{training, validation, full}_idx.mna_jl
 #
 #              where idx is a counter updated to the next unique integer to avoid overwriting.
+#
+#              An optional integer random_seed in the json file makes the split, augmentations and shuffling
+#              reproducible. If it is missing, they are seeded from system entropy.
 ###
 
 import json
 import os
-import random
 import sys
 
 from pianonet.core.midi_tools import get_midi_file_paths_list
+from pianonet.core.misc_tools import get_random_generator
 from pianonet.core.note_array_transformer import NoteArrayTransformer
 from pianonet.training_utils.master_note_array import MasterNoteArray
 
@@ -59,6 +62,8 @@ def main():
     validation_fraction = custom_parameters['validation_fraction']
     training_fraction = 1.0 - validation_fraction
 
+    random_generator = get_random_generator(custom_parameters.get('random_seed', None))
+
     midi_file_paths_list = []
 
     for path_to_directory_of_midi_files in paths_to_directories_of_midi_files:
@@ -74,7 +79,9 @@ def main():
 
     using_validation_set = (validation_midi_files_count != 0)
 
-    random.shuffle(midi_file_paths_list)
+    # Sorted first so that the shuffle only depends on the seed, not on the directory listing order
+    midi_file_paths_list = sorted(midi_file_paths_list)
+    random_generator.shuffle(midi_file_paths_list)
 
     midi_file_paths_split = {
         'training': midi_file_paths_list[0:training_midi_files_count],
@@ -102,6 +109,7 @@ def main():
             stretch_range=stretch_range,
             end_padding_range_in_seconds=end_padding_range_in_seconds,
             time_steps_crop_range=time_steps_crop_range,
+            random_seed=random_generator,
         )
 
         i = 0
@@ -0,0 +1,142 @@
+###
+#
+# Usage: python verify_generation_engines.py /path/to/model [num_time_steps tolerance]
+#
+# Description: Script for checking that every generation engine computes what the model computes. Each engine
+#              generates num_time_steps time steps (default 48) after fixed random seeds while the output of every
+#              layer is recorded at each note. The recorded outputs are then compared against a single full causal
+#              forward pass over the same generated sequences, and the max and mean error of each layer is printed.
+#
+#              Engines checked:
+#
+#                   queue:    the queue-based NumPy GenerationEngine with one performance
+#                   batched:  the same engine advancing several performances together
+#                   float16:  the engine on the model with float16 kernels (see export_model_bundle.py)
+#                   int8:     the engine on the model with int8 kernels
+#                   keras:    when the model is a Keras SavedModel, its layers against the NumPy full forward pass
+#
+#              Reduced precision engines are compared against the full forward pass of the same reduced precision
+#              model. Their drift from the float32 model is checked when exporting them.
+#
+#              The script exits with status 1 if any layer's max error exceeds its allowed error. For the note
+#              probabilities output by the last layer this is tolerance (default 1e-4). Hidden layer activations are
+#              not normalized and their float32 rounding errors grow with their magnitude, so for them it is
+#              tolerance times the layer's largest absolute reference value, or tolerance if that is below one.
+###
+
+import sys
+
+from pianonet.generation.model_bundle import get_quantized_model_bundle, is_model_bundle, load_model_bundle
+from pianonet.generation.prepared_model import PreparedModel
+from pianonet.model_inspection.engine_verification import get_engine_errors, get_engine_recording, \
+    get_keras_errors, get_verification_seed_flat_arrays
+
+NUM_SEED_TIME_STEPS = 96
+NUM_BATCHED_PERFORMANCES = 4
+
+
+def get_allowed_error(layer_error, is_output_layer, tolerance):
+    """
+    Returns the largest max error allowed for a layer: tolerance for the output layer's note probabilities, and
+    tolerance relative to the layer's reference_scale, if above one, for hidden layers.
+    """
+
+    if is_output_layer:
+        return tolerance
+
+    return tolerance * max(1.0, layer_error['reference_scale'])
+
+
+def print_layer_errors(engine_name, layer_errors, tolerance):
+    """
+    Prints the max and mean error of each layer and returns true if all max errors are within their allowed errors.
+    The last of layer_errors is the output layer.
+    """
+
+    print("\n" + engine_name + ":")
+
+    all_within_tolerance = True
+
+    for layer_index, layer_error in enumerate(layer_errors):
+        allowed_error = get_allowed_error(layer_error=layer_error,
+                                          is_output_layer=(layer_index == len(layer_errors) - 1),
+                                          tolerance=tolerance)
+        within_tolerance = layer_error['max_error'] <= allowed_error
+        all_within_tolerance = all_within_tolerance and within_tolerance
+
+        print(("\t{name:<24} layer {bundle_layer_index:>3}   max error {max_error:.3e}   mean error {mean_error:.3e}" +
+               "   allowed {allowed_error:.3e}").format(allowed_error=allowed_error, **layer_error) +
+              ("" if within_tolerance else "   FAILED"))
+
+    return all_within_tolerance
+
+
+def main():
+    arguments = sys.argv
+
+    if len(arguments) not in (2, 4):
+        print("Rerun with the proper arguments. Example usage:\n")
+        print(" $ python verify_generation_engines.py /path/to/model 48 1e-4")
+        print()
+        return
+
+    model_path = arguments[1]
+
+    if len(arguments) == 4:
+        num_time_steps = int(arguments[2])
+        tolerance = float(arguments[3])
+    else:
+        num_time_steps = 48
+        tolerance = 1e-4
+
+    model_bundle = load_model_bundle(model_path)
+    num_keys = model_bundle.num_keys
+
+    print("Verifying generation engines of " + model_path + " over " + str(num_time_steps) + " time steps with " +
+          "tolerance " + str(tolerance))
+
+    engine_configurations = [
+        ('queue', model_bundle, 1),
+        ('batched', model_bundle, NUM_BATCHED_PERFORMANCES),
+        ('float16', get_quantized_model_bundle(model_bundle=model_bundle, weight_precision='float16'), 1),
+        ('int8', get_quantized_model_bundle(model_bundle=model_bundle, weight_precision='int8'), 1),
+    ]
+
+    all_within_tolerance = True
+    recorded_sequences = None
+
+    for engine_name, engine_model_bundle, num_performances in engine_configurations:
+        prepared_model = PreparedModel(model_bundle=engine_model_bundle)
+
+        seed_flat_arrays = get_verification_seed_flat_arrays(num_keys=num_keys,
+                                                             num_performances=num_performances,
+                                                             num_seed_time_steps=NUM_SEED_TIME_STEPS)
+
+        recording = get_engine_recording(prepared_model=prepared_model,
+                                         seed_flat_arrays=seed_flat_arrays,
+                                         num_time_steps=num_time_steps,
+                                         random_seeds=list(range(0, num_performances)))
+
+        if recorded_sequences is None:
+            recorded_sequences = recording['sequences']
+
+        layer_errors = get_engine_errors(prepared_model=prepared_model, recording=recording)
+        all_within_tolerance = print_layer_errors(engine_name, layer_errors, tolerance) and all_within_tolerance
+
+    if not is_model_bundle(model_path):
+        from tensorflow.keras.models import load_model
+
+        layer_errors = get_keras_errors(model=load_model(model_path),
+                                        model_bundle=model_bundle,
+                                        sequences=recorded_sequences)
+        all_within_tolerance = print_layer_errors('keras', layer_errors, tolerance) and all_within_tolerance
+
+    if all_within_tolerance:
+        print("\nAll engines are within tolerance.")
+    else:
+        print("\nSome engines exceed the tolerance.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,26 @@
+import base64
+import json
+import math
 import os
 import random
+import threading
+import time
 
-from flask import Flask, request, send_from_directory
+import numpy as np
+
+from flask import Flask, Response, g, request
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
 from werkzeug.utils import secure_filename
 
-from pianonet.core.pianoroll import Pianoroll
-from pianonet.model_inspection.performance_from_pianoroll import get_performance_from_pianoroll
+from pianonet.core.midi_event_encoder import MidiEventEncoder
+from pianonet.generation.generation_engine import get_performances_from_prepared_model, get_state_size_in_bytes
+from pianonet.generation.generation_profiler import GenerationProfiler
+from pianonet.model_inspection.performance_from_pianoroll import PERFORMANCE_AVERSION_PARAMS_DICT, \
+    get_pianoroll_from_performance_note_array, get_seed_note_array_from_midi_file
+from pianonet.serving.artifact_store import ArtifactStore
+from pianonet.serving.content_cache import ContentCache, get_content_hash_string
+from pianonet.serving.job_queue import GenerationJob, JobQueue
+from pianonet.serving.model_registry import ModelRegistry
 
 app = Flask(__name__)
 
@@ -13,7 +28,170 @@ base_path = "/app/"
 
 # base_path = "/Users/angsten/PycharmProjects/pianonet"
 
-performances_path = os.path.join(base_path, 'data', 'performances')
+model_registry_config_file_path = os.environ.get('PIANONET_MODEL_REGISTRY_PATH',
+                                                 os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                              'model_registry.json'))
+
+num_generation_workers = int(os.environ.get('PIANONET_NUM_GENERATION_WORKERS', '2'))
+max_queued_jobs = int(os.environ.get('PIANONET_MAX_QUEUED_JOBS', '32'))
+max_batch_size = int(os.environ.get('PIANONET_MAX_BATCH_SIZE', '16'))
+batch_window_in_seconds = float(os.environ.get('PIANONET_BATCH_WINDOW_SECONDS', '0.05'))
+
+max_artifact_store_megabytes = float(os.environ.get('PIANONET_ARTIFACT_STORE_MEGABYTES', '256'))
+artifact_time_to_live_in_seconds = float(os.environ.get('PIANONET_ARTIFACT_TIME_TO_LIVE_SECONDS', '3600'))
+artifact_spill_directory_path = os.environ.get('PIANONET_ARTIFACT_SPILL_PATH')
+
+seed_cache_megabytes = float(os.environ.get('PIANONET_SEED_CACHE_MEGABYTES', '256'))
+max_result_cache_entries = int(os.environ.get('PIANONET_RESULT_CACHE_ENTRIES', '4096'))
+
+max_seed_midi_file_bytes = int(float(os.environ.get('PIANONET_MAX_SEED_MEGABYTES', '1')) * 1024 * 1024)
+max_seconds_to_generate = float(os.environ.get('PIANONET_MAX_SECONDS_TO_GENERATE', '600'))
+
+# The legacy comma separated seed encoding takes up to four characters per byte, plus room for the other form fields
+app.config['MAX_CONTENT_LENGTH'] = 4 * max_seed_midi_file_bytes + 64 * 1024
+
+SEED_MIDI_FILE_CONTENT_TYPES = ('audio/midi', 'audio/x-midi', 'application/octet-stream')
+MIDI_FILE_HEADER = b'MThd'
+MIDI_FILE_HEADER_CHUNK_LENGTH = 14
+
+# Generation of long performances takes minutes, beyond the default buckets of prometheus_client
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+metrics_registry = CollectorRegistry()
+
+request_duration_seconds = Histogram('pianonet_request_duration_seconds',
+                                     'Time to respond to HTTP requests, by endpoint, method and status code.',
+                                     ['endpoint', 'method', 'status'], registry=metrics_registry,
+                                     buckets=DURATION_BUCKETS)
+requests_in_flight = Gauge('pianonet_requests_in_flight', 'HTTP requests being handled.', registry=metrics_registry)
+performance_requests_total = Counter('pianonet_performance_requests_total',
+                                     'Performance requests by endpoint, model tier and result cache outcome.',
+                                     ['endpoint', 'tier', 'result_cache'], registry=metrics_registry)
+phase_duration_seconds = Histogram('pianonet_phase_duration_seconds',
+                                   'Time spent in each phase of serving performances: parse per parsed seed, warm_up '
+                                   'per batch, and generate and encode per performance.',
+                                   ['phase', 'tier'], registry=metrics_registry, buckets=DURATION_BUCKETS)
+job_queue_wait_seconds = Histogram('pianonet_job_queue_wait_seconds', 'Time generation jobs waited for a worker.',
+                                   ['tier'], registry=metrics_registry, buckets=DURATION_BUCKETS)
+generation_jobs_total = Counter('pianonet_generation_jobs_total', 'Generation jobs done, by model tier and status.',
+                                ['tier', 'status'], registry=metrics_registry)
+generation_batch_size = Histogram('pianonet_generation_batch_size', 'Number of jobs generated together per batch.',
+                                  ['tier'], registry=metrics_registry, buckets=(1, 2, 4, 8, 16, 32, 64))
+generated_notes_total = Counter('pianonet_generated_notes_total', 'Notes generated, summed over performances.',
+                                ['tier'], registry=metrics_registry)
+generation_seconds_total = Counter('pianonet_generation_seconds_total', 'Time spent generating notes.', ['tier'],
+                                   registry=metrics_registry)
+notes_per_second = Gauge('pianonet_notes_per_second',
+                         'Notes generated per second of generation time by the last batch of each model tier.',
+                         ['tier'], registry=metrics_registry)
+realtime_factor = Gauge('pianonet_realtime_factor',
+                        'Seconds of audio generated per second of generation time by the last batch of each model '
+                        'tier.', ['tier'], registry=metrics_registry)
+generation_jobs_queued = Gauge('pianonet_generation_jobs_queued', 'Generation jobs waiting for a worker.',
+                               registry=metrics_registry)
+generation_jobs_running = Gauge('pianonet_generation_jobs_running', 'Generation jobs being generated.',
+                                registry=metrics_registry)
+artifacts_stored = Gauge('pianonet_artifacts_stored', 'Performances held in the artifact store.',
+                         registry=metrics_registry)
+
+# Guards the creation of the server objects below, which are created on first use by whichever request thread gets
+# there first
+server_objects_lock = threading.Lock()
+
+model_registry = None
+job_queue = None
+artifact_store = None
+seed_cache = None
+result_cache = None
+
+
+def get_model_registry():
+    """
+    Returns the server's ModelRegistry, loading and warming every model on first use. The server loads it at startup,
+    so requests never wait for this.
+    """
+
+    global model_registry
+
+    if model_registry == None:
+        with server_objects_lock:
+            if model_registry == None:
+                model_registry = ModelRegistry(config_file_path=model_registry_config_file_path, base_path=base_path)
+
+    return model_registry
+
+
+def get_job_queue():
+    """
+    Returns the server's JobQueue, whose num_generation_workers worker threads generate the performances of requests,
+    batching up to max_batch_size requests for the same model arriving within batch_window_in_seconds.
+    """
+
+    global job_queue
+
+    if job_queue == None:
+        with server_objects_lock:
+            if job_queue == None:
+                job_queue = JobQueue(num_workers=num_generation_workers,
+                                     max_queue_depth=max_queued_jobs,
+                                     max_batch_size=max_batch_size,
+                                     batch_window_in_seconds=batch_window_in_seconds,
+                                     on_batch_done=record_batch_metrics)
+
+    return job_queue
+
+
+def get_artifact_store():
+    """
+    Returns the server's ArtifactStore holding the midi files of finished performances, in memory up to
+    max_artifact_store_megabytes and for artifact_time_to_live_in_seconds, spilling to artifact_spill_directory_path
+    if it is set.
+    """
+
+    global artifact_store
+
+    if artifact_store == None:
+        with server_objects_lock:
+            if artifact_store == None:
+                artifact_store = ArtifactStore(max_size_in_bytes=int(max_artifact_store_megabytes * 1024 * 1024),
+                                               time_to_live_in_seconds=artifact_time_to_live_in_seconds,
+                                               spill_directory_path=artifact_spill_directory_path)
+
+    return artifact_store
+
+
+def get_seed_cache():
+    """
+    Returns the server's cache of parsed seeds, holding up to seed_cache_megabytes of them. It maps the content hash of
+    a seed midi file and a model identifier to a dictionary of the seed NoteArray for the model and, once a performance
+    was generated from it, the engine state right after the warm-up on the seed.
+    """
+
+    global seed_cache
+
+    if seed_cache == None:
+        with server_objects_lock:
+            if seed_cache == None:
+                seed_cache = ContentCache(max_size=int(seed_cache_megabytes * 1024 * 1024))
+
+    return seed_cache
+
+
+def get_result_cache():
+    """
+    Returns the server's cache of up to max_result_cache_entries finished performances with an explicit random seed. It
+    maps the seed midi file content hash, model identifier, number of time steps, random seed and edge aversion params
+    to the midi file name of the performance in the artifact store.
+    """
+
+    global result_cache
+
+    if result_cache == None:
+        with server_objects_lock:
+            if result_cache == None:
+                result_cache = ContentCache(max_size=max_result_cache_entries)
+
+    return result_cache
 
 
 def get_random_midi_file_name():
@@ -24,12 +202,101 @@ def get_random_midi_file_name():
     return str(random.randint(0, 10000000000000000000)) + ".midi"
 
 
-def get_performance_path(midi_file_name):
+def record_batch_metrics(jobs, batch_report):
+    """
+    Records the metrics of a batch of generation jobs done by the job queue, given the batch report from
+    run_generation_jobs.
+    """
+
+    tier = str(jobs[0].model_tier)
+    num_notes_generated = batch_report['num_time_steps_generated'] * jobs[0].prepared_model.num_keys
+    generation_seconds = batch_report['generation_seconds']
+
+    phase_duration_seconds.labels(phase='warm_up', tier=tier).observe(batch_report['warm_up_seconds'])
+    generation_batch_size.labels(tier=tier).observe(batch_report['batch_size'])
+    generated_notes_total.labels(tier=tier).inc(num_notes_generated)
+    generation_seconds_total.labels(tier=tier).inc(generation_seconds)
+
+    if generation_seconds > 0:
+        notes_per_second.labels(tier=tier).set(num_notes_generated / generation_seconds)
+        realtime_factor.labels(tier=tier).set(batch_report['num_time_steps_generated'] / 48.0 / generation_seconds)
+
+    for job in jobs:
+        generation_jobs_total.labels(tier=tier, status=job.status).inc()
+        job_queue_wait_seconds.labels(tier=tier).observe(job.started_time - job.created_time)
+
+        if job.generation_seconds != None:
+            phase_duration_seconds.labels(phase='generate', tier=tier).observe(job.generation_seconds)
+
+        if job.result_seconds != None:
+            phase_duration_seconds.labels(phase='encode', tier=tier).observe(job.result_seconds)
+
+
+def count_performance_request(arguments, result_cache_outcome):
+    """
+    Counts a performance request with arguments from get_performance_request_arguments, where result_cache_outcome is
+    one of hit, miss or uncached.
+    """
+
+    performance_requests_total.labels(endpoint=request.url_rule.rule, tier=arguments['model_complexity'],
+                                      result_cache=result_cache_outcome).inc()
+
+
+@app.before_request
+def start_request_metrics():
+    g.request_start_time = time.time()
+    requests_in_flight.inc()
+
+
+def get_response_status(response):
+    """
+    Returns the status code response is counted under in the request metrics. The legacy endpoints, such as
+    /create-performance, answer errors with HTTP status 200 and the error's status code as the http_code of their JSON
+    body, so such responses are counted under their http_code.
+    """
+
+    if (response.status_code == 200) and (not response.is_streamed) and response.is_json:
+        response_dictionary = response.get_json(silent=True)
+
+        if isinstance(response_dictionary, dict) and ('http_code' in response_dictionary):
+            return response_dictionary['http_code']
+
+    return response.status_code
+
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.url_rule.rule if request.url_rule != None else 'unmatched'
+    method = request.method
+    status = get_response_status(response)
+    start_time = g.request_start_time
+
+    def record_request_done():
+        request_duration_seconds.labels(endpoint=endpoint, method=method, status=status).observe(
+            time.time() - start_time)
+        requests_in_flight.dec()
+
+    # A streamed response, such as that of /stream-performance, is only done once the server has sent its body and
+    # closes it
+    if response.is_streamed:
+        response.call_on_close(record_request_done)
+    else:
+        record_request_done()
+
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
     """
-    Returns full path to performaqnce midi file given a file name.
+    Returns the server's metrics in the Prometheus text exposition format.
     """
 
-    return os.path.join(performances_path, midi_file_name)
+    generation_jobs_queued.set(get_job_queue().get_num_queued_jobs())
+    generation_jobs_running.set(get_job_queue().get_num_running_jobs())
+    artifacts_stored.set(get_artifact_store().get_num_artifacts())
+
+    return Response(generate_latest(metrics_registry), content_type=CONTENT_TYPE_LATEST)
 
 
 @app.route('/')
@@ -37,90 +304,547 @@ def alive():
     return 'OK'
 
 
+def get_midi_file_response(midi_file_data):
+    """
+    Returns a response with the bytes midi_file_data as a midi file.
+    """
+
+    return Response(midi_file_data, mimetype='audio/midi')
+
+
 @app.route('/performances/', methods=['GET'])
 def get_performance():
     """
     Returns the requested performance as midi file.
     Expected query string is 'midi_file_name', such as 1234.midi
+    Performances are kept for a limited time, after which they are not found.
     """
 
     performance_midi_file_name = request.args.get('midi_file_name')
-    performance_midi_file_name = secure_filename(performance_midi_file_name)
-    print(performance_midi_file_name)
 
     if performance_midi_file_name == None:
         return {"http_code": 400, "code": "BadRequest", "message": "midi_file_name not found in request."}
 
-    midi_file_path = get_performance_path(performance_midi_file_name)
+    performance_midi_file_name = secure_filename(performance_midi_file_name)
+    print(performance_midi_file_name)
+
+    midi_file_data = get_artifact_store().get(performance_midi_file_name)
 
-    if not os.path.exists(midi_file_path):
+    if midi_file_data == None:
         return {
             "http_code": 404,
             "code": "Not Found",
             "message": "midi_file " + performance_midi_file_name + " not found."
         }
 
-    with open(midi_file_path, 'rb') as midi_file:
-        return send_from_directory(performances_path, performance_midi_file_name)
+    return get_midi_file_response(midi_file_data)
 
 
-@app.route('/create-performance', methods=['POST'])
-def performance():
+def get_bytes_from_comma_separated_string(comma_separated_string):
+    """
+    Returns the bytes encoded by a string of comma separated integers from 0 to 255, such as "77,84,104,100", or None
+    if the string is not such an encoding.
     """
-    Expects post form data as follows:
-        seed_midi_file_data: Midi file that forms the seed for a performance as string encoding like "8,2,3,4,5..."
-        seconds_to_generate: Number of seconds of new notes to generate
-        model_complexity: Quality of model to use, one of ['low', 'medium', 'high', 'highest']
+
+    # int64 rather than int32, which would silently wrap values such as 4294967373 around into the byte range
+    try:
+        integer_array = np.array(comma_separated_string.split(','), dtype='int64')
+    except (ValueError, OverflowError):
+        return None
+
+    if np.any(integer_array < 0) or np.any(integer_array > 255):
+        return None
+
+    return integer_array.astype('uint8').tobytes()
+
+
+def get_seed_midi_file_bytes():
     """
+    Returns a tuple of the seed midi file bytes of the request and None, or of None and an error response. The seed is
+    read from, in order of preference:
 
-    seed_midi_file_data = request.form.get('seed_midi_file_data')
+        the raw request body, when the content type is one of SEED_MIDI_FILE_CONTENT_TYPES
+        the multipart form file seed_midi_file
+        the form field seed_midi_file_data, encoded as a comma separated string of byte values like "77,84,104,100..."
 
-    if seed_midi_file_data == None:
-        return {"http_code": 400, "code": "BadRequest", "message": "seed_midi_file_data not found in request."}
+    The seed must be at most max_seed_midi_file_bytes long and start with a midi file header.
+    """
+
+    if request.mimetype in SEED_MIDI_FILE_CONTENT_TYPES:
+        if (request.content_length != None) and (request.content_length > max_seed_midi_file_bytes):
+            seed_midi_file_bytes = None
+        else:
+            seed_midi_file_bytes = request.get_data(cache=False)
+    elif 'seed_midi_file' in request.files:
+        seed_midi_file_bytes = request.files['seed_midi_file'].read(max_seed_midi_file_bytes + 1)
+    elif 'seed_midi_file_data' in request.form:
+        seed_midi_file_bytes = get_bytes_from_comma_separated_string(request.form['seed_midi_file_data'])
+
+        if seed_midi_file_bytes == None:
+            return None, {"http_code": 400, "code": "BadRequest",
+                          "message": "seed_midi_file_data must be comma separated integers from 0 to 255."}
     else:
-        seed_midi_file_int_array = [int(x) for x in seed_midi_file_data.split(',')]
+        return None, {"http_code": 400, "code": "BadRequest", "message": "seed_midi_file_data not found in request."}
+
+    if (seed_midi_file_bytes == None) or (len(seed_midi_file_bytes) > max_seed_midi_file_bytes):
+        return None, {"http_code": 413, "code": "PayloadTooLarge",
+                      "message": "The seed midi file must be at most " + str(max_seed_midi_file_bytes) + " bytes."}
+
+    if (len(seed_midi_file_bytes) < MIDI_FILE_HEADER_CHUNK_LENGTH) or (
+            seed_midi_file_bytes[:len(MIDI_FILE_HEADER)] != MIDI_FILE_HEADER):
+        return None, {"http_code": 400, "code": "BadRequest", "message": "The seed is not a midi file."}
+
+    return seed_midi_file_bytes, None
+
+
+def get_performance_request_arguments():
+    """
+    Reads the arguments of a performance request, described in performance below, from its query string and post form
+    data, and its seed from get_seed_midi_file_bytes. Returns a tuple of a dictionary of the arguments and None, or of
+    None and an error response if the request is invalid. The arguments are the seed_note_array, num_time_steps,
+    model_complexity, prepared_model and random_seed, with the cached warmed_state of the seed if there is one and the
+    keys of the seed and result caches.
 
-        frame = bytearray()
-        for i in seed_midi_file_int_array:
-            frame.append(i)
+    Seeds are cached by content, so a seed sent before is not parsed again.
+    """
 
-        saved_seed_midi_file_path = os.path.join(base_path, 'data', 'seeds', get_random_midi_file_name())
+    seed_midi_file_bytes, error_response = get_seed_midi_file_bytes()
 
-        with open(saved_seed_midi_file_path, 'wb') as midi_file:
-            midi_file.write(frame)
+    if error_response != None:
+        return None, error_response
 
-    seconds_to_generate = request.form.get('seconds_to_generate')
+    seconds_to_generate = request.values.get('seconds_to_generate')
 
     if seconds_to_generate == None:
-        return {"http_code": 400, "code": "BadRequest", "message": "seconds_to_generate not found in request."}
-    else:
+        return None, {"http_code": 400, "code": "BadRequest", "message": "seconds_to_generate not found in request."}
+
+    try:
         seconds_to_generate = float(seconds_to_generate)
+    except ValueError:
+        seconds_to_generate = None
+
+    if (seconds_to_generate == None) or (not math.isfinite(seconds_to_generate)) or (seconds_to_generate <= 0) or (
+            seconds_to_generate > max_seconds_to_generate):
+        return None, {"http_code": 400, "code": "BadRequest",
+                      "message": "seconds_to_generate must be a number above 0 and at most " +
+                                 str(max_seconds_to_generate) + "."}
+
+    random_seed = request.values.get('random_seed')
+
+    if random_seed != None:
+        if not random_seed.isdecimal():
+            return None, {"http_code": 400, "code": "BadRequest",
+                          "message": "random_seed must be a non-negative integer."}
 
-    model_complexity = request.form.get('model_complexity', 'low')
+        random_seed = int(random_seed)
 
-    if model_complexity == 'low':
-        model_name = "micro_1"
+    try:
+        model_registry_entry = get_model_registry().get_entry(request.values.get('model_complexity'))
+    except Exception as exception:
+        return None, {"http_code": 400, "code": "BadRequest", "message": str(exception)}
+
+    model_complexity = model_registry_entry['tier']
+    prepared_model = model_registry_entry['prepared_model']
+    num_time_steps = int(48 * seconds_to_generate)
+
+    seed_hash_string = get_content_hash_string(seed_midi_file_bytes)
+    model_identifier = prepared_model.get_identifier_hash_string()
+    seed_cache_key = (seed_hash_string, model_identifier)
+
+    seed_cache_entry = get_seed_cache().get(seed_cache_key)
+
+    if seed_cache_entry == None:
+        start = time.time()
+
+        try:
+            seed_note_array = get_seed_note_array_from_midi_file(seed_midi_file=seed_midi_file_bytes,
+                                                                 prepared_model=prepared_model)
+        except Exception as exception:
+            return None, {"http_code": 400, "code": "BadRequest", "message": "The seed midi file could not be read: " +
+                                                                             str(exception)}
+
+        seed_cache_entry = {'seed_note_array': seed_note_array, 'warmed_state': None}
+        get_seed_cache().put(seed_cache_key, seed_cache_entry, size=seed_note_array.array.nbytes)
+
+        phase_duration_seconds.labels(phase='parse', tier=model_complexity).observe(time.time() - start)
+
+    if random_seed != None:
+        result_cache_key = (seed_hash_string, model_identifier, num_time_steps, random_seed,
+                            json.dumps(PERFORMANCE_AVERSION_PARAMS_DICT, sort_keys=True))
     else:
-        model_name = "r9p0_3500kparams_approx_9_blocks_model"
+        result_cache_key = None
+
+    return {
+        'seed_note_array': seed_cache_entry['seed_note_array'],
+        'warmed_state': seed_cache_entry['warmed_state'],
+        'num_time_steps': num_time_steps,
+        'model_complexity': model_complexity,
+        'prepared_model': prepared_model,
+        'random_seed': random_seed,
+        'seed_cache_key': seed_cache_key,
+        'result_cache_key': result_cache_key,
+    }, None
+
+
+def get_cached_midi_file_name(arguments):
+    """
+    Returns the midi file name of the performance already generated for the performance request arguments, or None if
+    there is none in the result cache and artifact store. Only requests with an explicit random seed are cached. The
+    request is counted in the metrics by its result cache outcome.
+    """
 
-    model_path = os.path.join(base_path, 'models', model_name)
+    if arguments['result_cache_key'] == None:
+        count_performance_request(arguments, 'uncached')
+        return None
 
-    input_pianoroll = Pianoroll(saved_seed_midi_file_path, use_custom_multitrack=True)
+    midi_file_name = get_result_cache().get(arguments['result_cache_key'])
 
-    input_pianoroll.trim_silence_off_ends()
+    if (midi_file_name == None) or (not get_artifact_store().contains(midi_file_name)):
+        count_performance_request(arguments, 'miss')
+        return None
 
-    final_pianoroll = get_performance_from_pianoroll(
-        pianoroll_seed=input_pianoroll,
-        num_time_steps=int(48 * seconds_to_generate),
-        model_path=model_path,
-    )
+    count_performance_request(arguments, 'hit')
+
+    return midi_file_name
+
+
+def store_performance_midi_file(final_pianoroll):
+    """
+    Encodes final_pianoroll as a midi file in memory, adds it to the artifact store and returns its file name.
+    """
 
     midi_file_name = get_random_midi_file_name()
-    midi_file_path = get_performance_path(midi_file_name)
-    final_pianoroll.save_to_midi_file(midi_file_path)
+    get_artifact_store().put(midi_file_name, final_pianoroll.get_midi_file_bytes())
+
+    return midi_file_name
+
+
+def store_performance_note_array(final_note_array):
+    """
+    Adds the performance of final_note_array to the artifact store as a midi file and returns its file name.
+    """
+
+    return store_performance_midi_file(get_pianoroll_from_performance_note_array(final_note_array))
+
+
+def get_server_sent_event(event_name, data):
+    """
+    Returns the text of a server-sent event named event_name whose data is the JSON encoding of data.
+    """
+
+    return "event: " + event_name + "\ndata: " + json.dumps(data) + "\n\n"
+
+
+def get_generation_job(arguments, stream_chunks=False):
+    """
+    Returns a GenerationJob for the performance request arguments from get_performance_request_arguments, whose result
+    is the file name of the performance's midi file in the artifact store. If stream_chunks is true, the job hands over
+    its chunks of generated key states as they are generated.
+
+    The job skips the warm-up if the seed cache holds a warmed state for the seed, and otherwise adds its warmed state
+    to the seed cache. Its result is added to the result cache if the request has an explicit random seed.
+    """
 
-    return {"http_code": 200, "code": "Success", "message": "", "midi_file_name": midi_file_name}
+    seed_note_array = arguments['seed_note_array']
+
+    def set_warmed_state(warmed_state):
+        get_seed_cache().put(arguments['seed_cache_key'],
+                             {'seed_note_array': seed_note_array, 'warmed_state': warmed_state},
+                             size=seed_note_array.array.nbytes + get_state_size_in_bytes(warmed_state))
+
+    def get_result(final_note_array):
+        midi_file_name = store_performance_note_array(final_note_array)
+
+        if arguments['result_cache_key'] != None:
+            get_result_cache().put(arguments['result_cache_key'], midi_file_name)
+
+        return midi_file_name
+
+    return GenerationJob(prepared_model=arguments['prepared_model'],
+                         seed_note_array=seed_note_array,
+                         num_time_steps=arguments['num_time_steps'],
+                         random_seed=arguments['random_seed'],
+                         use_edge_aversion=True,
+                         aversion_params_dict=PERFORMANCE_AVERSION_PARAMS_DICT,
+                         get_result=get_result,
+                         stream_chunks=stream_chunks,
+                         warmed_state=arguments['warmed_state'],
+                         set_warmed_state=set_warmed_state if arguments['warmed_state'] == None else None,
+                         model_tier=arguments['model_complexity'])
+
+
+def get_finished_generation_job(arguments, midi_file_name):
+    """
+    Returns a GenerationJob for the performance request arguments that is already finished, with the cached
+    performance midi_file_name as its result.
+    """
+
+    job = GenerationJob(prepared_model=arguments['prepared_model'],
+                        seed_note_array=arguments['seed_note_array'],
+                        num_time_steps=arguments['num_time_steps'],
+                        random_seed=arguments['random_seed'])
+
+    job.num_time_steps_done = job.num_time_steps
+    job.set_done('finished', result=midi_file_name)
+
+    return job
+
+
+@app.route('/create-performance', methods=['POST'])
+def performance():
+    """
+    Expects post form data (or query string arguments) as follows:
+        seed_midi_file_data: Midi file that forms the seed for a performance as string encoding like "8,2,3,4,5...".
+                             Instead, the midi file can be uploaded as the multipart form file seed_midi_file, or as
+                             the raw request body with content type audio/midi or application/octet-stream, with the
+                             other arguments in the query string.
+        seconds_to_generate: Number of seconds of new notes to generate, above 0 and at most max_seconds_to_generate
+        model_complexity: Quality of model to use, one of the model registry's tiers, by default ['low', 'medium',
+                          'high', 'highest']. If not given, or if the tier's model is missing, the registry's default
+                          tier is used.
+        random_seed: Optional non-negative integer seed for sampling. Requests with the same seed, seed midi, length
+                     and model return the same performance.
+        profile: Optional, if 'true' the response includes a 'profile' entry with the generation timings per phase and
+                 per layer and the realtime factor. Profiled performances are generated alone, without batching.
+
+    The performance is generated before responding, through the job queue so that it is batched with other requests
+    for the same model. See /jobs for generating it in the background instead. A request repeating an earlier one with
+    the same explicit random_seed is answered at once with the earlier performance, while it is kept.
+    """
+
+    arguments, error_response = get_performance_request_arguments()
+
+    if error_response != None:
+        return error_response
+
+    if request.values.get('profile', 'false') != 'true':
+        midi_file_name = get_cached_midi_file_name(arguments)
+
+        if midi_file_name != None:
+            return {"http_code": 200, "code": "Success", "message": "", "midi_file_name": midi_file_name}
+
+        job = get_generation_job(arguments)
+
+        if not get_job_queue().submit_job(job):
+            return {"http_code": 503, "code": "ServiceUnavailable",
+                    "message": "The generation queue is full, retry later."}
+
+        job.wait()
+
+        if job.status != 'finished':
+            return {"http_code": 500, "code": "InternalServerError",
+                    "message": "Generating the performance failed: " + str(job.error)}
+
+        return {"http_code": 200, "code": "Success", "message": "", "midi_file_name": job.result}
+
+    # Profiled requests are generated alone in this thread and without the caches, so that their timings are of this
+    # request's full generation only
+    count_performance_request(arguments, 'uncached')
+    profiler = GenerationProfiler()
+
+    final_note_array = get_performances_from_prepared_model(prepared_model=arguments['prepared_model'],
+                                                            seed_note_arrays=[arguments['seed_note_array']],
+                                                            num_time_steps_list=[arguments['num_time_steps']],
+                                                            random_seeds=[arguments['random_seed']],
+                                                            profiler=profiler,
+                                                            use_edge_aversion=True,
+                                                            aversion_params_dict=PERFORMANCE_AVERSION_PARAMS_DICT)[0]
+
+    midi_file_name = store_performance_note_array(final_note_array)
+
+    return {"http_code": 200, "code": "Success", "message": "", "midi_file_name": midi_file_name,
+            "profile": profiler.get_report()}
+
+
+@app.route('/stream-performance', methods=['POST'])
+def stream_performance():
+    """
+    Expects the same post form data as /create-performance, except for profile, and streams the performance as
+    server-sent events while it is generated:
+
+        start:        Sent first, with the job_id and num_time_steps_total
+        notes:        Sent for each generated chunk, with num_time_steps_done and the chunk's midi note events. Event
+                      time steps (1/48th of a second) count from the end of the seed. track_data is the chunk's events
+                      as base64 encoded midi track bytes, which follow the track_header_data of the start event.
+        performance:  Sent last, with the note off events and track_data ending the held notes, and the
+                      midi_file_name and base64 encoded midi_file_data of the finished performance, seed included, as
+                      /create-performance would return it
+        error:        Sent last instead if generation failed or was cancelled
+
+    The generation is queued and batched like any other. If the client disconnects, the generation is cancelled.
+    """
+
+    arguments, error_response = get_performance_request_arguments()
+
+    if error_response != None:
+        return error_response, error_response['http_code']
+
+    midi_file_name = get_cached_midi_file_name(arguments)
+
+    if midi_file_name != None:
+        job = get_finished_generation_job(arguments, midi_file_name)
+    else:
+        job = get_generation_job(arguments, stream_chunks=True)
+    prepared_model = job.prepared_model
+
+    if not get_job_queue().submit_job(job):
+        return {"http_code": 503, "code": "ServiceUnavailable",
+                "message": "The generation queue is full, retry later."}, 503
+
+    midi_event_encoder = MidiEventEncoder(min_key_index=prepared_model.min_key_index,
+                                          num_keys=prepared_model.num_keys,
+                                          initial_key_states=job.seed_note_array.array[-prepared_model.num_keys:])
+
+    def get_events():
+        try:
+            yield get_server_sent_event('start', {
+                'job_id': job.job_id,
+                'num_time_steps_total': job.num_time_steps,
+                'track_header_data': base64.b64encode(midi_event_encoder.get_track_header_data()).decode('ascii'),
+            })
+
+            # A cached performance has no chunks to stream, only the finished performance
+            for chunk in (job.get_chunks() if job.chunk_queue is not None else []):
+                events = midi_event_encoder.encode(chunk)
+
+                yield get_server_sent_event('notes', {
+                    'num_time_steps_done': midi_event_encoder.time_step,
+                    'events': events,
+                    'track_data': base64.b64encode(midi_event_encoder.encode_track_data(events)).decode('ascii'),
+                })
+
+            if job.status != 'finished':
+                yield get_server_sent_event('error', {'status': job.status, 'message': str(job.error)})
+                return
+
+            midi_file_data = get_artifact_store().get(job.result) or b''
+
+            final_events = midi_event_encoder.finish()
+
+            yield get_server_sent_event('performance', {
+                'events': final_events,
+                'track_data': base64.b64encode(midi_event_encoder.encode_track_data(final_events)).decode('ascii'),
+                'midi_file_name': job.result,
+                'midi_file_data': base64.b64encode(midi_file_data).decode('ascii'),
+            })
+        finally:
+            # Reached early when the client disconnects
+            get_job_queue().cancel_job(job.job_id)
+
+    return Response(get_events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache',
+                                                                          'X-Accel-Buffering': 'no'})
+
+
+def get_job_response(job_id):
+    """
+    Returns a tuple of the job with id job_id and None, or of None and a 404 response if the job is unknown.
+    """
+
+    job = get_job_queue().get_job(job_id)
+
+    if job == None:
+        return None, ({"http_code": 404, "code": "Not Found", "message": "job " + job_id + " not found."}, 404)
+
+    return job, None
+
+
+def get_job_status_response(job):
+    """
+    Returns the response describing the status and progress of job, with the performance's midi_file_name once it
+    is finished.
+    """
+
+    response = {"http_code": 200, "code": "Success", "message": "", "job": job.get_status_dictionary()}
+
+    if job.status == 'finished':
+        response['midi_file_name'] = job.result
+
+    return response
+
+
+@app.route('/jobs', methods=['POST'])
+def create_performance_job():
+    """
+    Queues the generation of a performance and responds at once with its job_id and a 202 status. Expects the same
+    post form data as /create-performance, except for profile. Responds with a 503 status if the queue is full. A
+    request repeating an earlier one with the same explicit random_seed gets a job that is already finished.
+    """
+
+    arguments, error_response = get_performance_request_arguments()
+
+    if error_response != None:
+        return error_response, error_response['http_code']
+
+    midi_file_name = get_cached_midi_file_name(arguments)
+
+    if midi_file_name != None:
+        job = get_finished_generation_job(arguments, midi_file_name)
+    else:
+        job = get_generation_job(arguments)
+
+    if not get_job_queue().submit_job(job):
+        return {"http_code": 503, "code": "ServiceUnavailable",
+                "message": "The generation queue is full, retry later."}, 503
+
+    return {"http_code": 202, "code": "Accepted", "message": "", "job_id": job.job_id,
+            "job": job.get_status_dictionary()}, 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_performance_job(job_id):
+    """
+    Returns the status of the job with id job_id: one of queued, running, finished, failed or cancelled, with the
+    number of time steps done out of the total. Once finished, midi_file_name names the performance.
+    """
+
+    job, error_response = get_job_response(job_id)
+
+    if error_response != None:
+        return error_response
+
+    return get_job_status_response(job)
+
+
+@app.route('/jobs/<job_id>/performance', methods=['GET'])
+def get_performance_job_midi_file(job_id):
+    """
+    Returns the midi file of the job with id job_id, or a 409 status if it is not finished.
+    """
+
+    job, error_response = get_job_response(job_id)
+
+    if error_response != None:
+        return error_response
+
+    if job.status != 'finished':
+        return {"http_code": 409, "code": "Conflict", "message": "job " + job_id + " is " + job.status + ".",
+                "job": job.get_status_dictionary()}, 409
+
+    midi_file_data = get_artifact_store().get(job.result)
+
+    if midi_file_data == None:
+        return {"http_code": 404, "code": "Not Found", "message": "The performance of job " + job_id + " expired."}, 404
+
+    return get_midi_file_response(midi_file_data)
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_performance_job(job_id):
+    """
+    Cancels the job with id job_id. A queued job is cancelled at once and a running job within one chunk of time steps.
+    Returns the job's status.
+    """
+
+    job = get_job_queue().cancel_job(job_id)
+
+    if job == None:
+        return {"http_code": 404, "code": "Not Found", "message": "job " + job_id + " not found."}, 404
+
+    return get_job_status_response(job)
 
 
 if __name__ == '__main__':
+    get_model_registry().start_reload_thread()
+    get_job_queue()
+
     app.run(host='0.0.0.0')
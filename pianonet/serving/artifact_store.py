@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_SIZE_IN_BYTES = 256 * 1024 * 1024
+DEFAULT_TIME_TO_LIVE_IN_SECONDS = 3600.0
+DEFAULT_MAX_SPILL_SIZE_IN_BYTES = 1024 * 1024 * 1024
+
+SPILLED_ARTIFACT_FILE_SUFFIX = '.artifact'
+
+
+class ArtifactStore(object):
+    """
+    Holds the bytes of generated artifacts, such as performance midi files, by name for a limited time.
+
+    Artifacts are kept in memory up to max_size_in_bytes in total. When a new artifact would exceed it, the oldest
+    artifacts are spilled to files in spill_directory_path, if given, or else dropped. Spilled files are capped at
+    max_spill_size_in_bytes in total, dropping the oldest first. Every artifact, in memory or spilled, is dropped
+    time_to_live_in_seconds after it was added, so neither memory nor disk grows without bound.
+
+    Expired artifacts are dropped whenever an artifact is added or read. All methods are thread safe.
+    """
+
+    def __init__(self,
+                 max_size_in_bytes=DEFAULT_MAX_SIZE_IN_BYTES,
+                 time_to_live_in_seconds=DEFAULT_TIME_TO_LIVE_IN_SECONDS,
+                 spill_directory_path=None,
+                 max_spill_size_in_bytes=DEFAULT_MAX_SPILL_SIZE_IN_BYTES):
+        """
+        max_size_in_bytes: Maximum total size of the artifacts held in memory
+        time_to_live_in_seconds: How long an artifact is kept after it is added
+        spill_directory_path: Optional directory to spill artifacts to when memory is full. Spilled files left in it by
+                              an earlier store are deleted.
+        max_spill_size_in_bytes: Maximum total size of the spilled artifacts
+        """
+
+        self.max_size_in_bytes = max_size_in_bytes
+        self.time_to_live_in_seconds = time_to_live_in_seconds
+        self.spill_directory_path = spill_directory_path
+        self.max_spill_size_in_bytes = max_spill_size_in_bytes
+
+        self.lock = threading.Lock()
+
+        # Name to (data, added time) for artifacts in memory and to (size, added time) for spilled artifacts, both in
+        # the order they were added
+        self.artifacts = OrderedDict()
+        self.spilled_artifacts = OrderedDict()
+
+        self.size_in_bytes = 0
+        self.spill_size_in_bytes = 0
+
+        if self.spill_directory_path != None:
+            os.makedirs(self.spill_directory_path, exist_ok=True)
+
+            for file_name in os.listdir(self.spill_directory_path):
+                if file_name.endswith(SPILLED_ARTIFACT_FILE_SUFFIX):
+                    os.remove(os.path.join(self.spill_directory_path, file_name))
+
+    def get_spilled_artifact_path(self, name):
+        """
+        Returns the path of the file the artifact called name is spilled to.
+        """
+
+        return os.path.join(self.spill_directory_path, name + SPILLED_ARTIFACT_FILE_SUFFIX)
+
+    def put(self, name, data):
+        """
+        Adds the bytes data as the artifact called name, replacing any artifact of that name. An artifact larger than
+        max_size_in_bytes is not kept.
+        """
+
+        with self.lock:
+            self.remove_artifact(name)
+            self.remove_expired_artifacts()
+
+            if len(data) > self.max_size_in_bytes:
+                print("Artifact " + name + " of " + str(len(data)) + " bytes exceeds the artifact store size and is " +
+                      "not kept.")
+                return
+
+            while self.size_in_bytes + len(data) > self.max_size_in_bytes:
+                self.spill_oldest_artifact()
+
+            self.artifacts[name] = (bytes(data), time.time())
+            self.size_in_bytes += len(data)
+
+    def get(self, name):
+        """
+        Returns the bytes of the artifact called name, or None if there is no such artifact or it expired.
+        """
+
+        with self.lock:
+            self.remove_expired_artifacts()
+
+            if name in self.artifacts:
+                return self.artifacts[name][0]
+
+            if name not in self.spilled_artifacts:
+                return None
+
+            with open(self.get_spilled_artifact_path(name), 'rb') as spilled_file:
+                return spilled_file.read()
+
+    def contains(self, name):
+        """
+        Returns true if there is an artifact called name that has not expired.
+        """
+
+        with self.lock:
+            self.remove_expired_artifacts()
+
+            return (name in self.artifacts) or (name in self.spilled_artifacts)
+
+    def get_num_artifacts(self):
+        """
+        Returns the number of artifacts held, in memory and spilled.
+        """
+
+        with self.lock:
+            return len(self.artifacts) + len(self.spilled_artifacts)
+
+    def spill_oldest_artifact(self):
+        """
+        Moves the oldest artifact in memory to the spill directory, or drops it if there is none. Must be called
+        holding the lock.
+        """
+
+        name, (data, added_time) = self.artifacts.popitem(last=False)
+        self.size_in_bytes -= len(data)
+
+        if (self.spill_directory_path == None) or (len(data) > self.max_spill_size_in_bytes):
+            return
+
+        while self.spill_size_in_bytes + len(data) > self.max_spill_size_in_bytes:
+            self.remove_spilled_artifact(next(iter(self.spilled_artifacts)))
+
+        with open(self.get_spilled_artifact_path(name), 'wb') as spilled_file:
+            spilled_file.write(data)
+
+        self.spilled_artifacts[name] = (len(data), added_time)
+        self.spill_size_in_bytes += len(data)
+
+    def remove_spilled_artifact(self, name):
+        """
+        Deletes the spilled artifact called name. Must be called holding the lock.
+        """
+
+        size, added_time = self.spilled_artifacts.pop(name)
+        self.spill_size_in_bytes -= size
+
+        file_path = self.get_spilled_artifact_path(name)
+
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+    def remove_artifact(self, name):
+        """
+        Drops the artifact called name, in memory or spilled, if there is one. Must be called holding the lock.
+        """
+
+        if name in self.artifacts:
+            data, added_time = self.artifacts.pop(name)
+            self.size_in_bytes -= len(data)
+
+        if name in self.spilled_artifacts:
+            self.remove_spilled_artifact(name)
+
+    def remove_expired_artifacts(self):
+        """
+        Drops every artifact added more than time_to_live_in_seconds ago. Must be called holding the lock.
+        """
+
+        expiry_time = time.time() - self.time_to_live_in_seconds
+
+        # Both dictionaries are in the order artifacts were added, so expired artifacts are at their fronts
+        for artifacts in (self.artifacts, self.spilled_artifacts):
+            while (len(artifacts) != 0) and (next(iter(artifacts.values()))[1] < expiry_time):
+                self.remove_artifact(next(iter(artifacts)))
@@ -0,0 +1,81 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def get_content_hash_string(data):
+    """
+    Returns the SHA-256 hex digest of the bytes data, used to key caches by content.
+    """
+
+    return hashlib.sha256(data).hexdigest()
+
+
+class ContentCache(object):
+    """
+    Thread safe least recently used cache of values by key, holding values up to max_size in total. Each value has a
+    size given when it is added, in whatever unit max_size is in, such as bytes or a count of entries.
+    """
+
+    def __init__(self, max_size):
+        """
+        max_size: Maximum total size of the cached values. The least recently used values are dropped beyond it.
+        """
+
+        self.max_size = max_size
+
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def get(self, key):
+        """
+        Returns the value cached for key, or None if there is none.
+        """
+
+        with self.lock:
+            if key not in self.entries:
+                self.num_misses += 1
+                return None
+
+            self.num_hits += 1
+            self.entries.move_to_end(key)
+
+            return self.entries[key][0]
+
+    def put(self, key, value, size=1):
+        """
+        Caches value for key, replacing any value cached for it. A value larger than max_size is not cached.
+        """
+
+        with self.lock:
+            self.remove(key)
+
+            if size > self.max_size:
+                return
+
+            while self.size + size > self.max_size:
+                self.remove(next(iter(self.entries)))
+
+            self.entries[key] = (value, size)
+            self.size += size
+
+    def remove(self, key):
+        """
+        Drops the value cached for key, if there is one. Must be called holding the lock.
+        """
+
+        if key in self.entries:
+            value, size = self.entries.pop(key)
+            self.size -= size
+
+    def get_num_entries(self):
+        """
+        Returns the number of values cached.
+        """
+
+        with self.lock:
+            return len(self.entries)
@@ -0,0 +1,524 @@
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from pianonet.generation.generation_engine import GenerationEngine, get_batch_state, \
+    get_edge_aversion_probability_floors, get_forked_state
+
+DEFAULT_NUM_WORKERS = 2
+DEFAULT_MAX_QUEUE_DEPTH = 32
+DEFAULT_MAX_DONE_JOBS = 1000
+DEFAULT_CHUNK_SIZE_IN_TIME_STEPS = 24
+DEFAULT_MAX_BATCH_SIZE = 16
+DEFAULT_BATCH_WINDOW_IN_SECONDS = 0.05
+
+JOB_STATUSES = ('queued', 'running', 'finished', 'failed', 'cancelled')
+DONE_JOB_STATUSES = ('finished', 'failed', 'cancelled')
+
+
+class GenerationJob(object):
+    """
+    One performance to generate in a JobQueue, with its progress and result. The status goes from queued to running
+    and then to one of finished, failed or cancelled.
+    """
+
+    def __init__(self,
+                 prepared_model,
+                 seed_note_array,
+                 num_time_steps,
+                 random_seed=None,
+                 use_edge_aversion=False,
+                 aversion_params_dict=None,
+                 get_result=None,
+                 stream_chunks=False,
+                 warmed_state=None,
+                 set_warmed_state=None,
+                 model_tier=None):
+        """
+        prepared_model: PreparedModel instance to generate with
+        seed_note_array: Seed NoteArray instance, key aligned and with the model's num_keys
+        num_time_steps: How many new time steps to generate
+        random_seed: Optional integer seed for sampling
+        use_edge_aversion: Boolean controlling whether or not to keep notes biased toward the middle of the output
+                           space.
+        aversion_params_dict: Params to control how strong edge aversion is
+        get_result: Optional function called in the worker with the full NoteArray of the finished performance,
+                    including the seed, whose return value becomes the job's result. If None, the result is the
+                    NoteArray itself.
+        stream_chunks: If true, each chunk of generated key states is also handed over as soon as it is generated, to
+                       be read with get_chunks.
+        warmed_state: Optional state dictionary of the performance right after the warm-up on its seed, as passed to
+                      set_warmed_state by an earlier job with the same seed and model. If given, the warm-up is skipped.
+        set_warmed_state: Optional function called in the worker with the state dictionary of the performance right
+                          after its warm-up, so that it can be kept for later jobs with the same seed and model
+        model_tier: Optional name of the model's tier, for reporting
+        """
+
+        self.job_id = uuid.uuid4().hex
+
+        self.prepared_model = prepared_model
+        self.seed_note_array = seed_note_array
+        self.num_time_steps = num_time_steps
+        self.random_seed = random_seed
+        self.use_edge_aversion = use_edge_aversion
+        self.aversion_params_dict = aversion_params_dict
+        self.get_result = get_result
+        self.chunk_queue = queue.Queue() if stream_chunks else None
+        self.warmed_state = warmed_state
+        self.set_warmed_state = set_warmed_state
+        self.model_tier = model_tier
+
+        self.status = 'queued'
+        self.num_time_steps_done = 0
+        self.result = None
+        self.error = None
+        self.cancel_requested = False
+
+        self.created_time = time.time()
+        self.started_time = None
+        self.done_time = None
+
+        # Seconds spent warming up the job's batch, generating until the job was complete and making its result
+        self.warm_up_seconds = None
+        self.generation_seconds = None
+        self.result_seconds = None
+
+        self.done_event = threading.Event()
+
+    def is_done(self):
+        """
+        Returns true if the job finished, failed or was cancelled.
+        """
+
+        return self.status in DONE_JOB_STATUSES
+
+    def set_done(self, status, result=None, error=None):
+        """
+        Ends the job with status, one of finished, failed or cancelled.
+        """
+
+        self.result = result
+        self.error = error
+        self.warmed_state = None
+        self.done_time = time.time()
+        self.status = status
+        self.done_event.set()
+
+        if self.chunk_queue is not None:
+            self.chunk_queue.put(None)
+
+    def add_chunk(self, chunk):
+        """
+        Records chunk, a boolean array of shape (chunk_time_steps, num_keys) of newly generated key states, as done.
+        """
+
+        if self.chunk_queue is not None:
+            self.chunk_queue.put(chunk)
+
+        self.num_time_steps_done += chunk.shape[0]
+
+    def get_chunks(self):
+        """
+        Generator yielding the job's chunks of generated key states, of shape (chunk_time_steps, num_keys), as they are
+        generated, until the job is done. The job must have been created with stream_chunks.
+        """
+
+        while True:
+            chunk = self.chunk_queue.get()
+
+            if chunk is None:
+                return
+
+            yield chunk
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the job is done or timeout seconds passed. Returns true if the job is done.
+        """
+
+        return self.done_event.wait(timeout)
+
+    def get_batch_key(self):
+        """
+        Returns a key that is equal for jobs that can be generated together in one batch: jobs with the same prepared
+        model and edge aversion.
+        """
+
+        return (id(self.prepared_model), self.use_edge_aversion, repr(self.aversion_params_dict))
+
+    def get_status_dictionary(self):
+        """
+        Returns a JSON serializable dictionary of the job's status and progress.
+        """
+
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'num_time_steps_done': self.num_time_steps_done,
+            'num_time_steps_total': self.num_time_steps,
+            'progress': self.num_time_steps_done / self.num_time_steps if self.num_time_steps > 0 else 1.0,
+            'error': self.error,
+            'queued_seconds': (self.started_time or self.done_time or time.time()) - self.created_time,
+            'running_seconds': None if self.started_time == None else (self.done_time or time.time()) -
+                                                                       self.started_time,
+        }
+
+
+def finish_generation_job(job, generated_flat_arrays):
+    """
+    Ends job as finished with the result made from its seed followed by generated_flat_arrays, the list of flattened
+    chunks of its generated time steps, or as failed if making the result raises.
+    """
+
+    start = time.time()
+
+    try:
+        final_note_array = job.seed_note_array.note_array_transformer.get_note_array(
+            flat_array=np.concatenate([job.seed_note_array.array.astype('bool')] + generated_flat_arrays))
+
+        result = final_note_array if job.get_result == None else job.get_result(final_note_array)
+    except Exception as exception:
+        traceback.print_exc()
+        job.set_done('failed', error=str(exception))
+        return
+
+    job.result_seconds = time.time() - start
+    job.set_done('finished', result=result)
+
+
+def get_generation_engine(jobs):
+    """
+    Returns a GenerationEngine for the performances of jobs, which must share a batch key, in one batch. Jobs without a
+    warmed state are warmed up together, handing their warmed states to set_warmed_state, and are then batched with
+    the jobs restored from their warmed states.
+    """
+
+    first_job = jobs[0]
+    prepared_model = first_job.prepared_model
+
+    cold_jobs = [job for job in jobs if job.warmed_state == None]
+    random_seeds = [job.random_seed for job in jobs]
+
+    if len(cold_jobs) != 0:
+        cold_generation_engine = GenerationEngine(prepared_model=prepared_model,
+                                                  seed_flat_arrays=[job.seed_note_array.array for job in cold_jobs],
+                                                  random_seeds=[job.random_seed for job in cold_jobs],
+                                                  use_edge_aversion=first_job.use_edge_aversion,
+                                                  aversion_params_dict=first_job.aversion_params_dict)
+
+        if len(cold_jobs) == len(jobs) and all([job.set_warmed_state == None for job in jobs]):
+            return cold_generation_engine
+
+        cold_state = cold_generation_engine.get_state()
+
+        for performance_index, job in enumerate(cold_jobs):
+            job.warmed_state = get_forked_state(state=cold_state, performance_indices=[performance_index])
+
+            if job.set_warmed_state != None:
+                job.set_warmed_state(job.warmed_state)
+
+    if first_job.use_edge_aversion:
+        probability_floors = get_edge_aversion_probability_floors(
+            num_keys=prepared_model.num_keys,
+            probability_thresholds=first_job.aversion_params_dict['probability_thresholds'])
+    else:
+        probability_floors = None
+
+    batch_state = get_batch_state(performance_states=[job.warmed_state for job in jobs],
+                                  random_seeds=random_seeds,
+                                  probability_floors=probability_floors)
+
+    return GenerationEngine(prepared_model=prepared_model, state=batch_state)
+
+
+def run_generation_jobs(jobs, chunk_size_in_time_steps=DEFAULT_CHUNK_SIZE_IN_TIME_STEPS):
+    """
+    Generates the performances of jobs, which must share a batch key, as one batch of a single GenerationEngine from
+    get_generation_engine. Each performance keeps its own seed, length and random generator, so it is the same as if
+    generated alone.
+
+    Generation goes chunk_size_in_time_steps time steps at a time, updating each job's progress after every chunk.
+    Between chunks, the jobs that are complete are finished and the jobs whose cancellation was requested are
+    cancelled, and both are dropped from the batch, so the rest continue with a smaller batch.
+
+    Returns a dictionary reporting on the batch: its batch_size, warm_up_seconds, generation_seconds spent generating
+    time steps and num_time_steps_generated summed over its performances.
+    """
+
+    batch_report = {
+        'batch_size': len(jobs),
+        'warm_up_seconds': 0.0,
+        'generation_seconds': 0.0,
+        'num_time_steps_generated': 0,
+    }
+
+    start = time.time()
+
+    try:
+        generation_engine = get_generation_engine(jobs)
+    except Exception as exception:
+        traceback.print_exc()
+        for job in jobs:
+            job.set_done('failed', error=str(exception))
+
+        return batch_report
+
+    generation_start = time.time()
+    batch_report['warm_up_seconds'] = generation_start - start
+
+    for job in jobs:
+        job.warm_up_seconds = batch_report['warm_up_seconds']
+
+    active_jobs = list(jobs)
+    generated_flat_arrays_lists = [[] for job in jobs]
+
+    try:
+        while True:
+            keep_mask = [(not job.cancel_requested) and (job.num_time_steps_done < job.num_time_steps) for job in
+                         active_jobs]
+
+            for job, generated_flat_arrays, keep in zip(active_jobs, generated_flat_arrays_lists, keep_mask):
+                if keep:
+                    continue
+
+                job.generation_seconds = time.time() - generation_start
+
+                if job.cancel_requested:
+                    job.set_done('cancelled')
+                else:
+                    finish_generation_job(job, generated_flat_arrays)
+
+            if not all(keep_mask):
+                active_jobs = [job for job, keep in zip(active_jobs, keep_mask) if keep]
+                generated_flat_arrays_lists = [generated_flat_arrays for generated_flat_arrays, keep in
+                                               zip(generated_flat_arrays_lists, keep_mask) if keep]
+
+                if len(active_jobs) == 0:
+                    return batch_report
+
+                generation_engine.keep_performances(keep_mask)
+
+            chunk_time_steps = min([chunk_size_in_time_steps] + [job.num_time_steps - job.num_time_steps_done for
+                                                                 job in active_jobs])
+            chunk = np.zeros((len(active_jobs), chunk_time_steps, generation_engine.num_keys), dtype='bool')
+
+            chunk_start = time.time()
+
+            for time_step in range(0, chunk_time_steps):
+                generation_engine.generate_time_step(key_states=chunk[:, time_step, :])
+
+            batch_report['generation_seconds'] += time.time() - chunk_start
+            batch_report['num_time_steps_generated'] += chunk_time_steps * len(active_jobs)
+
+            for job, generated_flat_arrays, performance_chunk in zip(active_jobs, generated_flat_arrays_lists, chunk):
+                generated_flat_arrays.append(performance_chunk.flatten())
+                job.add_chunk(performance_chunk)
+    except Exception as exception:
+        traceback.print_exc()
+        for job in active_jobs:
+            if not job.is_done():
+                job.set_done('failed', error=str(exception))
+
+    return batch_report
+
+
+class JobQueue(object):
+    """
+    Bounded queue of GenerationJobs run by a fixed pool of worker threads, which separates the number of requests being
+    served from the generation compute used. At most max_queue_depth jobs wait at a time, and the last max_done_jobs
+    done jobs are kept for their status and results.
+
+    Jobs arriving together are coalesced: a worker taking a job waits up to batch_window_in_seconds for more jobs with
+    the same batch key, then generates up to max_batch_size of them as one batch. Advancing a batch costs little more
+    than advancing a single performance, so under load this multiplies the notes generated per second.
+
+    The workers are threads, so they share the process's models and caches, but the Python part of each time step holds
+    the GIL, so more workers overlap only the time spent in NumPy. Batching, not num_workers, is what raises throughput
+    within a process.
+    """
+
+    def __init__(self,
+                 num_workers=DEFAULT_NUM_WORKERS,
+                 max_queue_depth=DEFAULT_MAX_QUEUE_DEPTH,
+                 max_done_jobs=DEFAULT_MAX_DONE_JOBS,
+                 chunk_size_in_time_steps=DEFAULT_CHUNK_SIZE_IN_TIME_STEPS,
+                 max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 batch_window_in_seconds=DEFAULT_BATCH_WINDOW_IN_SECONDS,
+                 on_batch_done=None):
+        """
+        num_workers: Number of worker threads generating at the same time
+        max_queue_depth: Maximum number of jobs waiting for a worker. Submitting more is refused.
+        max_done_jobs: Maximum number of done jobs kept. The oldest are forgotten first.
+        chunk_size_in_time_steps: Number of time steps generated between progress updates and cancellation checks
+        max_batch_size: Maximum number of jobs generated together in one batch
+        batch_window_in_seconds: How long a worker waits for more jobs to batch with the first job it takes. If 0, only
+                                 jobs already queued are batched together.
+        on_batch_done: Optional function called by the worker after each batch with the list of the batch's jobs and
+                       the batch report from run_generation_jobs, such as for recording metrics
+        """
+
+        self.max_queue_depth = max_queue_depth
+        self.max_done_jobs = max_done_jobs
+        self.chunk_size_in_time_steps = chunk_size_in_time_steps
+        self.max_batch_size = max_batch_size
+        self.batch_window_in_seconds = batch_window_in_seconds
+        self.on_batch_done = on_batch_done
+
+        self.condition = threading.Condition()
+        self.queued_jobs = deque()
+        self.jobs = OrderedDict()
+        self.num_running_jobs = 0
+
+        self.workers = []
+        for i in range(0, num_workers):
+            worker = threading.Thread(target=self.run_worker, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit_job(self, job):
+        """
+        Queues job. Returns false, without queueing it, if max_queue_depth jobs are already waiting. A job that is
+        already done is only recorded, for its status and result.
+        """
+
+        with self.condition:
+            if job.is_done():
+                self.jobs[job.job_id] = job
+                self.forget_old_done_jobs()
+                return True
+
+            if len(self.queued_jobs) >= self.max_queue_depth:
+                return False
+
+            self.jobs[job.job_id] = job
+            self.queued_jobs.append(job)
+
+            # Waking every worker lets one collecting a batch of this job's key take it, even if another is idle
+            self.condition.notify_all()
+
+        return True
+
+    def get_job(self, job_id):
+        """
+        Returns the job with id job_id, or None if it is unknown or was forgotten.
+        """
+
+        with self.condition:
+            return self.jobs.get(job_id)
+
+    def cancel_job(self, job_id):
+        """
+        Cancels the job with id job_id. A queued job is removed from the queue at once, and a running job stops after
+        its current chunk. Returns the job, or None if it is unknown.
+        """
+
+        with self.condition:
+            job = self.jobs.get(job_id)
+
+            if job == None or job.is_done():
+                return job
+
+            job.cancel_requested = True
+
+            if job.status == 'queued':
+                self.queued_jobs.remove(job)
+                job.set_done('cancelled')
+                self.forget_old_done_jobs()
+
+        return job
+
+    def get_num_queued_jobs(self):
+        """
+        Returns the number of jobs waiting for a worker.
+        """
+
+        with self.condition:
+            return len(self.queued_jobs)
+
+    def get_num_running_jobs(self):
+        """
+        Returns the number of jobs being generated.
+        """
+
+        with self.condition:
+            return self.num_running_jobs
+
+    def forget_old_done_jobs(self):
+        """
+        Forgets the oldest done jobs beyond max_done_jobs. Must be called holding the condition's lock.
+        """
+
+        done_job_ids = [job_id for job_id, job in self.jobs.items() if job.is_done()]
+
+        for job_id in done_job_ids[:max(0, len(done_job_ids) - self.max_done_jobs)]:
+            del self.jobs[job_id]
+
+    def take_queued_jobs(self, batch_key, max_num_jobs):
+        """
+        Takes up to max_num_jobs queued jobs with batch_key off the queue, oldest first, and marks them as running.
+        Must be called holding the condition's lock.
+        """
+
+        jobs = [job for job in self.queued_jobs if job.get_batch_key() == batch_key][:max_num_jobs]
+
+        for job in jobs:
+            self.queued_jobs.remove(job)
+            job.status = 'running'
+            job.started_time = time.time()
+
+        self.num_running_jobs += len(jobs)
+
+        return jobs
+
+    def get_next_jobs(self):
+        """
+        Blocks until a job is queued, then takes it and the jobs with the same batch key arriving within the batch
+        window off the queue, up to max_batch_size jobs, and returns them.
+        """
+
+        with self.condition:
+            while len(self.queued_jobs) == 0:
+                self.condition.wait()
+
+            batch_key = self.queued_jobs[0].get_batch_key()
+            jobs = self.take_queued_jobs(batch_key, self.max_batch_size)
+            window_end_time = time.time() + self.batch_window_in_seconds
+
+            while len(jobs) < self.max_batch_size:
+                remaining_window_seconds = window_end_time - time.time()
+
+                if remaining_window_seconds <= 0:
+                    break
+
+                self.condition.wait(remaining_window_seconds)
+                jobs += self.take_queued_jobs(batch_key, self.max_batch_size - len(jobs))
+
+        return jobs
+
+    def run_worker(self):
+        """
+        Loop of each worker thread, running one batch of jobs after another.
+        """
+
+        while True:
+            jobs = self.get_next_jobs()
+
+            if len(jobs) > 1:
+                print("Generating a batch of " + str(len(jobs)) + " jobs")
+
+            batch_report = run_generation_jobs(jobs=jobs, chunk_size_in_time_steps=self.chunk_size_in_time_steps)
+
+            with self.condition:
+                self.num_running_jobs -= len(jobs)
+                self.forget_old_done_jobs()
+
+            if self.on_batch_done != None:
+                try:
+                    self.on_batch_done(jobs, batch_report)
+                except Exception:
+                    traceback.print_exc()
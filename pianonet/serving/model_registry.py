@@ -0,0 +1,239 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from pianonet.core.misc_tools import load_dictionary_from_json_file
+from pianonet.generation.generation_engine import GenerationEngine
+from pianonet.generation.model_bundle import is_model_bundle
+from pianonet.generation.prepared_model import PreparedModel
+
+DEFAULT_RELOAD_CHECK_INTERVAL_IN_SECONDS = 10.0
+
+
+def get_model_modification_signature(model_path):
+    """
+    Returns a tuple that changes whenever a file of the model at model_path (a bundle directory, SavedModel directory
+    or single file) is added, removed or modified.
+    """
+
+    if os.path.isfile(model_path):
+        file_paths = [model_path]
+    else:
+        file_paths = [os.path.join(directory_path, file_name) for directory_path, directory_names, file_names in
+                      os.walk(model_path) for file_name in file_names]
+
+    return tuple(sorted((file_path, os.path.getmtime(file_path), os.path.getsize(file_path)) for file_path in
+                        file_paths))
+
+
+def is_model_available(model_path):
+    """
+    Returns true if model_path holds a model that can be loaded: a saved model bundle, a Keras SavedModel directory or
+    a single model file.
+    """
+
+    return is_model_bundle(model_path) or os.path.isfile(os.path.join(model_path, 'saved_model.pb')) or \
+        os.path.isfile(model_path)
+
+
+def warm_prepared_model(prepared_model):
+    """
+    Runs a tiny generation from silence with prepared_model, so that the first request does not pay for first-use
+    costs such as touching the weights and starting the BLAS library.
+    """
+
+    generation_engine = GenerationEngine(prepared_model=prepared_model,
+                                         seed_flat_arrays=[np.zeros((prepared_model.num_keys,), dtype='bool')],
+                                         random_seeds=[0])
+    generation_engine.generate_time_step()
+
+
+class ModelRegistry(object):
+    """
+    Holds a warmed PreparedModel for each model complexity tier served, loaded at startup from a JSON config file
+    such as:
+
+        {
+            "default_tier": "low",
+            "tiers": {
+                "low": {"model_name": "micro_1"},
+                "highest": {"model_name": "r9p0_3500kparams_approx_9_blocks_model"}
+            }
+        }
+
+    Each tier's model is found at base_path/model_bundles/model_name if that exists, else at
+    base_path/models/model_name. A tier may instead give an explicit "model_path", relative to base_path or absolute.
+
+    A tier whose model is missing is skipped with a warning, and requests for it are served by the default tier until
+    its model appears. The default tier's model must exist.
+
+    reload_changed_models reloads any model whose files changed, and the whole config if it changed, swapping in the
+    new models only once they are loaded and warmed, so requests keep being served by the old models meanwhile.
+    """
+
+    def __init__(self, config_file_path, base_path):
+        """
+        config_file_path: Path to the JSON config file of the tiers
+        base_path: Directory holding the model_bundles and models directories
+        """
+
+        self.config_file_path = config_file_path
+        self.base_path = base_path
+
+        self.lock = threading.Lock()
+        self.reload_lock = threading.Lock()
+
+        self.config_signature = None
+        self.tier_configs = {}
+        self.default_tier = None
+        self.entries = {}
+        self.missing_tiers = []
+
+        self.reload_changed_models()
+
+    def get_model_path(self, tier_config):
+        """
+        Returns the path of the model described by tier_config.
+        """
+
+        if 'model_path' in tier_config:
+            return os.path.join(self.base_path, tier_config['model_path'])
+
+        model_bundle_path = os.path.join(self.base_path, 'model_bundles', tier_config['model_name'])
+
+        if os.path.exists(model_bundle_path):
+            return model_bundle_path
+
+        return os.path.join(self.base_path, 'models', tier_config['model_name'])
+
+    def load_entry(self, tier, tier_config):
+        """
+        Returns a registry entry dictionary for tier, with its model loaded, prepared and warmed.
+        """
+
+        model_path = self.get_model_path(tier_config)
+        model_signature = get_model_modification_signature(model_path)
+
+        print("Loading model for tier " + tier + " from " + model_path)
+
+        start = time.time()
+        prepared_model = PreparedModel.from_model_path(model_path)
+        warm_prepared_model(prepared_model)
+
+        print("Loaded and warmed model for tier " + tier + " in " + str(round(time.time() - start, 3)) + " seconds")
+
+        return {
+            'tier': tier,
+            'model_name': tier_config.get('model_name', os.path.basename(os.path.normpath(model_path))),
+            'model_path': model_path,
+            'model_signature': model_signature,
+            'prepared_model': prepared_model,
+        }
+
+    def reload_changed_models(self):
+        """
+        Rereads the config file if it changed and (re)loads every tier whose model is new or whose files changed.
+        Returns the list of tiers that were (re)loaded. The new config is only kept once all of its models are loaded,
+        so a failed reload is retried with the same config on the next call.
+        """
+
+        with self.reload_lock:
+            config_signature = get_model_modification_signature(self.config_file_path)
+
+            if config_signature != self.config_signature:
+                config = load_dictionary_from_json_file(self.config_file_path)
+                tier_configs = config['tiers']
+
+                if config.get('default_tier') not in tier_configs:
+                    raise Exception("The default_tier of the model registry config must be one of its tiers.")
+
+                default_tier = config['default_tier']
+            else:
+                tier_configs = self.tier_configs
+                default_tier = self.default_tier
+
+            new_entries = {}
+            missing_tiers = []
+            reloaded_tiers = []
+
+            for tier, tier_config in tier_configs.items():
+                entry = self.entries.get(tier)
+                model_path = self.get_model_path(tier_config)
+
+                if not is_model_available(model_path):
+                    if tier == default_tier:
+                        raise Exception("The model " + model_path + " of the default tier " + tier + " is missing.")
+
+                    if tier not in self.missing_tiers:
+                        print("Warning: the model " + model_path + " of tier " + tier + " is missing, so tier " + tier +
+                              " is served by the default tier " + default_tier + ".")
+
+                    missing_tiers.append(tier)
+                    continue
+
+                if (entry == None) or (entry['model_path'] != model_path) or (
+                        entry['model_signature'] != get_model_modification_signature(model_path)):
+                    entry = self.load_entry(tier, tier_config)
+                    reloaded_tiers.append(tier)
+
+                new_entries[tier] = entry
+
+            with self.lock:
+                self.entries = new_entries
+                self.missing_tiers = missing_tiers
+                self.default_tier = default_tier
+
+            self.tier_configs = tier_configs
+            self.config_signature = config_signature
+
+            return reloaded_tiers
+
+    def start_reload_thread(self, check_interval_in_seconds=DEFAULT_RELOAD_CHECK_INTERVAL_IN_SECONDS):
+        """
+        Starts a daemon thread calling reload_changed_models every check_interval_in_seconds seconds. A failed reload
+        is printed and the previous models are kept.
+        """
+
+        def reload_periodically():
+            while True:
+                time.sleep(check_interval_in_seconds)
+
+                try:
+                    reloaded_tiers = self.reload_changed_models()
+
+                    if len(reloaded_tiers) != 0:
+                        print("Reloaded models for tiers: " + ", ".join(reloaded_tiers))
+                except Exception as exception:
+                    print("Model registry reload failed, keeping the current models: " + str(exception))
+
+        reload_thread = threading.Thread(target=reload_periodically, daemon=True)
+        reload_thread.start()
+
+        return reload_thread
+
+    def get_tiers(self):
+        """
+        Returns the list of tier names served, including those served by the default tier while their model is missing.
+        """
+
+        with self.lock:
+            return list(self.entries.keys()) + self.missing_tiers
+
+    def get_entry(self, tier=None):
+        """
+        Returns the registry entry dictionary (tier, model_name, model_path, prepared_model) of tier, or of the default
+        tier if tier is None or its model is missing. The entry's tier is the tier actually served. Raises an exception
+        for an unknown tier.
+        """
+
+        with self.lock:
+            if (tier == None) or (tier in self.missing_tiers):
+                tier = self.default_tier
+
+            if tier not in self.entries:
+                raise Exception("Unknown model complexity " + str(tier) + ". Available model complexities are " +
+                                ", ".join(list(self.entries.keys()) + self.missing_tiers) + ".")
+
+            return self.entries[tier]
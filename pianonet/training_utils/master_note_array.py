@@ -1,8 +1,6 @@
-import random
-
 import numpy as np
 
-from pianonet.core.misc_tools import get_noisily_spaced_floats
+from pianonet.core.misc_tools import get_noisily_spaced_floats, get_random_generator
 from pianonet.core.note_array import NoteArray
 from pianonet.core.pianoroll import Pianoroll
 
@@ -30,6 +28,7 @@ class MasterNoteArray(NoteArray):
                  stretch_range=None,
                  end_padding_range_in_seconds=[0, 0],
                  time_steps_crop_range=None,
+                 random_seed=None,
                  ):
         """
         file_path: Optional, can initialize by loading a previously saved master note array from disc
@@ -39,6 +38,8 @@ class MasterNoteArray(NoteArray):
         stretch_range: A tuple of two floats in range (0.0, infinity) specifying the valid range for stretch fractions
         end_padding_range_in_seconds: Range of how much padding in seconds to add to the ends of pianorolls
         time_steps_crop_range: Mostly for debugging - chop each pianoroll to be within time_steps_crop_range timesteps
+        random_seed: Optional integer seed or numpy.random.Generator for the stretches, end paddings and shuffling. The
+                     same seed and midi files always give the same master note array.
         """
 
         if file_path != None:
@@ -52,16 +53,18 @@ class MasterNoteArray(NoteArray):
             self.end_padding_range_in_seconds = end_padding_range_in_seconds
             self.time_steps_crop_range = time_steps_crop_range
 
-            self.array = self.get_concatenated_flat_array()
+            self.array = self.get_concatenated_flat_array(random_generator=get_random_generator(random_seed))
 
-    def get_concatenated_flat_array(self):
+    def get_concatenated_flat_array(self, random_generator):
         """
         Take the flat arrays list generated in get_flat_arrays_list and concatenate together into a single flat array.
+
+        random_generator: numpy.random.Generator used for the augmentations and the shuffling
         """
 
-        flat_arrays_list = self.get_flat_arrays_list()
+        flat_arrays_list = self.get_flat_arrays_list(random_generator=random_generator)
 
-        random.shuffle(flat_arrays_list)
+        random_generator.shuffle(flat_arrays_list)
 
         total_array_length = np.sum([flat_array.shape[0] for flat_array in flat_arrays_list])
 
@@ -76,7 +79,7 @@ class MasterNoteArray(NoteArray):
 
         return master_flat_array
 
-    def get_flat_arrays_list(self):
+    def get_flat_arrays_list(self, random_generator):
         """
         Create the list of flat arrays from the midi files list using the following steps:
 
@@ -90,6 +93,8 @@ class MasterNoteArray(NoteArray):
                 iii. Create cropped and down-sampled NoteArray instance from this pianoroll using note_array_creator
             d. Add NoteArray instance's 1D array values of booleans to a list
         2. Concatenate the full list of 1D arrays into a single master flat array by concatenating their values.
+
+        random_generator: numpy.random.Generator used for the stretch fractions and end paddings
         """
 
         flat_arrays_list = []
@@ -107,7 +112,8 @@ class MasterNoteArray(NoteArray):
 
             stretch_fractions = get_noisily_spaced_floats(start=self.stretch_range[0],
                                                           end=self.stretch_range[1],
-                                                          num_points=self.num_augmentations_per_midi_file)
+                                                          num_points=self.num_augmentations_per_midi_file,
+                                                          random_generator=random_generator)
 
             for i in range(self.num_augmentations_per_midi_file):
                 stretch_fraction = stretch_fractions[i]
@@ -115,8 +121,9 @@ class MasterNoteArray(NoteArray):
                 stretched_pianoroll = pianoroll.get_stretched(stretch_fraction=stretch_fraction)
 
                 time_steps_per_second = 48
-                end_padding_time_steps = random.uniform(self.end_padding_range_in_seconds[0] * time_steps_per_second,
-                                                        self.end_padding_range_in_seconds[1] * time_steps_per_second)
+                end_padding_time_steps = random_generator.uniform(
+                    self.end_padding_range_in_seconds[0] * time_steps_per_second,
+                    self.end_padding_range_in_seconds[1] * time_steps_per_second)
 
                 stretched_pianoroll.add_zero_padding(right_padding_timesteps=int(end_padding_time_steps))
 
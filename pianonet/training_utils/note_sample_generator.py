@@ -1,6 +1,6 @@
 import numpy as np
 
-from pianonet.core.misc_tools import get_hash_string_of_numpy_array
+from pianonet.core.misc_tools import get_hash_string_of_numpy_array, get_random_generator
 from pianonet.core.misc_tools import save_dictionary_to_json_file, load_dictionary_from_json_file
 
 
@@ -31,7 +31,7 @@ class NoteSampleGenerator(object):
         num_notes_in_model_input: The size of the expected input for the 1D convnet
         num_predicted_notes_in_sample: Predicted notes given in each sample (the model's 'headway' for sliding forward)
         batch_size: How many pairs of input and target arrays to return per generator call
-        random_seed: Integer for controlling randomization of the sampled start indices
+        random_seed: Integer seed or numpy.random.Generator for controlling randomization of the sampled start indices
         """
 
         self.master_note_array = master_note_array
@@ -47,8 +47,7 @@ class NoteSampleGenerator(object):
                                                              stop=self.master_note_array.get_length_in_notes(),
                                                              step=self.num_predicted_notes_in_sample)
 
-        np.random.seed(random_seed)
-        np.random.shuffle(self.randomized_prediction_start_indices)
+        get_random_generator(random_seed).shuffle(self.randomized_prediction_start_indices)
 
     def __iter__(self):
         """
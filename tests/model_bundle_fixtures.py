@@ -0,0 +1,84 @@
+import numpy as np
+
+from pianonet.core.note_array_transformer import NoteArrayTransformer
+from pianonet.generation.model_bundle import ModelBundle
+
+NUM_KEYS = 72
+MIN_KEY_INDEX = 31
+
+AVERSION_PARAMS_DICT = {'probability_thresholds': [1.0, 1.0, 0.4, 0.05, 0.05, 0.05, 0.03, 0.03]}
+
+
+def get_test_model_bundle(num_blocks=2,
+                          num_layers_per_block=3,
+                          filters=8,
+                          kernel_size=2,
+                          activation='elu',
+                          use_layer_normalization=False,
+                          random_seed=0):
+    """
+    Returns a small ModelBundle with random weights and the architecture of the shipped models: blocks of causal conv
+    layers whose dilation rate doubles within each block, each followed by an optional layer normalization and an
+    activation, then a single filter conv layer with a sigmoid giving the note probability.
+
+    num_blocks: Number of blocks of conv layers
+    num_layers_per_block: Number of conv layers in each block, with dilation rates 1, 2, 4, ...
+    filters: Number of filters of every hidden conv layer
+    kernel_size: Kernel size of the hidden conv layers after the first, whose kernel size is always 2
+    activation: Name of the activation following each hidden conv layer
+    use_layer_normalization: If true, a layer normalization is placed between each hidden conv layer and its activation
+    random_seed: Seed of the random weights
+    """
+
+    random_generator = np.random.default_rng(random_seed)
+
+    layer_descriptions = []
+    layer_weights = []
+    num_input_channels = 1
+
+    for block_index in range(0, num_blocks):
+        for layer_index in range(0, num_layers_per_block):
+            layer_kernel_size = 2 if (block_index == 0 and layer_index == 0) else kernel_size
+
+            layer_descriptions.append({'class_name': 'Conv1D', 'kernel_size': layer_kernel_size,
+                                       'dilation_rate': 2 ** layer_index, 'filters': filters, 'activation': 'linear'})
+            layer_weights.append([
+                random_generator.normal(0.0, 0.5, (layer_kernel_size, num_input_channels, filters)).astype('float32'),
+                random_generator.normal(0.0, 0.1, (filters,)).astype('float32'),
+            ])
+
+            if use_layer_normalization:
+                layer_descriptions.append({'class_name': 'LayerNormalization', 'axis': [2], 'epsilon': 0.001})
+                layer_weights.append([random_generator.normal(1.0, 0.1, (filters,)).astype('float32'),
+                                      random_generator.normal(0.0, 0.1, (filters,)).astype('float32')])
+
+            layer_descriptions.append({'class_name': 'Activation', 'activation': activation})
+            layer_weights.append([])
+
+            num_input_channels = filters
+
+    layer_descriptions.append({'class_name': 'Conv1D', 'kernel_size': 1, 'dilation_rate': 1, 'filters': 1,
+                               'activation': 'linear'})
+    layer_weights.append([random_generator.normal(0.0, 0.5, (1, num_input_channels, 1)).astype('float32'),
+                          np.array([-1.0], dtype='float32')])
+
+    layer_descriptions.append({'class_name': 'Activation', 'activation': 'sigmoid'})
+    layer_weights.append([])
+
+    return ModelBundle(layer_descriptions=layer_descriptions,
+                       layer_weights=layer_weights,
+                       num_keys=NUM_KEYS,
+                       min_key_index=MIN_KEY_INDEX)
+
+
+def get_test_seed_note_arrays(num_seed_time_steps_list):
+    """
+    Returns a list of random seed NoteArrays of the test models' keys, one with each number of time steps.
+    """
+
+    note_array_transformer = NoteArrayTransformer(min_key_index=MIN_KEY_INDEX, num_keys=NUM_KEYS)
+    random_generator = np.random.default_rng(0)
+
+    return [note_array_transformer.get_note_array(
+        flat_array=random_generator.random(num_seed_time_steps * NUM_KEYS) < 0.05) for num_seed_time_steps in
+        num_seed_time_steps_list]
@@ -0,0 +1,110 @@
+import unittest
+
+from prometheus_client.parser import text_string_to_metric_families
+
+from pianonet.serving import app as server
+
+
+class SeedMidiFileDataTest(unittest.TestCase):
+    """
+    Checks the parsing of seeds sent in the legacy comma separated byte encoding.
+    """
+
+    def test_bytes_from_comma_separated_string(self):
+        self.assertEqual(server.get_bytes_from_comma_separated_string("77,84,104,100"), b'MThd')
+        self.assertEqual(server.get_bytes_from_comma_separated_string("0, 255"), b'\x00\xff')
+
+    def test_invalid_comma_separated_strings(self):
+        for comma_separated_string in ("", "77,,84", "77,a", "77,1.5", "77,-1", "77,256", "77,4294967373",
+                                       "77,99999999999999999999999"):
+            with self.subTest(comma_separated_string=comma_separated_string):
+                self.assertIsNone(server.get_bytes_from_comma_separated_string(comma_separated_string))
+
+    def test_invalid_seed_midi_file_data_is_a_bad_request(self):
+        response = server.app.test_client().post('/jobs', data={'seed_midi_file_data': "77,84,x",
+                                                                'seconds_to_generate': '1'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['code'], 'BadRequest')
+
+
+class SecondsToGenerateTest(unittest.TestCase):
+    """
+    Checks that performance requests for a length that is not a positive number up to the maximum are bad requests.
+    """
+
+    def assert_bad_request(self, seconds_to_generate):
+        # Lengths are checked before any model is loaded, so a seed that is only a midi file header is enough
+        response = server.app.test_client().post('/jobs?seconds_to_generate=' + seconds_to_generate,
+                                                 data=server.MIDI_FILE_HEADER + bytes(10),
+                                                 content_type='audio/midi')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['code'], 'BadRequest')
+        self.assertIn('seconds_to_generate', response.get_json()['message'])
+
+    def test_not_a_number(self):
+        self.assert_bad_request('abc')
+
+    def test_nan(self):
+        self.assert_bad_request('nan')
+
+    def test_infinite(self):
+        self.assert_bad_request('inf')
+
+    def test_negative(self):
+        self.assert_bad_request('-1')
+
+    def test_zero(self):
+        self.assert_bad_request('0')
+
+    def test_above_maximum(self):
+        self.assert_bad_request(str(server.max_seconds_to_generate + 1))
+
+
+class MetricsTest(unittest.TestCase):
+    """
+    Checks the metrics served in the Prometheus text format, and that requests are counted under their status.
+    """
+
+    def get_samples(self):
+        response = server.app.test_client().get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_type, server.CONTENT_TYPE_LATEST)
+
+        return [sample for metric_family in text_string_to_metric_families(response.get_data(as_text=True)) for
+                sample in metric_family.samples]
+
+    def get_request_count(self, endpoint, status):
+        request_counts = [sample.value for sample in self.get_samples() if
+                          (sample.name == 'pianonet_request_duration_seconds_count') and
+                          (sample.labels == {'endpoint': endpoint, 'method': 'POST', 'status': status})]
+
+        return request_counts[0] if len(request_counts) != 0 else 0.0
+
+    def test_server_gauges(self):
+        sample_names = [sample.name for sample in self.get_samples()]
+
+        for sample_name in ('pianonet_requests_in_flight', 'pianonet_generation_jobs_queued',
+                            'pianonet_generation_jobs_running', 'pianonet_artifacts_stored'):
+            self.assertIn(sample_name, sample_names)
+
+    def test_error_responses_are_counted_by_status(self):
+        test_client = server.app.test_client()
+
+        for endpoint, expected_status_code in (('/jobs', 400), ('/create-performance', 200)):
+            with self.subTest(endpoint=endpoint):
+                num_requests = self.get_request_count(endpoint, '400')
+
+                response = test_client.post(endpoint, data={'seconds_to_generate': '1'})
+
+                # /create-performance answers errors with HTTP status 200, but is counted under the error's http_code
+                self.assertEqual(response.status_code, expected_status_code)
+                self.assertEqual(response.get_json()['http_code'], 400)
+                self.assertEqual(self.get_request_count(endpoint, '400'), num_requests + 1)
+                self.assertEqual(self.get_request_count(endpoint, '200'), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
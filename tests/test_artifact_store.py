@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pianonet.serving.artifact_store import SPILLED_ARTIFACT_FILE_SUFFIX, ArtifactStore
+
+
+class ArtifactStoreTest(unittest.TestCase):
+    """
+    Checks that the artifact store keeps artifacts in memory up to its size, spills the oldest to disk beyond it within
+    the spill size, and drops every artifact once its time to live passes.
+    """
+
+    def setUp(self):
+        self.spill_directory_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.spill_directory_path, ignore_errors=True)
+
+    def get_spilled_file_names(self):
+        return sorted(os.listdir(self.spill_directory_path))
+
+    def test_put_and_get(self):
+        artifact_store = ArtifactStore(max_size_in_bytes=100)
+
+        artifact_store.put('a', b'first')
+        artifact_store.put('a', b'second')
+
+        self.assertEqual(artifact_store.get('a'), b'second')
+        self.assertTrue(artifact_store.contains('a'))
+        self.assertIsNone(artifact_store.get('b'))
+        self.assertEqual(artifact_store.get_num_artifacts(), 1)
+        self.assertEqual(artifact_store.size_in_bytes, len(b'second'))
+
+    def test_oldest_artifacts_are_dropped_without_spill_directory(self):
+        artifact_store = ArtifactStore(max_size_in_bytes=20)
+
+        for name in ('a', 'b', 'c'):
+            artifact_store.put(name, bytes(8))
+
+        self.assertIsNone(artifact_store.get('a'))
+        self.assertEqual(artifact_store.get('c'), bytes(8))
+        self.assertEqual(artifact_store.get_num_artifacts(), 2)
+
+        artifact_store.put('large', bytes(21))
+
+        self.assertFalse(artifact_store.contains('large'))
+
+    def test_oldest_artifacts_are_spilled(self):
+        artifact_store = ArtifactStore(max_size_in_bytes=20, spill_directory_path=self.spill_directory_path,
+                                       max_spill_size_in_bytes=20)
+
+        for name in ('a', 'b', 'c', 'd', 'e'):
+            artifact_store.put(name, name.encode() * 8)
+
+        # d and e fit in memory, b and c are spilled, and a was spilled and then dropped to keep the spill size
+        self.assertEqual(list(artifact_store.artifacts.keys()), ['d', 'e'])
+        self.assertEqual(self.get_spilled_file_names(), ['b' + SPILLED_ARTIFACT_FILE_SUFFIX,
+                                                         'c' + SPILLED_ARTIFACT_FILE_SUFFIX])
+        self.assertEqual(artifact_store.get('b'), b'b' * 8)
+        self.assertIsNone(artifact_store.get('a'))
+        self.assertEqual(artifact_store.get_num_artifacts(), 4)
+
+        artifact_store.put('b', b'new')
+
+        self.assertEqual(artifact_store.get('b'), b'new')
+        self.assertEqual(self.get_spilled_file_names(), ['c' + SPILLED_ARTIFACT_FILE_SUFFIX])
+
+    def test_artifacts_expire(self):
+        artifact_store = ArtifactStore(max_size_in_bytes=10, time_to_live_in_seconds=0.2,
+                                       spill_directory_path=self.spill_directory_path)
+
+        artifact_store.put('spilled', bytes(8))
+        artifact_store.put('kept', bytes(8))
+
+        self.assertTrue(artifact_store.contains('spilled'))
+        self.assertEqual(len(self.get_spilled_file_names()), 1)
+
+        time.sleep(0.3)
+
+        self.assertIsNone(artifact_store.get('kept'))
+        self.assertFalse(artifact_store.contains('spilled'))
+        self.assertEqual(artifact_store.get_num_artifacts(), 0)
+        self.assertEqual(self.get_spilled_file_names(), [])
+        self.assertEqual(artifact_store.size_in_bytes, 0)
+        self.assertEqual(artifact_store.spill_size_in_bytes, 0)
+
+    def test_spilled_files_of_earlier_stores_are_deleted(self):
+        earlier_artifact_store = ArtifactStore(max_size_in_bytes=10, spill_directory_path=self.spill_directory_path)
+        earlier_artifact_store.put('a', bytes(8))
+        earlier_artifact_store.put('b', bytes(8))
+
+        self.assertEqual(self.get_spilled_file_names(), ['a' + SPILLED_ARTIFACT_FILE_SUFFIX])
+
+        artifact_store = ArtifactStore(max_size_in_bytes=10, spill_directory_path=self.spill_directory_path)
+
+        self.assertEqual(self.get_spilled_file_names(), [])
+
+        artifact_store.put('b', bytes(8))
+        artifact_store.put('c', bytes(8))
+
+        self.assertEqual(self.get_spilled_file_names(), ['b' + SPILLED_ARTIFACT_FILE_SUFFIX])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import hashlib
+import unittest
+
+from pianonet.serving.content_cache import ContentCache, get_content_hash_string
+
+
+class ContentCacheTest(unittest.TestCase):
+    """
+    Checks that the content cache keeps values up to its size, dropping the least recently used first, and counts its
+    hits and misses.
+    """
+
+    def test_get_and_put(self):
+        content_cache = ContentCache(max_size=10)
+
+        self.assertIsNone(content_cache.get('a'))
+
+        content_cache.put('a', 'first', size=4)
+        content_cache.put('a', 'second', size=6)
+
+        self.assertEqual(content_cache.get('a'), 'second')
+        self.assertEqual(content_cache.get_num_entries(), 1)
+        self.assertEqual(content_cache.size, 6)
+        self.assertEqual((content_cache.num_hits, content_cache.num_misses), (1, 1))
+
+    def test_least_recently_used_values_are_dropped(self):
+        content_cache = ContentCache(max_size=3)
+
+        for key in ('a', 'b', 'c'):
+            content_cache.put(key, key.upper())
+
+        # Reading a makes b the least recently used
+        self.assertEqual(content_cache.get('a'), 'A')
+
+        content_cache.put('d', 'D')
+
+        self.assertIsNone(content_cache.get('b'))
+        self.assertEqual([content_cache.get(key) for key in ('a', 'c', 'd')], ['A', 'C', 'D'])
+
+    def test_sizes(self):
+        content_cache = ContentCache(max_size=10)
+
+        content_cache.put('a', 'A', size=4)
+        content_cache.put('b', 'B', size=4)
+        content_cache.put('c', 'C', size=5)
+
+        self.assertIsNone(content_cache.get('a'))
+        self.assertEqual(content_cache.get('b'), 'B')
+        self.assertEqual(content_cache.size, 9)
+
+        content_cache.put('large', 'L', size=11)
+
+        self.assertIsNone(content_cache.get('large'))
+        self.assertEqual(content_cache.get_num_entries(), 2)
+
+    def test_content_hash_string(self):
+        self.assertEqual(get_content_hash_string(b'MThd'), hashlib.sha256(b'MThd').hexdigest())
+        self.assertNotEqual(get_content_hash_string(b'MThd'), get_content_hash_string(b'MThe'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import unittest
+
+import numpy as np
+
+from model_bundle_fixtures import AVERSION_PARAMS_DICT, get_test_model_bundle, get_test_seed_note_arrays
+from pianonet.generation.generation_engine import GenerationEngine, get_performances_from_prepared_model
+from pianonet.generation.model_bundle import get_quantized_model_bundle
+from pianonet.generation.prepared_model import PreparedModel
+from pianonet.model_inspection.engine_verification import get_engine_errors, get_engine_recording, \
+    get_verification_seed_flat_arrays
+
+NUM_SEED_TIME_STEPS = 40
+NUM_GENERATED_TIME_STEPS = 4
+
+# Max error of the note probabilities, and of hidden layers relative to their largest absolute value if above one
+PROBABILITY_TOLERANCE = 1e-5
+HIDDEN_LAYER_TOLERANCE = 1e-4
+
+
+class GenerationEngineForwardPassTest(unittest.TestCase):
+    """
+    Checks that the queue-based engine computes what a full causal forward pass of the model computes, layer by layer.
+    """
+
+    def assert_engine_matches_forward_pass(self, model_bundle, num_performances):
+        prepared_model = PreparedModel(model_bundle=model_bundle)
+
+        recording = get_engine_recording(prepared_model=prepared_model,
+                                         seed_flat_arrays=get_verification_seed_flat_arrays(
+                                             num_keys=model_bundle.num_keys,
+                                             num_performances=num_performances,
+                                             num_seed_time_steps=NUM_SEED_TIME_STEPS),
+                                         num_time_steps=NUM_GENERATED_TIME_STEPS,
+                                         random_seeds=list(range(0, num_performances)))
+
+        layer_errors = get_engine_errors(prepared_model=prepared_model, recording=recording)
+
+        for layer_error in layer_errors[:-1]:
+            self.assertLessEqual(layer_error['max_error'],
+                                 HIDDEN_LAYER_TOLERANCE * max(1.0, layer_error['reference_scale']),
+                                 msg=layer_error['name'])
+
+        self.assertLessEqual(layer_errors[-1]['max_error'], PROBABILITY_TOLERANCE)
+
+    def test_single_performance(self):
+        self.assert_engine_matches_forward_pass(get_test_model_bundle(), num_performances=1)
+
+    def test_batched_performances(self):
+        self.assert_engine_matches_forward_pass(get_test_model_bundle(), num_performances=3)
+
+    def test_layer_normalization(self):
+        self.assert_engine_matches_forward_pass(get_test_model_bundle(use_layer_normalization=True),
+                                                num_performances=2)
+
+    def test_kernel_size(self):
+        self.assert_engine_matches_forward_pass(get_test_model_bundle(kernel_size=3), num_performances=2)
+
+    def test_reduced_precision(self):
+        for weight_precision in ('float16', 'int8'):
+            with self.subTest(weight_precision=weight_precision):
+                self.assert_engine_matches_forward_pass(get_quantized_model_bundle(
+                    model_bundle=get_test_model_bundle(use_layer_normalization=True),
+                    weight_precision=weight_precision), num_performances=2)
+
+    def test_activations(self):
+        for activation in ('relu', 'selu', 'tanh', 'softsign', 'swish'):
+            with self.subTest(activation=activation):
+                self.assert_engine_matches_forward_pass(get_test_model_bundle(activation=activation),
+                                                        num_performances=2)
+
+
+class BatchedGenerationTest(unittest.TestCase):
+    """
+    Checks that a performance only depends on its own seed, random seed and length, never on the rest of its batch.
+    """
+
+    def setUp(self):
+        self.prepared_model = PreparedModel(model_bundle=get_test_model_bundle())
+        self.seed_note_arrays = get_test_seed_note_arrays([40, 25, 60])
+        self.num_time_steps_list = [6, 3, 5]
+        self.random_seeds = [11, 12, 13]
+
+    def get_performances(self, indices):
+        return get_performances_from_prepared_model(prepared_model=self.prepared_model,
+                                                    seed_note_arrays=[self.seed_note_arrays[i] for i in indices],
+                                                    num_time_steps_list=[self.num_time_steps_list[i] for i in indices],
+                                                    random_seeds=[self.random_seeds[i] for i in indices],
+                                                    use_edge_aversion=True,
+                                                    aversion_params_dict=AVERSION_PARAMS_DICT)
+
+    def test_batched_equals_single_stream(self):
+        batched_performances = self.get_performances([0, 1, 2])
+
+        for index, batched_performance in enumerate(batched_performances):
+            single_performance = self.get_performances([index])[0]
+
+            np.testing.assert_array_equal(batched_performance.array, single_performance.array)
+
+    def test_uneven_long_performances_equal_single_stream(self):
+        prepared_model = PreparedModel(model_bundle=get_test_model_bundle(kernel_size=3, use_layer_normalization=True))
+        seed_note_arrays = get_test_seed_note_arrays([50, 20, 90, 35])
+        num_time_steps_list = [96, 5, 61, 30]
+
+        batched_performances = get_performances_from_prepared_model(prepared_model=prepared_model,
+                                                                    seed_note_arrays=seed_note_arrays,
+                                                                    num_time_steps_list=num_time_steps_list,
+                                                                    random_seeds=[1, 2, 3, 4],
+                                                                    use_edge_aversion=True,
+                                                                    aversion_params_dict=AVERSION_PARAMS_DICT)
+
+        for index, batched_performance in enumerate(batched_performances):
+            single_performance = get_performances_from_prepared_model(
+                prepared_model=prepared_model,
+                seed_note_arrays=[seed_note_arrays[index]],
+                num_time_steps_list=[num_time_steps_list[index]],
+                random_seeds=[index + 1],
+                use_edge_aversion=True,
+                aversion_params_dict=AVERSION_PARAMS_DICT)[0]
+
+            np.testing.assert_array_equal(batched_performance.array, single_performance.array)
+
+    def test_batch_order_does_not_matter(self):
+        performances = self.get_performances([0, 1, 2])
+        reversed_performances = self.get_performances([2, 1, 0])
+
+        for performance, reversed_performance in zip(performances, reversed_performances[::-1]):
+            np.testing.assert_array_equal(performance.array, reversed_performance.array)
+
+    def test_same_random_seed_gives_same_performance(self):
+        first_performance = self.get_performances([0])[0]
+        second_performance = self.get_performances([0])[0]
+
+        np.testing.assert_array_equal(first_performance.array, second_performance.array)
+
+    def test_different_random_seeds_give_different_performances(self):
+        seed_flat_arrays = [self.seed_note_arrays[0].array] * 2
+        generation_engine = GenerationEngine(prepared_model=self.prepared_model,
+                                             seed_flat_arrays=seed_flat_arrays,
+                                             random_seeds=[0, 1])
+
+        key_states = np.concatenate([generation_engine.generate_time_step() for i in range(0, 8)], axis=1)
+
+        self.assertFalse(np.array_equal(key_states[0], key_states[1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
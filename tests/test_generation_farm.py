@@ -0,0 +1,76 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from model_bundle_fixtures import AVERSION_PARAMS_DICT, get_test_model_bundle, get_test_seed_note_arrays
+from pianonet.generation.generation_engine import get_performances_from_prepared_model
+from pianonet.generation.generation_farm import GenerationFarm
+from pianonet.generation.prepared_model import PreparedModel
+
+
+class GenerationFarmTest(unittest.TestCase):
+    """
+    Checks that performances generated in the farm's worker processes equal those generated in this process.
+    """
+
+    def setUp(self):
+        self.model_bundle = get_test_model_bundle()
+        self.model_directory_path = tempfile.mkdtemp()
+        self.model_bundle.save(self.model_directory_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.model_directory_path, ignore_errors=True)
+
+    def test_farm_equals_engine(self):
+        seed_note_arrays = get_test_seed_note_arrays([40, 25, 60])
+        num_time_steps_list = [4, 2, 3]
+        random_seeds = [5, 6, 7]
+
+        with GenerationFarm(model_path=self.model_directory_path, num_workers=2) as generation_farm:
+            farm_performances = generation_farm.get_performances(seed_note_arrays=seed_note_arrays,
+                                                                 num_time_steps_list=num_time_steps_list,
+                                                                 random_seeds=random_seeds)
+
+        engine_performances = get_performances_from_prepared_model(
+            prepared_model=PreparedModel(model_bundle=self.model_bundle),
+            seed_note_arrays=seed_note_arrays,
+            num_time_steps_list=num_time_steps_list,
+            random_seeds=random_seeds)
+
+        for farm_performance, engine_performance in zip(farm_performances, engine_performances):
+            np.testing.assert_array_equal(farm_performance.array, engine_performance.array)
+
+    def test_farm_equals_single_stream_for_uneven_long_performances(self):
+        model_bundle = get_test_model_bundle(kernel_size=3, use_layer_normalization=True, random_seed=2)
+        model_bundle.save(self.model_directory_path)
+
+        seed_note_arrays = get_test_seed_note_arrays([50, 20, 90, 35])
+        num_time_steps_list = [96, 5, 61, 30]
+        random_seeds = [1, 2, 3, 4]
+
+        with GenerationFarm(model_path=self.model_directory_path, num_workers=2) as generation_farm:
+            farm_performances = generation_farm.get_performances(seed_note_arrays=seed_note_arrays,
+                                                                 num_time_steps_list=num_time_steps_list,
+                                                                 random_seeds=random_seeds,
+                                                                 use_edge_aversion=True,
+                                                                 aversion_params_dict=AVERSION_PARAMS_DICT)
+
+        prepared_model = PreparedModel(model_bundle=model_bundle)
+
+        for index, farm_performance in enumerate(farm_performances):
+            single_performance = get_performances_from_prepared_model(
+                prepared_model=prepared_model,
+                seed_note_arrays=[seed_note_arrays[index]],
+                num_time_steps_list=[num_time_steps_list[index]],
+                random_seeds=[random_seeds[index]],
+                use_edge_aversion=True,
+                aversion_params_dict=AVERSION_PARAMS_DICT)[0]
+
+            self.assertEqual(len(farm_performance.array), len(single_performance.array))
+            np.testing.assert_array_equal(farm_performance.array, single_performance.array)
+
+
+if __name__ == '__main__':
+    unittest.main()
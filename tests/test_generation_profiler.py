@@ -0,0 +1,84 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from model_bundle_fixtures import AVERSION_PARAMS_DICT, NUM_KEYS, get_test_model_bundle, get_test_seed_note_arrays
+from pianonet.generation.generation_engine import get_performances_from_prepared_model
+from pianonet.generation.generation_profiler import PHASE_NAMES, GenerationProfiler
+from pianonet.generation.prepared_model import PreparedModel
+
+
+class ProfiledGenerationEngineTest(unittest.TestCase):
+    """
+    Checks that profiling generation changes none of the generated notes and records every phase and fast path layer.
+    """
+
+    def setUp(self):
+        self.prepared_model = PreparedModel(model_bundle=get_test_model_bundle(use_layer_normalization=True))
+        self.seed_note_arrays = get_test_seed_note_arrays([40, 25])
+        self.num_time_steps_list = [12, 7]
+
+    def get_performances(self, profiler=None):
+        return get_performances_from_prepared_model(prepared_model=self.prepared_model,
+                                                    seed_note_arrays=self.seed_note_arrays,
+                                                    num_time_steps_list=self.num_time_steps_list,
+                                                    random_seeds=[3, 4],
+                                                    use_edge_aversion=True,
+                                                    aversion_params_dict=AVERSION_PARAMS_DICT,
+                                                    profiler=profiler)
+
+    def test_profiled_equals_unprofiled(self):
+        performances = self.get_performances()
+        profiled_performances = self.get_performances(profiler=GenerationProfiler())
+
+        for performance, profiled_performance in zip(performances, profiled_performances):
+            np.testing.assert_array_equal(performance.array, profiled_performance.array)
+
+    def test_report_records_phases_and_layers(self):
+        profiler = GenerationProfiler()
+        self.get_performances(profiler=profiler)
+
+        report = profiler.get_report()
+        num_time_steps = max(self.num_time_steps_list)
+
+        self.assertEqual(report['num_time_steps_generated'], num_time_steps)
+        self.assertAlmostEqual(report['seconds_of_audio'], sum(self.num_time_steps_list) / 48)
+        self.assertGreater(report['realtime_factor'], 0.0)
+
+        for phase_name in PHASE_NAMES:
+            self.assertGreater(report['phases'][phase_name]['calls'], 0, msg=phase_name)
+
+        # Every time step computes, samples and adds the notes of one key at a time
+        for phase_name in ('note_compute', 'sampling', 'add_notes'):
+            self.assertEqual(report['phases'][phase_name]['calls'], num_time_steps * NUM_KEYS, msg=phase_name)
+
+        self.assertEqual(len(report['layers']), len(self.prepared_model.fast_path_layers))
+
+        for layer_timing in report['layers']:
+            self.assertEqual(layer_timing['calls'], num_time_steps * NUM_KEYS, msg=layer_timing['name'])
+
+        self.assertGreater(report['layers'][0]['table_lookup_seconds'], 0.0)
+        self.assertGreater(report['layers'][-1]['matmul_seconds'], 0.0)
+
+    def test_save_writes_report(self):
+        directory_path = tempfile.mkdtemp()
+
+        try:
+            profiler = GenerationProfiler()
+            self.get_performances(profiler=profiler)
+
+            file_path = os.path.join(directory_path, 'profile.json')
+            profiler.save(file_path)
+
+            with open(file_path) as json_file:
+                self.assertEqual(json.load(json_file)['num_time_steps_generated'], max(self.num_time_steps_list))
+        finally:
+            shutil.rmtree(directory_path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+import numpy as np
+
+from model_bundle_fixtures import AVERSION_PARAMS_DICT, get_test_model_bundle, get_test_seed_note_arrays
+from pianonet.generation.generation_session import GenerationSession
+from pianonet.generation.prepared_model import PreparedModel
+
+
+class GenerationSessionTest(unittest.TestCase):
+    """
+    Checks that serialized, restored and forked sessions continue exactly where the original session was.
+    """
+
+    def setUp(self):
+        self.prepared_model = PreparedModel(model_bundle=get_test_model_bundle())
+        self.session = GenerationSession(prepared_model=self.prepared_model,
+                                         seed_note_array=get_test_seed_note_arrays([40])[0],
+                                         random_seed=3,
+                                         use_edge_aversion=True,
+                                         aversion_params_dict=AVERSION_PARAMS_DICT)
+        self.session.generate(num_time_steps=3)
+
+    def test_serialization_round_trip(self):
+        restored_session = GenerationSession.from_bytes(self.prepared_model, self.session.to_bytes())
+
+        self.assertEqual(restored_session.num_time_steps_generated, self.session.num_time_steps_generated)
+        np.testing.assert_array_equal(restored_session.generate(num_time_steps=5),
+                                      self.session.generate(num_time_steps=5))
+
+    def test_restoring_twice_gives_same_continuation(self):
+        session_bytes = self.session.to_bytes()
+
+        first_continuation = GenerationSession.from_bytes(self.prepared_model, session_bytes).generate(4)
+        second_continuation = GenerationSession.from_bytes(self.prepared_model, session_bytes).generate(4)
+
+        np.testing.assert_array_equal(first_continuation, second_continuation)
+
+    def test_restoring_with_another_model_fails(self):
+        other_prepared_model = PreparedModel(model_bundle=get_test_model_bundle(random_seed=1))
+
+        with self.assertRaises(Exception):
+            GenerationSession.from_bytes(other_prepared_model, self.session.to_bytes())
+
+    def test_fork_keeping_random_state(self):
+        forked_session = self.session.fork(keep_random_state=True)
+
+        np.testing.assert_array_equal(forked_session.generate(num_time_steps=5),
+                                      self.session.generate(num_time_steps=5))
+
+    def test_fork_does_not_advance_original(self):
+        session_bytes = self.session.to_bytes()
+
+        self.session.fork(random_seed=7).generate(num_time_steps=5)
+
+        np.testing.assert_array_equal(self.session.generate(num_time_steps=4),
+                                      GenerationSession.from_bytes(self.prepared_model, session_bytes).generate(4))
+
+    def test_alternatives_equal_forks(self):
+        alternatives = self.session.generate_alternatives(num_alternatives=3, num_time_steps=4, random_seeds=[7, 8, 9])
+
+        for alternative, random_seed in zip(alternatives, [7, 8, 9]):
+            np.testing.assert_array_equal(alternative,
+                                          self.session.fork(random_seed=random_seed).generate(num_time_steps=4))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+import threading
+import unittest
+
+import numpy as np
+
+from model_bundle_fixtures import AVERSION_PARAMS_DICT, NUM_KEYS, get_test_model_bundle, get_test_seed_note_arrays
+from pianonet.generation.generation_engine import get_performances_from_prepared_model
+from pianonet.generation.prepared_model import PreparedModel
+from pianonet.serving.job_queue import GenerationJob, JobQueue, run_generation_jobs
+
+JOB_TIMEOUT_IN_SECONDS = 60.0
+
+
+class GenerationJobTestCase(unittest.TestCase):
+    """
+    Base class of the job queue tests, making jobs for random seeds of a small test model.
+    """
+
+    def setUp(self):
+        self.prepared_model = PreparedModel(model_bundle=get_test_model_bundle())
+        self.seed_note_arrays = get_test_seed_note_arrays([40, 25, 60])
+
+    def get_job(self, index, num_time_steps, stream_chunks=False):
+        return GenerationJob(prepared_model=self.prepared_model,
+                             seed_note_array=self.seed_note_arrays[index],
+                             num_time_steps=num_time_steps,
+                             random_seed=index,
+                             use_edge_aversion=True,
+                             aversion_params_dict=AVERSION_PARAMS_DICT,
+                             stream_chunks=stream_chunks)
+
+    def get_single_stream_performance(self, index, num_time_steps):
+        return get_performances_from_prepared_model(prepared_model=self.prepared_model,
+                                                    seed_note_arrays=[self.seed_note_arrays[index]],
+                                                    num_time_steps_list=[num_time_steps],
+                                                    random_seeds=[index],
+                                                    use_edge_aversion=True,
+                                                    aversion_params_dict=AVERSION_PARAMS_DICT)[0]
+
+
+class JobQueueTest(GenerationJobTestCase):
+    """
+    Checks that queued jobs generate the same performances as direct generation, and that the queue is bounded and
+    jobs can be cancelled whether queued or running.
+    """
+
+    def test_job_result_equals_single_stream(self):
+        job_queue = JobQueue(num_workers=1, chunk_size_in_time_steps=4)
+        job = self.get_job(0, num_time_steps=10, stream_chunks=True)
+
+        self.assertTrue(job_queue.submit_job(job))
+        self.assertIs(job_queue.get_job(job.job_id), job)
+
+        chunks = list(job.get_chunks())
+
+        self.assertTrue(job.wait(JOB_TIMEOUT_IN_SECONDS))
+        self.assertEqual(job.status, 'finished')
+        self.assertEqual(job.get_status_dictionary()['progress'], 1.0)
+        self.assertEqual([len(chunk) for chunk in chunks], [4, 4, 2])
+
+        single_stream_performance = self.get_single_stream_performance(0, num_time_steps=10)
+
+        np.testing.assert_array_equal(job.result.array, single_stream_performance.array)
+        np.testing.assert_array_equal(np.concatenate(chunks).flatten(),
+                                      single_stream_performance.array[-10 * NUM_KEYS:])
+
+    def test_queue_is_bounded(self):
+        job_queue = JobQueue(num_workers=0, max_queue_depth=2)
+
+        self.assertTrue(job_queue.submit_job(self.get_job(0, num_time_steps=4)))
+        self.assertTrue(job_queue.submit_job(self.get_job(1, num_time_steps=4)))
+        self.assertFalse(job_queue.submit_job(self.get_job(2, num_time_steps=4)))
+        self.assertEqual(job_queue.get_num_queued_jobs(), 2)
+
+    def test_cancel_queued_job(self):
+        job_queue = JobQueue(num_workers=0)
+        job = self.get_job(0, num_time_steps=4)
+        job_queue.submit_job(job)
+
+        self.assertIs(job_queue.cancel_job(job.job_id), job)
+        self.assertEqual(job.status, 'cancelled')
+        self.assertEqual(job_queue.get_num_queued_jobs(), 0)
+        self.assertIsNone(job_queue.cancel_job('unknown'))
+
+    def test_cancel_running_job(self):
+        job_queue = JobQueue(num_workers=1, chunk_size_in_time_steps=1)
+        job = self.get_job(0, num_time_steps=100000, stream_chunks=True)
+        job_queue.submit_job(job)
+
+        # The first chunk arrives once the job is running
+        next(job.get_chunks())
+        job_queue.cancel_job(job.job_id)
+
+        self.assertTrue(job.wait(JOB_TIMEOUT_IN_SECONDS))
+        self.assertEqual(job.status, 'cancelled')
+        self.assertLess(job.num_time_steps_done, job.num_time_steps)
+        self.assertIsNone(job.result)
+
+    def test_failed_jobs(self):
+        job_queue = JobQueue(num_workers=1)
+
+        failed_result_job = self.get_job(0, num_time_steps=4)
+        failed_result_job.get_result = lambda note_array: 1 / 0
+
+        # An engine cannot be restored from an empty warmed state
+        failed_engine_job = self.get_job(1, num_time_steps=4)
+        failed_engine_job.warmed_state = {}
+
+        for job in (failed_result_job, failed_engine_job):
+            job_queue.submit_job(job)
+
+            self.assertTrue(job.wait(JOB_TIMEOUT_IN_SECONDS))
+            self.assertEqual(job.status, 'failed')
+            self.assertIsNotNone(job.error)
+
+    def test_old_done_jobs_are_forgotten(self):
+        job_queue = JobQueue(num_workers=0, max_done_jobs=2)
+        jobs = [self.get_job(index, num_time_steps=2) for index in range(0, 3)]
+
+        for job in jobs:
+            job_queue.submit_job(job)
+            job_queue.cancel_job(job.job_id)
+
+        self.assertIsNone(job_queue.get_job(jobs[0].job_id))
+        self.assertIs(job_queue.get_job(jobs[2].job_id), jobs[2])
+
+
+class JobBatchingTest(GenerationJobTestCase):
+    """
+    Checks that jobs for the same model arriving together are generated as one batch, and that each batched
+    performance is the same as if generated alone.
+    """
+
+    def test_jobs_with_the_same_batch_key_are_taken_together(self):
+        job_queue = JobQueue(num_workers=0, max_batch_size=2, batch_window_in_seconds=0.0)
+
+        other_model_job = self.get_job(2, num_time_steps=4)
+        other_model_job.prepared_model = PreparedModel(model_bundle=get_test_model_bundle(random_seed=1))
+        jobs = [self.get_job(0, num_time_steps=4), other_model_job, self.get_job(1, num_time_steps=4),
+                self.get_job(2, num_time_steps=4)]
+
+        for job in jobs:
+            job_queue.submit_job(job)
+
+        self.assertEqual(job_queue.get_next_jobs(), [jobs[0], jobs[2]])
+        self.assertEqual(job_queue.get_next_jobs(), [jobs[1]])
+        self.assertEqual(job_queue.get_next_jobs(), [jobs[3]])
+        self.assertEqual(job_queue.get_num_running_jobs(), 4)
+
+    def test_batched_jobs_equal_single_stream(self):
+        batch_sizes = []
+        batches_done_event = threading.Event()
+        num_time_steps_list = [9, 3, 6]
+
+        def on_batch_done(jobs, batch_report):
+            batch_sizes.append(batch_report['batch_size'])
+
+            if sum(batch_sizes) == len(num_time_steps_list):
+                batches_done_event.set()
+
+        # The long batch window lets the worker collect every job submitted below into its first batch
+        job_queue = JobQueue(num_workers=1, chunk_size_in_time_steps=4, batch_window_in_seconds=5.0,
+                             max_batch_size=len(num_time_steps_list), on_batch_done=on_batch_done)
+        jobs = [self.get_job(index, num_time_steps=num_time_steps) for index, num_time_steps in
+                enumerate(num_time_steps_list)]
+
+        for job in jobs:
+            job_queue.submit_job(job)
+
+        self.assertTrue(batches_done_event.wait(JOB_TIMEOUT_IN_SECONDS))
+        self.assertEqual(batch_sizes, [len(num_time_steps_list)])
+
+        for index, job in enumerate(jobs):
+            self.assertEqual(job.status, 'finished')
+            np.testing.assert_array_equal(job.result.array,
+                                          self.get_single_stream_performance(index, num_time_steps_list[index]).array)
+
+    def test_warmed_state_jobs_equal_single_stream(self):
+        warmed_states = []
+
+        job_queue = JobQueue(num_workers=0)
+        cold_job = self.get_job(0, num_time_steps=5)
+        cold_job.set_warmed_state = warmed_states.append
+        job_queue.submit_job(cold_job)
+
+        run_generation_jobs(job_queue.get_next_jobs())
+
+        # A job resumed from the warmed state, batched with a cold job, skips the warm-up and generates the same notes
+        warm_job = self.get_job(0, num_time_steps=5)
+        warm_job.warmed_state = warmed_states[0]
+        jobs = [self.get_job(1, num_time_steps=7), warm_job]
+
+        for job in jobs:
+            job_queue.submit_job(job)
+
+        run_generation_jobs(job_queue.get_next_jobs())
+
+        np.testing.assert_array_equal(warm_job.result.array, cold_job.result.array)
+        np.testing.assert_array_equal(jobs[0].result.array, self.get_single_stream_performance(1, 7).array)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import io
+import unittest
+
+import numpy as np
+import pretty_midi
+
+from pianonet.core.midi_event_encoder import MidiEventEncoder, get_midi_file_bytes, \
+    get_variable_length_quantity_bytes
+
+
+class MidiEventEncoderTest(unittest.TestCase):
+    """
+    Checks the events and midi bytes of the incremental encoder, and that encoding in chunks changes nothing.
+    """
+
+    def setUp(self):
+        random_generator = np.random.default_rng(0)
+        self.key_states = random_generator.random((200, 12)) < 0.1
+
+    def get_events_and_track_data(self, chunk_size_in_time_steps):
+        midi_event_encoder = MidiEventEncoder(min_key_index=60, num_keys=12)
+
+        events = []
+        track_data = midi_event_encoder.get_track_header_data()
+
+        for start in range(0, len(self.key_states), chunk_size_in_time_steps):
+            chunk_events = midi_event_encoder.encode(self.key_states[start:start + chunk_size_in_time_steps])
+            events += chunk_events
+            track_data += midi_event_encoder.encode_track_data(chunk_events)
+
+        final_events = midi_event_encoder.finish()
+
+        return events + final_events, track_data + midi_event_encoder.encode_track_data(final_events)
+
+    def test_variable_length_quantities(self):
+        self.assertEqual(get_variable_length_quantity_bytes(0), b'\x00')
+        self.assertEqual(get_variable_length_quantity_bytes(0x40), b'\x40')
+        self.assertEqual(get_variable_length_quantity_bytes(0x80), b'\x81\x00')
+        self.assertEqual(get_variable_length_quantity_bytes(0x3FFF), b'\xff\x7f')
+        self.assertEqual(get_variable_length_quantity_bytes(0x200000), b'\x81\x80\x80\x00')
+
+    def test_track_data_bytes(self):
+        midi_event_encoder = MidiEventEncoder(min_key_index=60, num_keys=2)
+
+        events = midi_event_encoder.encode([[1, 0], [1, 1], [0, 1]]) + midi_event_encoder.finish()
+
+        self.assertEqual(events, [
+            {'time_step': 0, 'type': 'note_on', 'pitch': 60, 'velocity': 100},
+            {'time_step': 1, 'type': 'note_on', 'pitch': 61, 'velocity': 100},
+            {'time_step': 2, 'type': 'note_off', 'pitch': 60, 'velocity': 0},
+            {'time_step': 3, 'type': 'note_off', 'pitch': 61, 'velocity': 0},
+        ])
+        self.assertEqual(midi_event_encoder.encode_track_data(events),
+                         bytes([0, 0x90, 60, 100, 1, 0x90, 61, 100, 1, 0x80, 60, 0, 1, 0x80, 61, 0]))
+
+    def test_chunks_equal_single_chunk(self):
+        events, track_data = self.get_events_and_track_data(len(self.key_states))
+
+        for chunk_size_in_time_steps in (1, 7, 48):
+            with self.subTest(chunk_size_in_time_steps=chunk_size_in_time_steps):
+                self.assertEqual(self.get_events_and_track_data(chunk_size_in_time_steps), (events, track_data))
+
+    def test_midi_file_holds_the_notes(self):
+        events, track_data = self.get_events_and_track_data(10)
+
+        midi_file = pretty_midi.PrettyMIDI(io.BytesIO(get_midi_file_bytes(track_data)))
+        notes = midi_file.instruments[0].notes
+
+        self.assertEqual(len(notes), len([event for event in events if event['type'] == 'note_on']))
+
+        # One time step is 1/48th of a second
+        for note in notes:
+            start_time_step = int(round(note.start * 48))
+            end_time_step = int(round(note.end * 48))
+            key = note.pitch - 60
+
+            self.assertTrue(np.all(self.key_states[start_time_step:end_time_step, key]))
+
+            if start_time_step > 0:
+                self.assertFalse(self.key_states[start_time_step - 1, key])
+
+            if end_time_step < len(self.key_states):
+                self.assertFalse(self.key_states[end_time_step, key])
+
+
+if __name__ == '__main__':
+    unittest.main()
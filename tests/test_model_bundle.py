@@ -0,0 +1,109 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from model_bundle_fixtures import NUM_KEYS, get_test_model_bundle, get_test_seed_note_arrays
+from pianonet.generation.generation_engine import GenerationEngine
+from pianonet.generation.model_bundle import ModelBundle, get_quantized_model_bundle
+from pianonet.generation.prepared_model import PreparedModel
+from pianonet.generation.probability_drift import DEFAULT_MAX_PROBABILITY_DRIFT, check_probability_drift
+from pianonet.model_inspection.engine_verification import get_verification_seed_flat_arrays
+
+NUM_DRIFT_CHECK_TIME_STEPS = 8
+
+
+class QuantizedModelBundleTest(unittest.TestCase):
+    """
+    Checks that reduced precision bundles keep their precision through saving, loading and generation, and stay within
+    the allowed probability drift of the float32 model.
+    """
+
+    def setUp(self):
+        self.model_bundle = get_test_model_bundle()
+        self.directory_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory_path, ignore_errors=True)
+
+    def test_save_and_load_keep_precision(self):
+        for weight_precision in ('float32', 'float16', 'int8'):
+            with self.subTest(weight_precision=weight_precision):
+                quantized_model_bundle = get_quantized_model_bundle(model_bundle=self.model_bundle,
+                                                                    weight_precision=weight_precision)
+                quantized_model_bundle.save(self.directory_path)
+                loaded_model_bundle = ModelBundle.load(self.directory_path)
+
+                self.assertEqual(loaded_model_bundle.weight_precision, weight_precision)
+
+                for layer_index in range(0, len(quantized_model_bundle.layer_weights)):
+                    for weight, loaded_weight in zip(quantized_model_bundle.layer_weights[layer_index],
+                                                     loaded_model_bundle.layer_weights[layer_index]):
+                        self.assertEqual(loaded_weight.dtype, weight.dtype)
+                        np.testing.assert_array_equal(loaded_weight, weight)
+
+                    if weight_precision == 'int8':
+                        np.testing.assert_array_equal(loaded_model_bundle.get_kernel_scale(layer_index),
+                                                      quantized_model_bundle.get_kernel_scale(layer_index))
+
+    def test_engine_reads_reduced_precision_kernels(self):
+        for weight_precision, bytes_per_kernel_value in (('float16', 2), ('int8', 1)):
+            with self.subTest(weight_precision=weight_precision):
+                prepared_model = PreparedModel(model_bundle=get_quantized_model_bundle(
+                    model_bundle=self.model_bundle, weight_precision=weight_precision))
+
+                for layer in prepared_model.fast_path_layers:
+                    self.assertEqual(layer['w_right'].dtype.itemsize, bytes_per_kernel_value)
+
+                self.assertLess(prepared_model.get_memory_size_in_bytes(),
+                                PreparedModel(model_bundle=self.model_bundle).get_memory_size_in_bytes())
+
+    def test_loaded_bundle_generates_like_quantized_bundle(self):
+        quantized_model_bundle = get_quantized_model_bundle(model_bundle=self.model_bundle, weight_precision='int8')
+        quantized_model_bundle.save(self.directory_path)
+
+        seed_flat_arrays = [seed_note_array.array for seed_note_array in get_test_seed_note_arrays([40, 60])]
+        key_states = []
+
+        for model_bundle in (quantized_model_bundle, ModelBundle.load(self.directory_path)):
+            generation_engine = GenerationEngine(prepared_model=PreparedModel(model_bundle=model_bundle),
+                                                 seed_flat_arrays=seed_flat_arrays,
+                                                 random_seeds=[1, 2])
+            key_states.append(np.concatenate([generation_engine.generate_time_step() for i in range(0, 4)], axis=1))
+
+        np.testing.assert_array_equal(key_states[0], key_states[1])
+
+    def test_probability_drift_is_bounded(self):
+        reference_prepared_model = PreparedModel(model_bundle=self.model_bundle)
+        seed_flat_array = get_verification_seed_flat_arrays(num_keys=NUM_KEYS, num_performances=1,
+                                                            num_seed_time_steps=40)[0]
+
+        for weight_precision in ('float16', 'int8'):
+            with self.subTest(weight_precision=weight_precision):
+                get_quantized_model_bundle(model_bundle=self.model_bundle,
+                                           weight_precision=weight_precision).save(self.directory_path)
+
+                probability_drift = check_probability_drift(
+                    reference_prepared_model=reference_prepared_model,
+                    prepared_model=PreparedModel(model_bundle=ModelBundle.load(self.directory_path)),
+                    seed_flat_array=seed_flat_array,
+                    num_time_steps=NUM_DRIFT_CHECK_TIME_STEPS)
+
+                self.assertGreater(probability_drift['max_probability_drift'], 0.0)
+                self.assertLessEqual(probability_drift['max_probability_drift'], DEFAULT_MAX_PROBABILITY_DRIFT)
+
+    def test_drift_beyond_the_bound_fails(self):
+        reference_prepared_model = PreparedModel(model_bundle=self.model_bundle)
+        seed_flat_array = get_verification_seed_flat_arrays(num_keys=NUM_KEYS, num_performances=1,
+                                                            num_seed_time_steps=40)[0]
+
+        with self.assertRaises(Exception):
+            check_probability_drift(reference_prepared_model=reference_prepared_model,
+                                    prepared_model=PreparedModel(model_bundle=get_test_model_bundle(random_seed=1)),
+                                    seed_flat_array=seed_flat_array,
+                                    num_time_steps=NUM_DRIFT_CHECK_TIME_STEPS)
+
+
+if __name__ == '__main__':
+    unittest.main()
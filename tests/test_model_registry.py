@@ -0,0 +1,114 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from model_bundle_fixtures import get_test_model_bundle
+from pianonet.core.misc_tools import save_dictionary_to_json_file
+from pianonet.serving.model_registry import ModelRegistry
+
+
+class ModelRegistryTest(unittest.TestCase):
+    """
+    Checks that the registry serves each tier's model, falls back to the default tier for missing models and hot
+    reloads changed models and configs.
+    """
+
+    def setUp(self):
+        self.base_path = tempfile.mkdtemp()
+        self.config_file_path = os.path.join(self.base_path, 'model_registry.json')
+        self.num_saves = 0
+
+        self.save_model_bundle('small', random_seed=0)
+        self.save_model_bundle('large', random_seed=1)
+        self.save_config({'low': {'model_name': 'small'},
+                          'high': {'model_name': 'large'},
+                          'highest': {'model_name': 'missing'}})
+
+        self.model_registry = ModelRegistry(config_file_path=self.config_file_path, base_path=self.base_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.base_path, ignore_errors=True)
+
+    def set_new_modification_times(self, path):
+        # Modification times may be too coarse to tell saves in quick succession apart, so each save moves them ahead
+        self.num_saves += 1
+        modification_time = time.time() + self.num_saves
+
+        if os.path.isfile(path):
+            file_paths = [path]
+        else:
+            file_paths = [os.path.join(path, file_name) for file_name in os.listdir(path)]
+
+        for file_path in file_paths:
+            os.utime(file_path, (modification_time, modification_time))
+
+    def save_model_bundle(self, model_name, random_seed):
+        model_bundle_path = os.path.join(self.base_path, 'model_bundles', model_name)
+
+        get_test_model_bundle(random_seed=random_seed).save(model_bundle_path)
+        self.set_new_modification_times(model_bundle_path)
+
+    def save_config(self, tier_configs, default_tier='low'):
+        save_dictionary_to_json_file({'default_tier': default_tier, 'tiers': tier_configs}, self.config_file_path)
+        self.set_new_modification_times(self.config_file_path)
+
+    def get_identifier(self, tier):
+        return self.model_registry.get_entry(tier)['prepared_model'].get_identifier_hash_string()
+
+    def test_serves_tiers(self):
+        self.assertEqual(sorted(self.model_registry.get_tiers()), ['high', 'highest', 'low'])
+        self.assertEqual(self.model_registry.get_entry()['tier'], 'low')
+        self.assertEqual(self.model_registry.get_entry('high')['model_name'], 'large')
+        self.assertNotEqual(self.get_identifier('low'), self.get_identifier('high'))
+
+        with self.assertRaises(Exception):
+            self.model_registry.get_entry('medium')
+
+    def test_missing_model_is_served_by_default_tier(self):
+        self.assertEqual(self.model_registry.get_entry('highest')['tier'], 'low')
+
+        self.save_model_bundle('missing', random_seed=2)
+
+        self.assertEqual(self.model_registry.reload_changed_models(), ['highest'])
+        self.assertEqual(self.model_registry.get_entry('highest')['tier'], 'highest')
+
+    def test_reloads_changed_model(self):
+        low_identifier = self.get_identifier('low')
+        high_entry = self.model_registry.get_entry('high')
+
+        self.assertEqual(self.model_registry.reload_changed_models(), [])
+
+        shutil.rmtree(os.path.join(self.base_path, 'model_bundles', 'small'))
+        self.save_model_bundle('small', random_seed=3)
+
+        self.assertEqual(self.model_registry.reload_changed_models(), ['low'])
+        self.assertNotEqual(self.get_identifier('low'), low_identifier)
+        self.assertIs(self.model_registry.get_entry('high'), high_entry)
+
+    def test_reloads_changed_config(self):
+        high_identifier = self.get_identifier('high')
+
+        self.save_config({'low': {'model_name': 'large'}, 'medium': {'model_name': 'small'}}, default_tier='medium')
+
+        self.assertEqual(sorted(self.model_registry.reload_changed_models()), ['low', 'medium'])
+        self.assertEqual(sorted(self.model_registry.get_tiers()), ['low', 'medium'])
+        self.assertEqual(self.model_registry.get_entry()['tier'], 'medium')
+        self.assertEqual(self.get_identifier('low'), high_identifier)
+
+        with self.assertRaises(Exception):
+            self.model_registry.get_entry('high')
+
+    def test_failed_config_reload_keeps_models(self):
+        self.save_config({'low': {'model_name': 'missing'}})
+
+        with self.assertRaises(Exception):
+            self.model_registry.reload_changed_models()
+
+        self.assertEqual(self.model_registry.get_entry('high')['model_name'], 'large')
+        self.assertEqual(self.model_registry.get_entry()['model_name'], 'small')
+
+
+if __name__ == '__main__':
+    unittest.main()